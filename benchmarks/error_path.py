@@ -0,0 +1,179 @@
+"""
+Load tests the API error paths: what a flood of bad, unauthorized or failing requests costs the server.
+
+Every error is sent by several threads at once, first through the error handling that built a fresh pydantic model
+(and lookup table) for every response, reproduced here as it used to be, then through the current one, which sends
+pre-encoded bodies. The CPU time of whole requests is reported along with that of converting the view's exception to a
+response on its own, as most of a request through the test client is spent outside of it. Log output is dropped, but
+still formatted, so that the 500s pay for their tracebacks as they would in production.
+
+Run with:
+
+    python -m benchmarks.error_path
+"""
+import os
+import threading
+import time
+import timeit
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("ENVIRONMENT", "production")
+
+import flask  # noqa: E402
+import structlog  # noqa: E402
+import werkzeug  # noqa: E402
+
+from src.app import app  # noqa: E402
+from src.beckett.blueprint import BeckettBlueprint  # noqa: E402
+from src.beckett.types import (  # noqa: E402
+    APIResponse,
+    BadRequest,
+    Forbidden,
+    InternalServerError,
+    NotFound,
+    types_manager,
+)
+
+THREADS = 8
+REQUESTS = 4000
+REPEATS = 5
+
+log = structlog.get_logger(__name__)
+
+
+class OkResponse(APIResponse):
+    id: int
+
+
+beckett = BeckettBlueprint("error_path", __name__, url_prefix="/bench")
+
+
+@beckett.api_get("/forbidden")
+def forbidden(id: int) -> typing.Union[OkResponse, Forbidden]:
+    raise werkzeug.exceptions.Forbidden()
+
+
+@beckett.api_get("/not-found")
+def not_found(id: int) -> typing.Union[OkResponse, NotFound]:
+    raise werkzeug.exceptions.NotFound()
+
+
+@beckett.api_get("/bad-request")
+def bad_request(id: int) -> typing.Union[OkResponse, BadRequest]:
+    flask.abort(400, "That id isn't allowed")
+
+
+@beckett.api_get("/server-error")
+def server_error(id: int) -> typing.Union[OkResponse, InternalServerError]:
+    raise RuntimeError("The database went away")
+
+
+app.register_blueprint(beckett)
+
+CASES = [
+    ("403", "/bench/forbidden?id=1", werkzeug.exceptions.Forbidden()),
+    ("404", "/bench/not-found?id=1", werkzeug.exceptions.NotFound()),
+    ("400", "/bench/bad-request?id=1", werkzeug.exceptions.BadRequest("Not allowed")),
+    ("500", "/bench/server-error?id=1", RuntimeError("The database went away")),
+]
+
+
+def _legacy_api_response_as_flask_response(response: APIResponse) -> flask.Response:
+    flask_response = flask.Response(
+        response.model_dump_json().encode(), mimetype="application/json"
+    )
+    flask_response.status_code = response.status_code
+    return flask_response
+
+
+def _legacy_view_exception_as_flask_response(e: Exception) -> flask.Response:
+    if isinstance(
+        e,
+        (
+            werkzeug.exceptions.Forbidden,
+            werkzeug.exceptions.NotFound,
+            werkzeug.exceptions.BadRequest,
+        ),
+    ):
+        http_exception_to_response_lookup = {
+            400: BadRequest,
+            403: Forbidden,
+            404: NotFound,
+        }
+        # `BadRequest()` fails: its message is required.
+        return _legacy_api_response_as_flask_response(
+            http_exception_to_response_lookup[typing.cast(int, e.code)]()
+        )
+    log.exception(e, exc_info=e)
+    return _legacy_api_response_as_flask_response(InternalServerError())
+
+
+def _load(url: str) -> typing.Tuple[float, int]:
+    """Best of REPEATS runs of the CPU time per request, sent by THREADS threads, plus the status code."""
+    local = threading.local()
+    statuses = set()
+
+    def send(_):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        statuses.add(client.get(url).status_code)
+
+    timings = []
+    with ThreadPoolExecutor(THREADS) as executor:
+        list(executor.map(send, range(THREADS * 10)))  # warm up
+        for _ in range(REPEATS):
+            start = time.process_time()
+            list(executor.map(send, range(REQUESTS)))
+            timings.append((time.process_time() - start) / REQUESTS)
+
+    return min(timings), max(statuses)
+
+
+def _convert(
+    convert: typing.Callable[[Exception], flask.Response], e: Exception
+) -> typing.Optional[float]:
+    """Best of REPEATS runs of the time `convert(e)` takes, or None if it fails."""
+    with app.test_request_context():
+        try:
+            convert(e)
+        except Exception:
+            return None
+        return (
+            min(timeit.repeat(lambda: convert(e), number=1000, repeat=REPEATS)) / 1000
+        )
+
+
+def _us(seconds: typing.Optional[float]) -> str:
+    return "fails" if seconds is None else f"{seconds * 1e6:.1f}"
+
+
+def main():
+    structlog.configure(logger_factory=structlog.ReturnLoggerFactory())
+    # Flask logs the legacy 400s, which fail with a 500.
+    app.logger.disabled = True
+    current = types_manager.view_exception_as_flask_response
+
+    print(
+        f"{'error':<6} {'legacy us':>10} {'status':>7} {'us':>7} {'status':>7} "
+        f"{'legacy convert us':>18} {'convert us':>11}"
+    )
+    for name, url, e in CASES:
+        types_manager.view_exception_as_flask_response = (
+            _legacy_view_exception_as_flask_response
+        )
+        try:
+            legacy, legacy_status = _load(url)
+        finally:
+            types_manager.view_exception_as_flask_response = current
+        new, new_status = _load(url)
+        print(
+            f"{name:<6} {_us(legacy):>10} {legacy_status:>7} {_us(new):>7} {new_status:>7} "
+            f"{_us(_convert(_legacy_view_exception_as_flask_response, e)):>18} "
+            f"{_us(_convert(current, e)):>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
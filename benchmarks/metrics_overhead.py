@@ -0,0 +1,122 @@
+"""
+Measures what recording request metrics costs: by running the same requests with metrics disabled and enabled, and
+by timing the recording of one request on its own (the difference between whole requests is within their noise).
+
+Run with:
+
+    python -m benchmarks.metrics_overhead
+"""
+import json
+import os
+import tempfile
+import time
+import timeit
+import typing
+
+import flask
+
+os.environ.setdefault("ENVIRONMENT", "production")
+
+from src.app import app  # noqa: E402
+from src.beckett.blueprint import BeckettBlueprint  # noqa: E402
+from src.beckett.metrics import metrics  # noqa: E402
+from src.beckett.renderer.typescript_react.manifest import asset_manifest  # noqa: E402
+from src.beckett.types import APIResponse, BadRequest, PageProps  # noqa: E402
+
+ITERATIONS = 2000
+REPEATS = 5
+
+# @beckett.page() derives the entrypoint from the module name, which is `__main__` when run with `python -m`.
+ENTRYPOINT = f"src/js/template/{__name__.rsplit('.', 1)[-1]}/small_page.tsx"
+
+
+class OkResponse(APIResponse):
+    total: int
+
+
+class SmallPageProps(PageProps):
+    name: str
+
+
+beckett = BeckettBlueprint("metrics_overhead", __name__, url_prefix="/bench")
+
+
+@beckett.api_get("/get")
+def small_get(id: int) -> typing.Union[OkResponse, BadRequest]:
+    return OkResponse(total=id)
+
+
+@beckett.api_post("/post")
+def small_post(id: int) -> typing.Union[OkResponse, BadRequest]:
+    return OkResponse(total=id)
+
+
+@beckett.route("/page")
+@beckett.page()
+def small_page() -> SmallPageProps:
+    return SmallPageProps(name="bench")
+
+
+app.register_blueprint(beckett)
+
+
+def _measure(client, method: str, url: str, kwargs) -> float:
+    """Best of REPEATS runs of the CPU time per request."""
+    client.open(url, method=method, **kwargs)
+
+    timings = []
+    for _ in range(REPEATS):
+        start = time.process_time()
+        for _ in range(ITERATIONS):
+            client.open(url, method=method, **kwargs)
+        timings.append((time.process_time() - start) / ITERATIONS)
+
+    return min(timings)
+
+
+def main():
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as fh:
+        json.dump(
+            {
+                "src/js/beckett_page.tsx": "js/beckett_page-BENCH.js",
+                ENTRYPOINT: "js/small_page-BENCH.js",
+            },
+            fh,
+        )
+    asset_manifest.path = fh.name
+
+    client = app.test_client()
+    cases = [
+        ("GET", "GET", "/bench/get?id=1", {}),
+        ("POST", "POST", "/bench/post", {"json": {"id": 1}}),
+        ("page", "GET", "/bench/page", {}),
+    ]
+    print(f"{'case':>6} {'off us':>8} {'on us':>8} {'overhead us':>12} {'overhead':>9}")
+    try:
+        for label, method, url, kwargs in cases:
+            metrics.enabled = False
+            off = _measure(client, method, url, kwargs)
+            metrics.enabled = True
+            on = _measure(client, method, url, kwargs)
+            print(
+                f"{label:>6} {off * 1e6:>8.1f} {on * 1e6:>8.1f} {(on - off) * 1e6:>12.2f} "
+                f"{(on / off - 1) * 100:>8.1f}%"
+            )
+    finally:
+        os.unlink(fh.name)
+
+    route = metrics.route("metrics_overhead.small_get")
+    response = flask.Response(b'{"total":1}', mimetype="application/json")
+
+    def record():
+        timer = route.timer()
+        timer.mark("validation")
+        timer.mark("view")
+        timer.finish(response, "serialization")
+
+    per_request = min(timeit.repeat(record, number=ITERATIONS * 10, repeat=REPEATS))
+    print(f"recording one request: {per_request / (ITERATIONS * 10) * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
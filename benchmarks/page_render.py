@@ -0,0 +1,168 @@
+"""
+Compares the @beckett.page() render pipeline with the one it replaced.
+
+The legacy path is reproduced here as it used to be: the props were serialized with `model_dump_json()`, re-encoded
+by the `json` template filter (so the browser had to parse a JSON string containing JSON) and the url map and base
+template context were rebuilt for every request.
+
+The current pipeline is measured twice: rendering `beckett_page.jinja2` for every request, and joining the props
+with the page shell's pre-rendered segments (`BECKETT_PAGE_SHELL_ENABLED=1`).
+
+Run with:
+
+    python -m benchmarks.page_render
+"""
+import functools
+import json
+import os
+import tempfile
+import time
+import typing
+
+os.environ.setdefault("ENVIRONMENT", "production")
+
+import flask  # noqa: E402
+from pydantic import BaseModel  # noqa: E402
+
+from src.app import app  # noqa: E402
+from src.beckett.blueprint import BeckettBlueprint  # noqa: E402
+from src.beckett.renderer.typescript_react.manifest import asset_manifest  # noqa: E402
+from src.beckett.renderer.typescript_react.renderer import (  # noqa: E402
+    build_render_context_for_base_template,
+)
+from src.beckett.renderer.typescript_react.shell import page_shells  # noqa: E402
+from src.beckett.types import PageProps, api_route_type_manager  # noqa: E402
+
+LEGACY_TEMPLATE = """
+{% extends 'base.jinja2' %}
+
+{% block content %}
+    <div id="render-react-root"></div>
+{% endblock %}
+
+{% block script %}
+    <script nonce="{{ script_nonce }}" type="module">
+        import {renderReactPage} from '{{ es_module('src/js/beckett_page.tsx') }}'
+        import Page from '{{ es_module(react_entrypoint_filename) }}'
+
+        renderReactPage(Page, {{ props | json | safe }}, {{ base_data | json | safe }})
+    </script>
+{% endblock %}
+"""
+
+ROWS = [0, 100, 1000]
+ITERATIONS = 100
+REPEATS = 5
+
+# @beckett.page() derives the entrypoint from the module name, which is `__main__` when run with `python -m`.
+ENTRYPOINT = f"src/js/template/{__name__.rsplit('.', 1)[-1]}/large_page.tsx"
+
+
+class Row(BaseModel):
+    id: int
+    name: str
+    description: str
+
+
+class LargePageProps(PageProps):
+    rows: typing.List[Row]
+
+
+beckett = BeckettBlueprint("page_render", __name__, url_prefix="/bench")
+
+
+def _props() -> LargePageProps:
+    return _build_props(int(flask.request.args.get("rows", 0)))
+
+
+@functools.cache
+def _build_props(rows: int) -> LargePageProps:
+    # Built once per size so that only the render pipeline is measured, not the view function.
+    return LargePageProps(
+        rows=[
+            Row(id=i, name=f"row {i}", description='A "quoted" description')
+            for i in range(rows)
+        ]
+    )
+
+
+@beckett.route("/page")
+@beckett.page()
+def large_page() -> LargePageProps:
+    return _props()
+
+
+@functools.cache
+def _legacy_template():
+    return app.jinja_env.from_string(LEGACY_TEMPLATE)
+
+
+@beckett.route("/legacy")
+def legacy_page():
+    response = _props()
+    react_context = {
+        "react_entrypoint_filename": ENTRYPOINT,
+        "base_data": {
+            "urlMap": api_route_type_manager.get_url_map(),
+        },
+    }
+    html = flask.render_template(
+        _legacy_template(),
+        __render_react_response=response,
+        props=response.model_dump_json(),
+        **build_render_context_for_base_template(),
+        **react_context,
+    )
+    return html, 200, {"Content-Type": "text/html; charset=utf-8"}
+
+
+app.register_blueprint(beckett)
+
+
+def _measure(client, url: str) -> typing.Tuple[float, int]:
+    """Best of REPEATS runs of the CPU time per request, plus the size of the response body."""
+    client.get(url)  # warm up template and manifest caches
+
+    timings = []
+    for _ in range(REPEATS):
+        start = time.process_time()
+        for _ in range(ITERATIONS):
+            response = client.get(url)
+        timings.append((time.process_time() - start) / ITERATIONS)
+
+    return min(timings), len(response.data)
+
+
+def main():
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as fh:
+        json.dump(
+            {
+                "src/js/beckett_page.tsx": "js/beckett_page-BENCH.js",
+                ENTRYPOINT: "js/large_page-BENCH.js",
+            },
+            fh,
+        )
+    asset_manifest.path = fh.name
+
+    client = app.test_client()
+    print(
+        f"{'rows':>6} {'legacy us':>10} {'jinja us':>9} {'shell us':>9} {'cpu saved':>10} "
+        f"{'legacy B':>10} {'beckett B':>10}"
+    )
+    try:
+        for rows in ROWS:
+            legacy_cpu, legacy_bytes = _measure(client, f"/bench/legacy?rows={rows}")
+            page_shells.enabled = False
+            jinja_cpu, new_bytes = _measure(client, f"/bench/page?rows={rows}")
+            page_shells.enabled = True
+            shell_cpu, _ = _measure(client, f"/bench/page?rows={rows}")
+            print(
+                f"{rows:>6} {legacy_cpu * 1e6:>10.1f} {jinja_cpu * 1e6:>9.1f} {shell_cpu * 1e6:>9.1f} "
+                f"{(1 - shell_cpu / legacy_cpu) * 100:>9.1f}% {legacy_bytes:>10} {new_bytes:>10}"
+            )
+    finally:
+        os.unlink(fh.name)
+
+
+if __name__ == "__main__":
+    main()
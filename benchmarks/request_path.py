@@ -0,0 +1,404 @@
+"""
+Drives synthetic Beckett apps through the Flask test client, and reports the throughput, latency and allocations of
+each kind of request.
+
+The app is generated from the command line options: BLUEPRINTS blueprints, each with ROUTES `api_get` routes, ROUTES
+`api_post` routes and ROUTES pages. The request and response models are trees DEPTH levels deep, every level with
+WIDTH scalar fields and two children.
+
+The scenarios are:
+
+* page: rendering a @beckett.page() whose props hold a model tree.
+* get: an `api_get` with WIDTH query parameters, responding with a model tree.
+* post: an `api_post` with a model tree as its JSON body, responding with a model tree.
+* bad_request: an `api_get` whose query parameters fail validation (`BadRequest`).
+* validation_error: an `api_post` whose view raises a pydantic ValidationError (`PydanticValidationResponse`).
+
+Requests cycle through every route of a scenario. Latencies are wall clock per request, allocations are the peak
+memory traced by tracemalloc while handling a request, in a separate run so tracing doesn't slow the timed one.
+
+Results are written as JSON, and compared with a previous run with `--compare`:
+
+    python -m benchmarks.request_path --output before.json
+    python -m benchmarks.request_path --compare before.json
+
+Logging is silenced while measuring, unless `--log` is given: its cost depends on how it's configured in production.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+import typing
+from dataclasses import asdict, dataclass
+
+os.environ.setdefault("ENVIRONMENT", "production")
+
+import structlog  # noqa: E402
+from pydantic import BaseModel, create_model  # noqa: E402
+
+from src.app import app  # noqa: E402
+from src.beckett.blueprint import BeckettBlueprint  # noqa: E402
+from src.beckett.renderer.typescript_react.manifest import asset_manifest  # noqa: E402
+from src.beckett.types import APIResponse, BadRequest, PageProps  # noqa: E402
+
+RESULTS_VERSION = 1
+
+# @beckett.page() derives the entrypoint from the module name, which is `__main__` when run with `python -m`.
+MODULE = __name__.rsplit(".", 1)[-1]
+
+
+@dataclass
+class Request:
+    method: str
+    url: str
+    kwargs: typing.Dict[str, typing.Any]
+
+
+@dataclass
+class ScenarioResult:
+    requests: int
+    requests_per_second: float
+    p50_ms: float
+    p99_ms: float
+    alloc_kib: float
+    """The median peak memory allocated while handling a request."""
+
+    response_bytes: int
+
+
+def build_model(name: str, depth: int, width: int) -> typing.Type[BaseModel]:
+    fields: typing.Dict[str, typing.Any] = {
+        f"field_{i}": (int if i % 2 == 0 else str, ...) for i in range(width)
+    }
+    if depth > 1:
+        child = build_model(f"{name}Child", depth - 1, width)
+        fields["children"] = (typing.List[child], ...)  # type: ignore
+    return create_model(name, **fields)
+
+
+def build_data(depth: int, width: int) -> typing.Dict[str, typing.Any]:
+    data: typing.Dict[str, typing.Any] = {
+        f"field_{i}": i if i % 2 == 0 else f"value {i}" for i in range(width)
+    }
+    if depth > 1:
+        data["children"] = [build_data(depth - 1, width) for _ in range(2)]
+    return data
+
+
+def _view(
+    func: types.FunctionType, name: str, annotations: typing.Dict[str, typing.Any]
+) -> types.FunctionType:
+    """A copy of `func` with another name and annotations, which is all the decorators look at."""
+    view = types.FunctionType(
+        func.__code__, func.__globals__, name, func.__defaults__, func.__closure__
+    )
+    view.__qualname__ = name
+    view.__annotations__ = annotations
+    return view
+
+
+def add_blueprint(
+    b: int,
+    routes: int,
+    depth: int,
+    width: int,
+    scenarios: typing.Dict[str, typing.List[Request]],
+) -> None:
+    """Registers synthetic blueprint `b` with the app, adding the requests for its routes to `scenarios`."""
+    model = build_model(f"Synthetic{b}", depth, width)
+    data = model.model_validate(build_data(depth, width))
+    response_class = create_model(
+        f"Synthetic{b}Response", __base__=APIResponse, data=(model, ...)
+    )
+    props_class = create_model(
+        f"Synthetic{b}Props", __base__=PageProps, data=(model, ...)
+    )
+    response = response_class(data=data)
+    props = props_class(data=data)
+    returns = typing.Union[response_class, BadRequest]  # type: ignore
+
+    query = "&".join(
+        f"field_{i}={i}" if i % 2 == 0 else f"field_{i}=value" for i in range(width)
+    )
+    bad_query = "&".join(f"field_{i}=not-a-number" for i in range(width))
+    body = {"payload": build_data(depth, width)}
+
+    def get(**_):
+        return response
+
+    def post(payload):
+        return response
+
+    def invalid(payload):
+        # Building a model from data that doesn't fit it, a bug in the view.
+        return response_class.model_validate({})
+
+    def page():
+        return props
+
+    beckett = BeckettBlueprint(f"synthetic_{b}", __name__, url_prefix=f"/synthetic/{b}")
+    for r in range(routes):
+        beckett.api_get(f"/get/{r}", endpoint=f"get_{r}")(
+            _view(
+                get,
+                f"get_{b}_{r}",
+                {
+                    **{f"field_{i}": int if i % 2 == 0 else str for i in range(width)},
+                    "return": returns,
+                },
+            )
+        )
+        scenarios["get"].append(Request("GET", f"/synthetic/{b}/get/{r}?{query}", {}))
+        scenarios["bad_request"].append(
+            Request("GET", f"/synthetic/{b}/get/{r}?{bad_query}", {})
+        )
+
+        beckett.api_post(f"/post/{r}", endpoint=f"post_{r}")(
+            _view(post, f"post_{b}_{r}", {"payload": model, "return": returns})
+        )
+        scenarios["post"].append(
+            Request("POST", f"/synthetic/{b}/post/{r}", {"json": body})
+        )
+
+        beckett.api_post(f"/invalid/{r}", endpoint=f"invalid_{r}")(
+            _view(invalid, f"invalid_{b}_{r}", {"payload": model, "return": returns})
+        )
+        scenarios["validation_error"].append(
+            Request("POST", f"/synthetic/{b}/invalid/{r}", {"json": body})
+        )
+
+        beckett.route(f"/page/{r}", endpoint=f"page_{r}")(
+            beckett.page()(_view(page, f"page_{b}_{r}", {"return": props_class}))
+        )
+        scenarios["page"].append(Request("GET", f"/synthetic/{b}/page/{r}", {}))
+
+    app.register_blueprint(beckett)
+
+
+def build_app(
+    blueprints: int, routes: int, depth: int, width: int
+) -> typing.Dict[str, typing.List[Request]]:
+    """Registers the synthetic blueprints with the app, returning the requests of each scenario."""
+    scenarios: typing.Dict[str, typing.List[Request]] = {
+        "page": [],
+        "get": [],
+        "post": [],
+        "bad_request": [],
+        "validation_error": [],
+    }
+    for b in range(blueprints):
+        add_blueprint(b, routes, depth, width, scenarios)
+    return scenarios
+
+
+def write_manifest(scenarios: typing.Dict[str, typing.List[Request]]) -> str:
+    """A metafile.json with an entrypoint for every synthetic page, as if they had been built."""
+    entrypoints = {"src/js/beckett_page.tsx": "js/beckett_page-BENCH.js"}
+    for request in scenarios["page"]:
+        _, _, b, _, r = request.url.split("/")
+        entrypoints[
+            f"src/js/template/{MODULE}/page_{b}_{r}.tsx"
+        ] = f"js/page-{b}-{r}.js"
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as fh:
+        json.dump(entrypoints, fh)
+    return fh.name
+
+
+EXPECTED_STATUS = {
+    "page": 200,
+    "get": 200,
+    "post": 200,
+    "bad_request": 400,
+    "validation_error": 500,
+}
+
+
+def run_scenario(
+    client, name: str, requests: typing.List[Request], iterations: int
+) -> ScenarioResult:
+    for request in requests:
+        response = client.open(request.url, method=request.method, **request.kwargs)
+        assert response.status_code == EXPECTED_STATUS[name], (
+            name,
+            request.url,
+            response.data[:500],
+        )
+    response_bytes = len(response.data)
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        request = requests[i % len(requests)]
+        request_start = time.perf_counter()
+        client.open(request.url, method=request.method, **request.kwargs)
+        latencies.append(time.perf_counter() - request_start)
+    elapsed = time.perf_counter() - start
+
+    allocations = []
+    tracemalloc.start()
+    try:
+        for i in range(min(iterations, 200)):
+            request = requests[i % len(requests)]
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            client.open(request.url, method=request.method, **request.kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+            allocations.append(peak - before)
+    finally:
+        tracemalloc.stop()
+
+    percentiles = statistics.quantiles(latencies, n=100)
+    return ScenarioResult(
+        requests=iterations,
+        requests_per_second=iterations / elapsed,
+        p50_ms=percentiles[49] * 1e3,
+        p99_ms=percentiles[98] * 1e3,
+        alloc_kib=statistics.median(allocations) / 1024,
+        response_bytes=response_bytes,
+    )
+
+
+def _git_revision() -> typing.Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(
+    results: typing.Dict[str, typing.Any],
+    baseline: typing.Dict[str, typing.Any],
+    threshold: float,
+) -> bool:
+    """Prints how `results` differ from `baseline`, returning whether any scenario regressed by more than threshold."""
+    if baseline["config"] != results["config"]:
+        print(
+            "warning: the baseline was run with different options:",
+            baseline["config"],
+        )
+
+    regressed = False
+    print(
+        f"\ncompared with {baseline.get('revision') or 'baseline'} ({baseline['timestamp']})"
+    )
+    print(f"{'scenario':>18} {'req/s':>8} {'p50':>8} {'p99':>8} {'alloc':>8}")
+    for name, result in results["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        changes = [
+            result[key] / before[key] - 1 if before[key] else 0.0
+            for key in ["requests_per_second", "p50_ms", "p99_ms", "alloc_kib"]
+        ]
+        flag = ""
+        if changes[0] < -threshold or changes[1] > threshold:
+            flag = "  REGRESSED"
+            regressed = True
+        print(
+            f"{name:>18} "
+            + " ".join(f"{change * 100:>+7.1f}%" for change in changes)
+            + flag
+        )
+
+    return regressed
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--blueprints", type=int, default=4)
+    parser.add_argument(
+        "--routes", type=int, default=5, help="of each kind, per blueprint"
+    )
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--width", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=2000, help="per scenario")
+    parser.add_argument("--output", help="where to write the results as JSON")
+    parser.add_argument("--compare", help="the JSON results of a previous run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="the slowdown (throughput or p50) reported as a regression, 0.1 is 10%%",
+    )
+    parser.add_argument("--log", action="store_true", help="keep logging on")
+    args = parser.parse_args(argv)
+
+    if not args.log:
+        structlog.configure(
+            wrapper_class=structlog.make_filtering_bound_logger(logging.CRITICAL)
+        )
+
+    config = {
+        "blueprints": args.blueprints,
+        "routes": args.routes,
+        "depth": args.depth,
+        "width": args.width,
+        "iterations": args.iterations,
+        "log": args.log,
+    }
+    scenarios = build_app(args.blueprints, args.routes, args.depth, args.width)
+    manifest_path = write_manifest(scenarios)
+    asset_manifest.path = manifest_path
+
+    client = app.test_client()
+    results: typing.Dict[str, typing.Any] = {
+        "version": RESULTS_VERSION,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "revision": _git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": config,
+        "scenarios": {},
+    }
+
+    print(
+        f"{'scenario':>18} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'alloc KiB':>10} {'bytes':>8}"
+    )
+    try:
+        for name, requests in scenarios.items():
+            result = run_scenario(client, name, requests, args.iterations)
+            results["scenarios"][name] = asdict(result)
+            print(
+                f"{name:>18} {result.requests_per_second:>8.0f} {result.p50_ms:>8.3f} "
+                f"{result.p99_ms:>8.3f} {result.alloc_kib:>10.1f} {result.response_bytes:>8}"
+            )
+    finally:
+        os.unlink(manifest_path)
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(results, fh, indent=2)
+            fh.write("\n")
+        print(f"\nwrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        if baseline.get("version") != RESULTS_VERSION:
+            print(f"can't compare with {args.compare}, it's from another version")
+            return 2
+        if compare(results, baseline, args.threshold):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Load tests an api_get route hit by many clients with the same request at the same moment, as when a popular page loads.
+
+The view stands in for a backend query that takes QUERY_SECONDS. Every round sends CLIENTS identical requests from as
+many threads at once, to a route that runs the view for each of them and to one that coalesces them with
+`api_get(coalesce=True)`. The number of times the view ran and the time the round took are reported for each.
+
+Run with:
+
+    python -m benchmarks.thundering_herd
+"""
+import os
+import threading
+import time
+import typing
+
+os.environ.setdefault("ENVIRONMENT", "production")
+
+from src.app import app  # noqa: E402
+from src.beckett.blueprint import BeckettBlueprint  # noqa: E402
+from src.beckett.types import APIResponse  # noqa: E402
+
+CLIENTS = [10, 100, 300]
+QUERY_SECONDS = 0.05
+ROUNDS = 3
+
+
+class BooksResponse(APIResponse):
+    names: typing.List[str]
+
+
+beckett = BeckettBlueprint("thundering_herd", __name__, url_prefix="/bench")
+
+queries = 0
+queries_lock = threading.Lock()
+
+
+def query_books(author: str) -> BooksResponse:
+    global queries
+    with queries_lock:
+        queries += 1
+    time.sleep(QUERY_SECONDS)
+    return BooksResponse(names=[f"{author} {i}" for i in range(50)])
+
+
+@beckett.api_get("/books")
+def books(author: str) -> BooksResponse:
+    return query_books(author)
+
+
+@beckett.api_get("/books-coalesced", coalesce=True)
+def books_coalesced(author: str) -> BooksResponse:
+    return query_books(author)
+
+
+app.register_blueprint(beckett)
+
+
+def _round(url: str, clients: int) -> typing.Tuple[int, float]:
+    """The number of queries and the time it took to answer `clients` identical requests sent at once."""
+    global queries
+    queries = 0
+    start = threading.Barrier(clients + 1)
+
+    def send():
+        client = app.test_client()
+        start.wait()
+        assert client.get(url).status_code == 200
+
+    threads = [threading.Thread(target=send) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return queries, time.perf_counter() - began
+
+
+def main():
+    print(
+        f"{'clients':>8} {'queries':>8} {'ms':>8} {'coalesced queries':>18} {'coalesced ms':>13}"
+    )
+    for clients in CLIENTS:
+        plain = min(
+            (_round("/bench/books?author=Muir", clients) for _ in range(ROUNDS)),
+            key=lambda result: result[1],
+        )
+        coalesced = min(
+            (
+                _round("/bench/books-coalesced?author=Muir", clients)
+                for _ in range(ROUNDS)
+            ),
+            key=lambda result: result[1],
+        )
+        print(
+            f"{clients:>8} {plain[0]:>8} {plain[1] * 1000:>8.1f} "
+            f"{coalesced[0]:>18} {coalesced[1] * 1000:>13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Compares TypeScript interface generation with the TypeRegistry against the recursive generator it replaced.
+
+The legacy generator is reproduced here as it used to be: it generated the interfaces of every nested model again
+for every path that referenced it, and recursed forever on self-referential models.
+
+Two synthetic model graphs are generated:
+
+* deep: DEPTH levels of models, each with two fields referencing the next level, so the number of paths to the
+  bottom doubles at every level.
+* wide: WIDTH response models that all reference the same model, which itself references a chain of CHAIN models.
+
+Run with:
+
+    python -m benchmarks.type_generation
+"""
+import os
+import time
+import typing
+
+os.environ.setdefault("ENVIRONMENT", "production")
+
+from pydantic import BaseModel, create_model  # noqa: E402
+
+import src.app  # noqa: E402, F401 (the app has to be set up before src.beckett can be imported)
+from src.beckett.renderer.typescript_react.imports import (  # noqa: E402
+    TypescriptImports,
+)
+from src.beckett.renderer.typescript_react.interfaces import (  # noqa: E402
+    TypescriptInterfaces,
+)
+from src.beckett.types.types import (  # noqa: E402
+    TypeRegistry,
+    generate_type,
+    strip_list_type_wrapper,
+    strip_optional_type_wrapper,
+)
+
+DEPTH = 14
+WIDTH = 300
+CHAIN = 20
+FIELDS = 10
+REPEATS = 5
+
+
+def legacy_generate_interfaces(
+    cls: typing.Any, name: typing.Optional[str] = None
+) -> typing.Tuple[TypescriptImports, TypescriptInterfaces]:
+    if name is None:
+        name = cls.__name__
+
+    imports = TypescriptImports()
+    interfaces = TypescriptInterfaces()
+    declaration = "interface " + name + " {\n"
+
+    for field_name, field_info in cls.model_fields.items():
+        inner_type, was_optional = strip_optional_type_wrapper(field_info)
+        inner_type, was_list = strip_list_type_wrapper(inner_type)
+
+        if hasattr(inner_type, "__pydantic_complete__"):
+            child_imports, child_interfaces = legacy_generate_interfaces(inner_type)
+            imports.merge(child_imports)
+            interfaces.merge(child_interfaces)
+            declaration += f"    {field_name}: {inner_type.__name__}"
+        else:
+            declaration += f'    "{field_name}": {generate_type(inner_type, imports)}'
+
+        declaration += "[]" if was_list else ""
+        declaration += " | undefined" if was_optional else ""
+        declaration += "\n"
+
+    declaration += "}"
+    interfaces.add(name, declaration)
+
+    return imports, interfaces
+
+
+class Tree(BaseModel):
+    label: str
+    children: typing.List["Tree"]
+
+
+def _scalar_fields() -> typing.Dict[str, typing.Any]:
+    return {f"field_{i}": (str, ...) for i in range(FIELDS)}
+
+
+def deep_graph() -> typing.List[typing.Type[BaseModel]]:
+    model: typing.Type[BaseModel] = create_model("Level0", **_scalar_fields())
+    for level in range(1, DEPTH):
+        model = create_model(
+            f"Level{level}",
+            left=(model, ...),
+            right=(typing.List[model], ...),  # type: ignore
+            **_scalar_fields(),
+        )
+    return [model]
+
+
+def wide_graph() -> typing.List[typing.Type[BaseModel]]:
+    model: typing.Type[BaseModel] = create_model("Link0", **_scalar_fields())
+    for link in range(1, CHAIN):
+        model = create_model(f"Link{link}", next=(model, ...), **_scalar_fields())
+    shared = create_model("Shared", chain=(model, ...), **_scalar_fields())
+    return [
+        create_model(f"Response{i}", shared=(shared, ...), **_scalar_fields())
+        for i in range(WIDTH)
+    ]
+
+
+def _measure(generate: typing.Callable[[], None]) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        start = time.process_time()
+        generate()
+        timings.append(time.process_time() - start)
+    return min(timings)
+
+
+def main():
+    print(
+        f"{'graph':>6} {'legacy ms':>10} {'registry ms':>12} {'speedup':>8} {'shared module ms':>17}"
+    )
+    for label, roots in [("deep", deep_graph()), ("wide", wide_graph())]:
+
+        def legacy():
+            for root in roots:
+                legacy_generate_interfaces(root)
+
+        def registry():
+            # A new registry per run, so every declaration is built at least once per run.
+            type_registry = TypeRegistry()
+            for root in roots:
+                type_registry.generate(root)
+
+        def shared_module():
+            # How types.ts and the .type.ts files are generated: the roots import the models they reference from
+            # models.ts, which declares each of them once.
+            type_registry = TypeRegistry()
+            for root in roots:
+                type_registry.generate(root, shared_module="~/api/models")
+            type_registry.generate_shared(roots)
+
+        legacy_ms = _measure(legacy) * 1e3
+        registry_ms = _measure(registry) * 1e3
+        shared_ms = _measure(shared_module) * 1e3
+        print(
+            f"{label:>6} {legacy_ms:>10.1f} {registry_ms:>12.1f} {legacy_ms / registry_ms:>7.1f}x "
+            f"{shared_ms:>17.1f}"
+        )
+
+    _, interfaces = TypeRegistry().generate(Tree)
+    print(f"self-referential model: {len(list(interfaces))} interface(s) generated")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@ import {context} from 'esbuild'
 import {sassPlugin} from 'esbuild-sass-plugin'
 import {promises as fs} from 'fs'
 import path from 'path'
+import {promisify} from 'util'
+import {constants as zlibConstants, gzip} from 'zlib'
 
 const validEnvironents = ['development', 'production', 'test']
 const env = process.env.NODE_ENV || 'development'
@@ -29,7 +31,7 @@ const target = ['chrome100', 'firefox100']
 const minify = env !== 'development'
 
 const entryPoints = [
-    'src/js/react_page.tsx',
+    'src/js/beckett_page.tsx',
 ]
 
 // Crawl the js template dir and add everything that looks like a Page as an entrypoint
@@ -49,8 +51,25 @@ for (const blueprint of await fs.readdir(jsTemplateDir)) {
 }
 
 // esbuild outputs files with hashed names like `global-ABC.js`, so we need to store a mapping of input -> output for
-// admin to use later
+// admin to use later, along with the chunks each entrypoint imports so pages can preload them.
+const METAFILE_VERSION = 2
 const entryPointMap = new Map()
+
+// The chunks an output imports statically, directly or through other chunks. The browser needs all of them before the
+// module can run, and would otherwise only discover them one level of imports at a time.
+const chunkImports = (outputs, file, seen = new Set()) => {
+    for (const imported of outputs[file].imports) {
+        if (imported.kind !== 'import-statement' || imported.external || seen.has(imported.path)) {
+            continue
+        }
+        seen.add(imported.path)
+        chunkImports(outputs, imported.path, seen)
+    }
+    return seen
+}
+
+const staticPath = builtFile => builtFile.substring('src/static/'.length)
+
 const writeMetafilePlugin = {
     name: 'writeMetafilePlugin',
     setup(build) {
@@ -58,13 +77,55 @@ const writeMetafilePlugin = {
 
         build.onEnd(async result => {
             console.log('Built...')
-            Object.entries(result.metafile.outputs).forEach(([builtFile, output]) => {
+            const outputs = result.metafile.outputs
+            Object.entries(outputs).forEach(([builtFile, output]) => {
                 if (output.entryPoint) {
-                    entryPointMap.set(output.entryPoint, builtFile.substring('src/static/'.length))
+                    entryPointMap.set(output.entryPoint, {
+                        file: staticPath(builtFile),
+                        imports: [...chunkImports(outputs, builtFile)].map(staticPath),
+                    })
                 }
             })
             console.log(entryPointMap)
-            await fs.writeFile('src/metafile.json', JSON.stringify(Object.fromEntries(entryPointMap.entries())))
+            await fs.writeFile(
+                'src/metafile.json',
+                JSON.stringify({version: METAFILE_VERSION, entryPoints: Object.fromEntries(entryPointMap.entries())}),
+            )
+        })
+    },
+}
+
+// Hashed files are served with `.gz` siblings to clients that accept them, so they aren't compressed per request.
+const COMPRESSIBLE_EXTENSIONS = ['.js', '.css', '.map', '.svg']
+const gzipAsync = promisify(gzip)
+const writeCompressedPlugin = {
+    name: 'writeCompressedPlugin',
+    setup(build) {
+        build.onEnd(async result => {
+            await Promise.all(
+                Object.keys(result.metafile.outputs)
+                    .filter(builtFile => COMPRESSIBLE_EXTENSIONS.includes(path.extname(builtFile)))
+                    .map(async builtFile => {
+                        const content = await fs.readFile(builtFile)
+                        const compressed = await gzipAsync(content, {level: zlibConstants.Z_BEST_COMPRESSION})
+                        if (compressed.length < content.length) {
+                            await fs.writeFile(`${builtFile}.gz`, compressed)
+                        }
+                    }),
+            )
+        })
+    },
+}
+
+// The server side rendering worker (src/beckett/ssr.py) restarts its Node processes when this file changes, so they
+// don't keep rendering with the pages they imported before a rebuild.
+const SSR_OUTDIR = 'src/ssr'
+const writeSSRBuildStampPlugin = {
+    name: 'writeSSRBuildStampPlugin',
+    setup(build) {
+        build.onEnd(async () => {
+            await fs.mkdir(SSR_OUTDIR, {recursive: true})
+            await fs.writeFile(path.join(SSR_OUTDIR, 'build-stamp'), `${Date.now()}\n`)
         })
     },
 }
@@ -82,15 +143,36 @@ const contexts = [
         loader,
         minify,
         outdir: 'src/static/js',
-        plugins: [writeMetafilePlugin, sassPlugin()],
+        // Development builds are served uncompressed, there's no need to spend time on it.
+        plugins: [writeMetafilePlugin, ...(minify ? [writeCompressedPlugin] : []), sassPlugin()],
         sourcemap: true,
         splitting: true,
         target,
     }),
+    // The pages again, for the Node processes that render them on the server (`@beckett.page(ssr=True)`).
+    context({
+        bundle: true,
+        define,
+        entryNames: '[dir]/[name]',
+        entryPoints: ['src/js/ssr_worker.tsx', ...entryPoints.filter(entryPoint => entryPoint.startsWith(jsTemplateDir))],
+        format: 'esm',
+        loader,
+        outbase: 'src/js',
+        outdir: SSR_OUTDIR,
+        outExtension: {'.js': '.mjs'},
+        // React and the other packages are imported from node_modules, so every page shares the same instance.
+        packages: 'external',
+        platform: 'node',
+        plugins: [writeSSRBuildStampPlugin, sassPlugin()],
+        sourcemap: true,
+        splitting: true,
+        target: 'node16',
+    }),
 ]
 
 console.log('Erasing static')
 await fs.rm('src/static/js', {recursive: true, force: true})
+await fs.rm(SSR_OUTDIR, {recursive: true, force: true})
 
 await Promise.all(
     contexts.map(async c => {
@@ -0,0 +1,8 @@
+"""
+ASGI entry point, for serving the app with an ASGI server:
+
+    uvicorn src.asgi:application
+"""
+from src.app import app
+
+application = app.as_asgi()
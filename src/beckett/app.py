@@ -1,11 +1,33 @@
+import time
+import typing
+from dataclasses import dataclass
+
 import flask
 import structlog
 
 from src import settings
+from src.beckett.batch import BATCH_ENDPOINT, BATCH_URL, handle_batch
+from src.beckett.compression import response_compression
+from src.beckett.metrics import METRICS_ENDPOINT, METRICS_URL, handle_metrics
+from src.beckett.static import send_static_file
+
+if typing.TYPE_CHECKING:
+    from flask.sansio.blueprints import Blueprint
+
+    from src.beckett.asgi import BeckettASGI
 
 log = structlog.get_logger(__name__)
 
 
+@dataclass
+class BlueprintTiming:
+    import_seconds: typing.Optional[float]
+    """From the creation of a `BeckettBlueprint` until it was registered, roughly the time to import its module."""
+
+    register_seconds: float
+    """The time `register_blueprint` took."""
+
+
 class BeckettApp(flask.Flask):
     def __init__(self, *args, **kwargs):
         assert (
@@ -16,6 +38,55 @@ class BeckettApp(flask.Flask):
         ), "template_folder must be set for Beckett to work with Flask"
         super().__init__(*args, **kwargs)
 
+        self.created_at = time.perf_counter()
+        self.boot_timings: typing.Dict[str, BlueprintTiming] = {}
+        """How long each blueprint took to import and register, in registration order."""
+
+        self.add_url_rule(
+            BATCH_URL, BATCH_ENDPOINT, view_func=handle_batch, methods=["POST"]
+        )
+        self.add_url_rule(METRICS_URL, METRICS_ENDPOINT, view_func=handle_metrics)
+        self.after_request(response_compression)
+
+    def register_blueprint(self, blueprint: "Blueprint", **options) -> None:
+        from src.beckett.blueprint import BeckettBlueprint
+
+        start = time.perf_counter()
+        super().register_blueprint(blueprint, **options)
+        end = time.perf_counter()
+
+        # Only Beckett blueprints know when they were created, i.e. when their module was imported.
+        created_at = (
+            blueprint.created_at if isinstance(blueprint, BeckettBlueprint) else None
+        )
+        timing = BlueprintTiming(
+            import_seconds=None if created_at is None else start - created_at,
+            register_seconds=end - start,
+        )
+        self.boot_timings[blueprint.name] = timing
+        log.info(
+            "Registered blueprint",
+            blueprint=blueprint.name,
+            import_ms=(
+                None
+                if timing.import_seconds is None
+                else round(timing.import_seconds * 1000, 1)
+            ),
+            register_ms=round(timing.register_seconds * 1000, 1),
+            since_app_created_ms=round((end - self.created_at) * 1000, 1),
+        )
+
+    def send_static_file(self, filename: str) -> flask.Response:
+        if not self.has_static_folder:
+            raise RuntimeError("'static_folder' must be set to serve static_files.")
+        return send_static_file(self, filename)
+
+    def as_asgi(self, **kwargs) -> "BeckettASGI":
+        """Wraps the app for an ASGI server, see `src.beckett.asgi.BeckettASGI`."""
+        from src.beckett.asgi import BeckettASGI
+
+        return BeckettASGI(self, **kwargs)
+
     def run(self, *args, **kwargs):
         # Only generate TS types files in development
         if settings.in_dev_environment:
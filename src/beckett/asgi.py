@@ -0,0 +1,230 @@
+import asyncio
+import contextvars
+import inspect
+import io
+import sys
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+import flask
+import structlog
+import werkzeug
+
+T = typing.TypeVar("T")
+
+log = structlog.get_logger(__name__)
+
+Scope = typing.Dict[str, typing.Any]
+Message = typing.Dict[str, typing.Any]
+Receive = typing.Callable[[], typing.Awaitable[Message]]
+Send = typing.Callable[[Message], typing.Awaitable[None]]
+
+
+def _build_environ(scope: Scope, body: bytes) -> typing.Dict[str, typing.Any]:
+    """Builds a WSGI environ (PEP 3333) for an ASGI HTTP scope."""
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+            continue
+        if name == "CONTENT_LENGTH":
+            continue
+        key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+    return environ
+
+
+def _next_chunk(chunks: typing.Iterator[T]) -> typing.Optional[T]:
+    return next(chunks, None)
+
+
+class BeckettASGI:
+    """
+    Serves a BeckettApp over ASGI.
+
+    Requests for `async def` views (`api_get`, `api_post` and `page`) run natively on the event loop, so a single
+    process can keep many slow upstream calls in flight and views can fan out with `asyncio.gather`. Every other
+    request goes through the regular WSGI app on a thread pool.
+
+    Run it with any ASGI server, for example:
+
+        uvicorn src.asgi:application
+    """
+
+    def __init__(self, app: flask.Flask, *, max_threads: int = 32):
+        self.app = app
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_threads, thread_name_prefix="beckett-wsgi"
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            raise NotImplementedError(f"Unsupported ASGI scope type: {scope['type']}")
+
+        environ = _build_environ(scope, await self._read_body(receive))
+
+        # Every step of a request, on the loop or on the thread pool, runs in the same context: Flask pushes its
+        # contexts as context variables, and a streamed response pops them once the last chunk has been pulled.
+        context = contextvars.copy_context()
+        view = self._match_async_view(environ)
+        if view is not None:
+            response = await asyncio.create_task(
+                self._dispatch_async(environ), context=context
+            )
+            await self._send_response(response, send, context)
+        else:
+            await self._run_wsgi(environ, send, context)
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _read_body(self, receive: Receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                return b"".join(chunks)
+
+    def _match_async_view(self, environ) -> typing.Optional[typing.Callable]:
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+        except werkzeug.exceptions.HTTPException:
+            return None
+        view = self.app.view_functions.get(endpoint)  # type: ignore
+        return view if inspect.iscoroutinefunction(view) else None
+
+    async def _dispatch_async(self, environ) -> flask.Response:
+        """The equivalent of `Flask.full_dispatch_request()`, awaiting the view instead of running it in a thread."""
+        app = self.app
+        ctx = app.request_context(environ)
+        error: typing.Optional[BaseException] = None
+        ctx.push()
+        try:
+            try:
+                flask.request_started.send(app)
+                rv = app.preprocess_request()
+                if rv is None:
+                    request = flask.request
+                    view = app.view_functions[request.url_rule.endpoint]  # type: ignore
+                    rv = await view(**request.view_args)  # type: ignore
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            return app.finalize_request(rv)
+        except Exception as e:
+            error = e
+            return app.handle_exception(e)
+        finally:
+            ctx.pop(error)
+
+    async def _send_response(
+        self, response: flask.Response, send: Send, context: contextvars.Context
+    ) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": [
+                    (name.lower().encode("latin-1"), value.encode("latin-1"))
+                    for name, value in response.headers.items()
+                ],
+            }
+        )
+        if not response.is_streamed:
+            await send({"type": "http.response.body", "body": response.get_data()})
+            return
+
+        # Streamed bodies are generators that may block, so pull them from the thread pool, one at a time in the
+        # request's context whichever thread pulls them.
+        loop = asyncio.get_running_loop()
+        chunks = iter(response.response)
+        try:
+            while (
+                chunk := await loop.run_in_executor(
+                    self.executor, context.run, _next_chunk, chunks
+                )
+            ) is not None:
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk.encode() if isinstance(chunk, str) else chunk,
+                        "more_body": True,
+                    }
+                )
+        finally:
+            await loop.run_in_executor(self.executor, context.run, response.close)
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _run_wsgi(
+        self, environ, send: Send, context: contextvars.Context
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        started: typing.Dict[str, typing.Any] = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = headers
+
+        result = await loop.run_in_executor(
+            self.executor, context.run, self.app.wsgi_app, environ, start_response
+        )
+        chunks = iter(result)
+        try:
+            first_chunk = await loop.run_in_executor(
+                self.executor, context.run, _next_chunk, chunks
+            )
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": started["status"],
+                    "headers": [
+                        (name.lower().encode("latin-1"), value.encode("latin-1"))
+                        for name, value in started["headers"]
+                    ],
+                }
+            )
+            chunk = first_chunk
+            while chunk is not None:
+                await send(
+                    {"type": "http.response.body", "body": chunk, "more_body": True}
+                )
+                chunk = await loop.run_in_executor(
+                    self.executor, context.run, _next_chunk, chunks
+                )
+        finally:
+            close = getattr(result, "close", None)
+            if close is not None:
+                await loop.run_in_executor(self.executor, context.run, close)
+        await send({"type": "http.response.body", "body": b""})
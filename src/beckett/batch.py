@@ -0,0 +1,148 @@
+import io
+import json
+import typing
+import urllib.parse
+
+import flask
+import structlog
+from pydantic import BaseModel, Field, ValidationError
+from werkzeug.routing import BuildError
+
+if typing.TYPE_CHECKING:
+    from src.beckett.types.types_manager import RouteDefinition
+
+log = structlog.get_logger(__name__)
+
+BATCH_URL = "/__beckett/batch"
+BATCH_ENDPOINT = "beckett_batch"
+MAX_BATCH_SIZE = 50
+
+
+class BatchEntry(BaseModel):
+    endpoint: str
+    """An `api_get` endpoint name, as used in GET_MAP (e.g. "people.get_people")."""
+
+    request: typing.Dict[str, typing.Any] = Field(default_factory=dict)
+    """The request for that endpoint, the same object `useGet` would have sent as query parameters."""
+
+
+class BatchRequest(BaseModel):
+    entries: typing.List[BatchEntry] = Field(max_length=MAX_BATCH_SIZE)
+
+
+def _response_body_as_json(response: flask.Response) -> bytes:
+    body = response.get_data()
+    if not body:
+        return b"null"
+    if response.mimetype == "application/json":
+        return body
+    # Werkzeug HTTP exceptions are sent as plain text, wrap them so the batch stays valid JSON.
+    return json.dumps(body.decode()).encode()
+
+
+def _entry_environ(path: str) -> typing.Dict[str, typing.Any]:
+    """The environ of a GET request to `path` from the client that sent the batch, with its headers and cookies."""
+    environ = dict(flask.request.environ)
+    environ.pop("werkzeug.request", None)
+    environ.pop("CONTENT_TYPE", None)
+    environ.update(
+        {
+            "REQUEST_METHOD": "GET",
+            "PATH_INFO": path,
+            "QUERY_STRING": "",
+            "CONTENT_LENGTH": "0",
+            "wsgi.input": io.BytesIO(),
+        }
+    )
+    return environ
+
+
+def _entry_path(
+    route: "RouteDefinition", request: typing.Dict[str, typing.Any]
+) -> typing.Optional[str]:
+    """The path a direct request to the entry's route goes to, with its URL arguments from `request`, if it has them."""
+    adapter = flask.current_app.url_map.bind_to_environ(
+        {**flask.request.environ, "SCRIPT_NAME": ""}
+    )
+    try:
+        path = adapter.build(route.endpoint, request, append_unknown=False)
+    except (BuildError, ValueError):
+        # A missing URL argument, or one its converter can't take: no path leads to the route with this request.
+        return None
+    # PATH_INFO isn't quoted.
+    return urllib.parse.unquote(path)
+
+
+def _run_entry(
+    route: "RouteDefinition", request: typing.Dict[str, typing.Any]
+) -> flask.Response:
+    """
+    Runs a batch entry in a request context of its own, for the path a direct request would go to. It's routed the
+    same, so the `before_request` functions of the app and of the route's blueprint let it through (or turn it away)
+    exactly like a direct request, and the view gets the URL arguments that were matched.
+    """
+    from src.beckett.types.types_manager import canned_error_response
+
+    path = _entry_path(route, request)
+    if path is None:
+        return canned_error_response(404)
+
+    app = flask.current_app._get_current_object()  # type: ignore
+    with app.request_context(_entry_environ(path)):
+        url_rule = flask.request.url_rule
+        if url_rule is None or url_rule.endpoint != route.endpoint:
+            return canned_error_response(404)
+        try:
+            rv = app.preprocess_request()
+            if rv is None:
+                view_args = flask.request.view_args or {}
+                # Routes with `async def` views have a coroutine dispatch function.
+                return app.ensure_sync(route.dispatch)(view_args, lambda: request)
+        except Exception as e:
+            rv = app.handle_user_exception(e)
+        return app.make_response(rv)
+
+
+def handle_batch() -> flask.Response:
+    """
+    Runs several `api_get` routes for a single HTTP request.
+
+    Accepts `{"entries": [{"endpoint": ..., "request": {...}}, ...]}` and responds with
+    `{"responses": [{"status_code": ..., "body": ...}, ...]}` in the same order. Every entry goes through the same
+    validation, caching and error handling as a direct request to its route would, and the same `before_request`
+    functions.
+    """
+    from src.beckett.types.types import BadRequest
+    from src.beckett.types.types_manager import (
+        api_response_as_flask_response,
+        api_route_type_manager,
+        canned_error_response,
+    )
+
+    try:
+        batch = BatchRequest.model_validate_json(flask.request.get_data())
+    except ValidationError as e:
+        log.warning("Batch payload failed validation", error=repr(e))
+        return api_response_as_flask_response(BadRequest(message=repr(e)))
+
+    parts = []
+    for entry in batch.entries:
+        route = api_route_type_manager.get_route(entry.endpoint)
+        if (
+            route is None
+            or route.method != "GET"
+            or route.dispatch is None
+            or route.is_streaming
+        ):
+            response = canned_error_response(404)
+        else:
+            response = _run_entry(route, entry.request)
+
+        parts.append(
+            b'{"status_code":%d,"body":%s}'
+            % (response.status_code, _response_body_as_json(response))
+        )
+
+    return flask.Response(
+        b'{"responses":[' + b",".join(parts) + b"]}", mimetype="application/json"
+    )
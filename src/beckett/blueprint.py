@@ -1,20 +1,56 @@
+import asyncio
+import inspect
 import re
+import time
 import typing
 from functools import wraps
 
 import flask
 import structlog
-
+import werkzeug
+from markupsafe import Markup
+from werkzeug.http import quote_etag
+
+from src.beckett.cache import CachePolicy
+from src.beckett.etag import (
+    body_etag,
+    is_not_modified,
+    not_modified_response,
+    version_etag,
+)
+from src.beckett.metrics import RequestTimer, metrics
+from src.beckett.renderer.typescript_react.manifest import asset_manifest
 from src.beckett.renderer.typescript_react.renderer import (
     build_render_context_for_base_template,
+    script_safe_json,
     write_react_page_file,
     write_typescript_file,
 )
-from src.beckett.types import NoneType, generate_interfaces
-from src.beckett.types.types_manager import generate_api_decorator
+from src.beckett.renderer.typescript_react.shell import page_shells, request_slots
+from src.beckett.renderer.typescript_react.type_files import type_fingerprint
+from src.beckett.snapshot import route_snapshot
+from src.beckett.ssr import ssr_pool
+from src.beckett.streaming import STREAM_ERROR_KEY
+from src.beckett.types import (
+    JOB_ENDPOINT_SUFFIX,
+    JOB_RULE_SUFFIX,
+    SHARED_TYPES_MODULE,
+    NoneType,
+    background_view,
+    job_status_view,
+    type_registry,
+)
+from src.beckett.types.types_manager import (
+    api_route_type_manager,
+    generate_api_decorator,
+)
+from src.utils import unwrap
 
 log = structlog.get_logger(__name__)
 
+BECKETT_PAGE_ENTRYPOINT = "src/js/beckett_page.tsx"
+"""The module that renders every page, imported along with the page's own entrypoint."""
+
 
 class BeckettBlueprint(flask.Blueprint):
     """
@@ -22,6 +58,12 @@ class BeckettBlueprint(flask.Blueprint):
     and React pages.
     """
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Blueprints are created at the top of their module, so the time until they are registered with the app is
+        # roughly how long the module took to import, decorators included. See `BeckettApp.boot_timings`.
+        self.created_at = time.perf_counter()
+
     class page:
         """
         Decorate a flask endpoint such that the response will be a page rendered with a React component.
@@ -42,24 +84,97 @@ class BeckettBlueprint(flask.Blueprint):
 
         The return value must be a src.beckett.types.PageProps class.
         It will be transformed into props for the React page.
+
+        With `etag=True` the page is sent with an ETag and a matching `If-None-Match` gets a 304. The ETag is computed
+        from the props, or from their version key (`PageProps.with_version()`) without serializing them, and the page
+        isn't rendered to compute it. Pages whose template gets a `script_nonce` aren't sent with an ETag.
+
+        With `ssr=True` the page component is rendered to HTML on the server (see `src.beckett.ssr`), and hydrated in
+        the browser. If it can't be rendered the page is rendered in the browser instead, as without it.
+
+        With `stream=True` everything before the props, including the module preloads, is sent before the view
+        function runs, so the browser fetches the page's JavaScript while the view is still working. The status line
+        is sent by then too: if the view function raises, the error is logged and the props are replaced by
+        `{"$error": <status_code>}`, which `renderReactPage` shows as an error. Streamed pages can't have an ETag or be
+        rendered on the server.
         """
 
         template: str
-
-        def __init__(self):
+        etag: bool
+        ssr: bool
+        stream: bool
+
+        def __init__(
+            self, *, etag: bool = False, ssr: bool = False, stream: bool = False
+        ):
+            if stream and (etag or ssr):
+                raise Exception(
+                    "A streamed page can't have an ETag or be rendered on the server, "
+                    "its headers and HTML are sent before the view function runs"
+                )
             self.template = "beckett_page.jinja2"
+            self.etag = etag
+            self.ssr = ssr
+            self.stream = stream
 
         def __call__(self, view_function):
-            from src.beckett.types.types_manager import api_route_type_manager
-
             self.view_function = view_function
-            self.view_function_types = typing.get_type_hints(self.view_function)
-            self.return_type = self.view_function_types.pop("return", None)
             self.module = re.sub(r".*\.", "", view_function.__module__)
             self.name = view_function.__name__
+            self.react_entrypoint_filename = (
+                f"src/js/template/{self.module}/{self.name}.tsx"
+            )
 
-            # At server start, write out the typescript type file for the props, if the view function returns them.
-            self._write_typescript_type_file()
+            # The base template context only depends on the endpoint, so it is built once per endpoint and reused.
+            self._base_template_contexts: typing.Dict[
+                str, typing.Dict[str, typing.Any]
+            ] = {}
+
+            if route_snapshot.has_page(f"{self.module}.{self.name}"):
+                # The props were checked when the snapshot was built, and are only needed to generate types.
+                self.return_type = None
+            else:
+                self.view_function_types = typing.get_type_hints(self.view_function)
+                self.return_type = self.view_function_types.pop("return", None)
+                api_route_type_manager.add_page_props(
+                    f"{self.module}.{self.name}", self.return_type
+                )
+
+                # At server start, write out the typescript type file for the props, if the view function returns
+                # them.
+                self._write_typescript_type_file()
+
+            if self.stream:
+
+                @wraps(view_function)
+                def wrapped_streamed(*args, **kwargs):
+                    """The same as `wrapped`, sending the page up to its props before calling the view function."""
+                    timer = metrics.route(unwrap(flask.request.endpoint)).timer()
+                    # An `async def` view function is run to completion from the response generator.
+                    view = flask.current_app.ensure_sync(view_function)
+                    return self._stream_response(view, args, kwargs, timer)
+
+                return wrapped_streamed
+
+            if inspect.iscoroutinefunction(view_function):
+
+                @wraps(view_function)
+                async def wrapped_async(*args, **kwargs):
+                    """The same as `wrapped`, for `async def` view functions."""
+                    timer = metrics.route(unwrap(flask.request.endpoint)).timer()
+                    try:
+                        response = await view_function(*args, **kwargs)
+                    except Exception as e:
+                        return self._error_response(e, timer)
+                    timer.mark("view")
+                    if self.ssr:
+                        # Rendering on the server waits for a Node process, which mustn't hold up the event loop.
+                        return await asyncio.to_thread(
+                            self._render_response, response, timer
+                        )
+                    return self._render_response(response, timer)
+
+                return wrapped_async
 
             @wraps(view_function)
             def wrapped(*args, **kwargs):
@@ -67,30 +182,178 @@ class BeckettBlueprint(flask.Blueprint):
 
                 Outputs a standard templated flask response, using a template that renders a React component.
                 """
-                response = view_function(*args, **kwargs)
+                timer = metrics.route(unwrap(flask.request.endpoint)).timer()
+                try:
+                    response = view_function(*args, **kwargs)
+                except Exception as e:
+                    return self._error_response(e, timer)
+                timer.mark("view")
+                return self._render_response(response, timer)
 
-                react_context = {
-                    "react_entrypoint_filename": f"src/js/template/{self.module}/{self.name}.tsx",
-                    "base_data": {
-                        "urlMap": api_route_type_manager.get_url_map(),
-                    },
-                }
+            return wrapped
 
-                html = flask.render_template(
+        @staticmethod
+        def _error_response(e: Exception, timer: RequestTimer) -> flask.Response:
+            """
+            Handles an exception raised by the view function the way flask would, so the request is recorded with the
+            status of the error response. One without an error handler is raised on, and recorded as the 500 it becomes.
+            """
+            timer.mark("view")
+            app = flask.current_app
+            try:
+                response = app.make_response(app.handle_user_exception(e))
+            except Exception:
+                timer.finish_streamed(500)
+                raise
+            return timer.finish(response)
+
+        def _etag_applies(self) -> bool:
+            """
+            Whether the page is sent with an ETag: not when the template gets a CSP nonce, as every response holds a
+            new one, which a page cached by the browser would no longer be allowed to run its scripts with.
+            """
+            return self.etag and not request_slots(self.template)["script_nonce"]
+
+        def _render_response(self, response, timer: RequestTimer) -> flask.Response:
+            etag = self._etag_applies()
+            page_etag = None
+            if etag and response._version is not None:
+                page_etag = version_etag(
+                    flask.request.full_path,
+                    response._version,
+                    api_route_type_manager.get_base_data_json(),
+                    asset_manifest.get_version(),
+                )
+                if is_not_modified(page_etag):
+                    return timer.finish(not_modified_response(page_etag))
+
+            props_json = response.model_dump_json()
+            props = script_safe_json(props_json)
+            if etag and page_etag is None:
+                # The rest of the page only depends on the base data and the assets, as with a version key.
+                page_etag = version_etag(
+                    flask.request.full_path,
+                    body_etag(props_json.encode()),
+                    api_route_type_manager.get_base_data_json(),
+                    asset_manifest.get_version(),
+                )
+                if is_not_modified(page_etag):
+                    return timer.finish(not_modified_response(page_etag))
+            timer.mark("serialization")
+
+            ssr_html = None
+            if self.ssr:
+                html = ssr_pool.render(
+                    self.react_entrypoint_filename,
+                    props_json.encode(),
+                    api_route_type_manager.get_base_data_json().encode(),
+                )
+                # The HTML React rendered, to be hydrated by the same component.
+                ssr_html = None if html is None else Markup(html)
+                timer.mark("ssr")
+
+            context = self._get_template_context()
+            slots = {"props": props, "ssr_html": ssr_html}
+            if page_shells.applies():
+                body = page_shells.render(
                     self.template,
-                    __render_react_response=response,
-                    props=response.model_dump_json(),
-                    **build_render_context_for_base_template(),
-                    **react_context,
+                    version=(asset_manifest.version, context["base_data"]),
+                    context=context,
+                    slots=slots,
                 )
-                status = 200
-                headers = {
+            else:
+                body = flask.render_template(
+                    self.template,
+                    __render_react_response=response,
+                    **context,
+                    **slots,
+                ).encode()
+            timer.mark("template")
+            status = 200
+            headers = {
+                "Content-Type": "text/html; charset=utf-8",
+                # Lets the browser (or a CDN sending 103 Early Hints) fetch the modules before it has parsed the page.
+                "Link": self._link_header(context["module_preloads"]),
+            }
+
+            if page_etag is not None:
+                headers["ETag"] = quote_etag(page_etag)
+
+            return timer.finish(flask.Response(body, status, headers))
+
+        def _stream_response(
+            self,
+            view: typing.Callable[..., typing.Any],
+            args: typing.Tuple[typing.Any, ...],
+            kwargs: typing.Dict[str, typing.Any],
+            timer: RequestTimer,
+        ) -> flask.Response:
+            context = self._get_template_context()
+            # The props are the only slot, sent once the view function has returned.
+            shell = page_shells.get(
+                self.template,
+                version=(asset_manifest.version, context["base_data"]),
+                context=context,
+                slots={"props": "", "ssr_html": None},
+            )
+            request_values = request_slots(self.template)
+            timer.mark("template")
+
+            def generate() -> typing.Iterator[bytes]:
+                yield shell.segments[0]
+
+                status_code = 200
+                try:
+                    response = view(*args, **kwargs)
+                    timer.mark("view")
+                    props: str = script_safe_json(response.model_dump_json())
+                    timer.mark("serialization")
+                except Exception as e:
+                    log.exception("Streamed page failed", error=e)
+                    status_code = (
+                        e.code
+                        if isinstance(e, werkzeug.exceptions.HTTPException) and e.code
+                        else 500
+                    )
+                    props = '{"%s":%d}' % (STREAM_ERROR_KEY, status_code)
+
+                yield shell.join({"props": props, **request_values}, head=False)
+                timer.finish_streamed(status_code)
+
+            return flask.Response(
+                flask.stream_with_context(generate()),
+                200,
+                {
                     "Content-Type": "text/html; charset=utf-8",
-                }
-
-                return html, status, headers
+                    "Link": self._link_header(context["module_preloads"]),
+                    # Keeps nginx from holding the head back until the whole page is ready.
+                    "X-Accel-Buffering": "no",
+                },
+            )
 
-            return wrapped
+        def _get_template_context(self) -> typing.Dict[str, typing.Any]:
+            """Everything `beckett_page.jinja2` needs but the props and server rendered HTML."""
+            return {
+                "beckett_page_entrypoint": BECKETT_PAGE_ENTRYPOINT,
+                "module_preloads": asset_manifest.module_preloads(
+                    BECKETT_PAGE_ENTRYPOINT, self.react_entrypoint_filename
+                ),
+                "base_data": api_route_type_manager.get_base_data_json(),
+                "react_entrypoint_filename": self.react_entrypoint_filename,
+                **self._get_base_template_context(),
+            }
+
+        @staticmethod
+        def _link_header(module_preloads: typing.Iterable[str]) -> str:
+            return ", ".join(f"<{url}>; rel=modulepreload" for url in module_preloads)
+
+        def _get_base_template_context(self) -> typing.Dict[str, typing.Any]:
+            endpoint = flask.request.endpoint
+            context = self._base_template_contexts.get(endpoint)  # type: ignore
+            if context is None:
+                context = build_render_context_for_base_template()
+                self._base_template_contexts[endpoint] = context  # type: ignore
+            return context
 
         def _write_typescript_type_file(self):
             if self.return_type == NoneType:
@@ -101,14 +364,18 @@ class BeckettBlueprint(flask.Blueprint):
             )
             write_react_page_file(module=self.module, endpoint=self.name)
             write_typescript_file(
-                type_data=self._generate_typescript_type_file_contents(),
                 module=self.module,
                 endpoint=self.name,
+                fingerprint=type_fingerprint(self.return_type),
+                generate_type_data=self._generate_typescript_type_file_contents,
             )
 
         def _generate_typescript_type_file_contents(self) -> str:
-            typescript_imports, typescript_interfaces = generate_interfaces(
-                self.return_type, name="PageProps", default_export=True
+            typescript_imports, typescript_interfaces = type_registry.generate(
+                self.return_type,
+                name="PageProps",
+                default_export=True,
+                shared_module=SHARED_TYPES_MODULE,
             )
 
             export_string = "// This file is generated by @beckett.page(), changes will be overwritten if the server is running in development mode\n\n"  # noqa
@@ -121,7 +388,18 @@ class BeckettBlueprint(flask.Blueprint):
 
             return export_string.strip() + "\n"
 
-    def api_get(self, rule, *, endpoint=None, **options):
+    def api_get(
+        self,
+        rule,
+        *,
+        endpoint=None,
+        cache: typing.Optional[CachePolicy] = None,
+        etag: bool = False,
+        max_page_size: typing.Optional[int] = None,
+        sparse: bool = False,
+        coalesce: bool = False,
+        **options,
+    ):
         if "methods" in options:
             raise Exception("Can't specify method for api_get")
 
@@ -132,6 +410,11 @@ class BeckettBlueprint(flask.Blueprint):
                 method="GET",
                 endpoint=f"{self.name}.{actual_endpoint}",
                 url=self.url_prefix + rule,
+                cache_policy=cache,
+                etag=etag,
+                max_page_size=max_page_size,
+                sparse=sparse,
+                coalesce=coalesce,
             )
 
             return self.add_url_rule(
@@ -144,17 +427,56 @@ class BeckettBlueprint(flask.Blueprint):
 
         return decorator
 
-    def api_post(self, rule, *, endpoint=None, **options):
+    def api_post(
+        self,
+        rule,
+        *,
+        endpoint=None,
+        invalidates: typing.Optional[typing.Sequence[str]] = None,
+        idempotent: bool = False,
+        background: bool = False,
+        **options,
+    ):
+        """
+        Declares an API route that changes data. With `background=True` the view function runs as a background job:
+        the route responds straight away with a `JobHandle`, and the `<endpoint>_job` route it adds at
+        `<rule>/job?job_id=...` reports how the job is going and holds its response once it's done.
+        """
         if "methods" in options:
             raise Exception("Can't specify method for api_post")
 
         def decorator(f):
             actual_endpoint = endpoint or f.__name__
+            full_endpoint = f"{self.name}.{actual_endpoint}"
+            view = f
+            route_invalidates = invalidates
+            if background:
+                # The job invalidates the cache once it's done, the 202 that starts it changes nothing yet.
+                view = background_view(
+                    f, endpoint=full_endpoint, invalidates=invalidates
+                )
+                route_invalidates = None
+                self.add_url_rule(
+                    rule + JOB_RULE_SUFFIX,
+                    view_func=generate_api_decorator(
+                        job_status_view(f, endpoint=full_endpoint),
+                        method="GET",
+                        endpoint=full_endpoint + JOB_ENDPOINT_SUFFIX,
+                        url=self.url_prefix + rule + JOB_RULE_SUFFIX,
+                        code=f.__code__,
+                    ),
+                    methods=["GET"],
+                    endpoint=actual_endpoint + JOB_ENDPOINT_SUFFIX,
+                )
+
             handle_api_route = generate_api_decorator(
-                f,
+                view,
                 method="POST",
-                endpoint=f"{self.name}.{actual_endpoint}",
+                endpoint=full_endpoint,
                 url=self.url_prefix + rule,
+                invalidates=route_invalidates,
+                idempotent=idempotent,
+                code=f.__code__,
             )
 
             return self.add_url_rule(
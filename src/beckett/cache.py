@@ -0,0 +1,168 @@
+import threading
+import time
+import typing
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import flask
+import structlog
+
+from src.beckett.etag import is_not_modified, not_modified_response
+from src.beckett.single_flight import SingleFlight
+
+log = structlog.get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """
+    How the responses of an `api_get` route are cached in process.
+
+    Example:
+
+        @beckett.api_get("/books", cache=CachePolicy(ttl=30, max_entries=500, tags=["books"]))
+        def books(author: str) -> BooksResponse:
+            ...
+
+        @beckett.api_post("/books/add", invalidates=["books"])
+        def add_book(name: str, author: str) -> BookResponse:
+            ...
+    """
+
+    ttl: float
+    """How long, in seconds, a cached response is served for."""
+
+    max_entries: int = 1024
+    """The number of distinct requests kept for the route, the least recently used are evicted first."""
+
+    tags: typing.Sequence[str] = field(default_factory=tuple)
+    """Names that `api_post(invalidates=[...])` routes can use to evict this route's entries."""
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    status_code: int
+    expires_at: float
+    etag: typing.Optional[str] = None
+
+
+@dataclass
+class SharedResponse:
+    """A response serialized once and sent to every request that waited for it, see `api_get(coalesce=True)`."""
+
+    body: bytes
+    status_code: int
+    headers: typing.List[typing.Tuple[str, str]]
+    etag: typing.Optional[str]
+
+    @classmethod
+    def of(cls, response: flask.Response) -> "SharedResponse":
+        return cls(
+            body=response.get_data(),
+            status_code=response.status_code,
+            headers=list(response.headers.items()),
+            etag=response.get_etag()[0],
+        )
+
+    def as_flask_response(self) -> flask.Response:
+        """The response for the current request, which may already hold it."""
+        if self.etag is not None and is_not_modified(self.etag):
+            return not_modified_response(self.etag)
+        return flask.Response(self.body, self.status_code, headers=self.headers)
+
+
+class ResponseCache:
+    """
+    A bounded LRU of serialized API responses, keyed by endpoint and the canonical form of the validated request.
+
+    Each endpoint has a generation, which `invalidate()` moves on. A response is only stored if its endpoint is still
+    at the generation it was read at before the view ran: a GET that started before an invalidating POST finished
+    would otherwise cache the data the POST just changed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._policies: typing.Dict[str, CachePolicy] = {}
+        self._entries: typing.Dict[str, OrderedDict[str, CachedResponse]] = {}
+        self._endpoints_by_tag: typing.Dict[str, typing.Set[str]] = {}
+        self._generations: typing.Dict[str, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, endpoint: str, policy: CachePolicy) -> None:
+        with self._lock:
+            self._policies[endpoint] = policy
+            self._entries[endpoint] = OrderedDict()
+            self._generations[endpoint] = 0
+            for tag in policy.tags:
+                self._endpoints_by_tag.setdefault(tag, set()).add(endpoint)
+
+    def get(self, endpoint: str, key: str) -> typing.Optional[CachedResponse]:
+        with self._lock:
+            entries = self._entries[endpoint]
+            cached = entries.get(key)
+            if cached is None:
+                self.misses += 1
+                return None
+            if cached.expires_at <= time.monotonic():
+                del entries[key]
+                self.misses += 1
+                return None
+            entries.move_to_end(key)
+            self.hits += 1
+            return cached
+
+    def generation(self, endpoint: str) -> int:
+        """The endpoint's generation, to read before running its view and hand to `set()`."""
+        with self._lock:
+            return self._generations[endpoint]
+
+    def set(
+        self,
+        endpoint: str,
+        key: str,
+        body: bytes,
+        status_code: int,
+        generation: int,
+        etag: typing.Optional[str] = None,
+    ) -> None:
+        with self._lock:
+            if self._generations[endpoint] != generation:
+                # Invalidated while the view ran, the response may hold data from before the invalidation.
+                return
+            policy = self._policies[endpoint]
+            entries = self._entries[endpoint]
+            entries[key] = CachedResponse(
+                body=body,
+                status_code=status_code,
+                expires_at=time.monotonic() + policy.ttl,
+                etag=etag,
+            )
+            entries.move_to_end(key)
+            while len(entries) > policy.max_entries:
+                entries.popitem(last=False)
+
+    def invalidate(self, tags: typing.Iterable[str]) -> None:
+        with self._lock:
+            for tag in tags:
+                for endpoint in self._endpoints_by_tag.get(tag, ()):
+                    self._entries[endpoint].clear()
+                    self._generations[endpoint] += 1
+                    log.debug(
+                        "Invalidated cached responses", endpoint=endpoint, tag=tag
+                    )
+
+    def stats(self) -> typing.Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": sum(len(entries) for entries in self._entries.values()),
+        }
+
+
+response_cache = ResponseCache()
+
+response_flights: SingleFlight[SharedResponse] = SingleFlight()
+"""The `api_get(coalesce=True)` requests in progress, by endpoint and canonical request."""
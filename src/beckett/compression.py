@@ -0,0 +1,139 @@
+import typing
+import zlib
+
+import flask
+
+from src import settings
+from src.beckett.streaming import NDJSON_MIMETYPE
+
+COMPRESSIBLE_MIMETYPES = frozenset(
+    {"application/json", NDJSON_MIMETYPE, "text/html", "text/plain"}
+)
+"""Along with JSON based types, `application/<...>+json` (e.g. columnar responses)."""
+
+STREAM_CHUNK_SIZE = 64 * 1024
+"""Bodies of at least this many bytes are compressed one chunk of this size at a time, as they are sent."""
+
+_WBITS = {
+    # The gzip container, as used by the `gzip` module.
+    "gzip": 16 + zlib.MAX_WBITS,
+    # HTTP's "deflate" is the zlib format (RFC 1950), not a raw deflate stream.
+    "deflate": zlib.MAX_WBITS,
+}
+
+
+def _compressor(encoding: str, level: int):
+    return zlib.compressobj(level, zlib.DEFLATED, _WBITS[encoding])
+
+
+def _compress_chunks(
+    chunks: typing.Iterable[typing.Union[bytes, str]], encoding: str, level: int
+) -> typing.Iterator[bytes]:
+    """
+    Compresses `chunks` as they are produced.
+
+    Every chunk is flushed on its own (`Z_SYNC_FLUSH`), so the client can decode each one as soon as it arrives
+    instead of waiting for the compressor's window to fill up. This costs a few bytes per chunk.
+    """
+    compressor = _compressor(encoding, level)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def _split(body: bytes) -> typing.Iterator[bytes]:
+    view = memoryview(body)
+    for start in range(0, len(body), STREAM_CHUNK_SIZE):
+        yield view[start : start + STREAM_CHUNK_SIZE]  # type: ignore
+
+
+class ResponseCompression:
+    """
+    Compresses JSON (`+json` types included), NDJSON, HTML and plain text responses with gzip or deflate, when the
+    client accepts them.
+
+    * Bodies smaller than `min_size` bytes are sent as they are, compressing them would save less than it costs.
+    * Streamed responses, and bodies of at least `stream_size` bytes, are compressed one chunk at a time as they are
+      sent.
+    * Responses that could be compressed always get `Vary: Accept-Encoding`, so shared caches keep the encodings
+      apart.
+    * The ETag of a compressed response is made weak: the compressed bytes depend on the compression level and zlib
+      version, only the decoded body is the same. `is_not_modified()` compares ETags weakly, so 304s keep working.
+
+    Files served by `send_file` (e.g. static files) are left alone.
+    """
+
+    def __init__(
+        self, *, enabled: bool, min_size: int, level: int, stream_size: int
+    ) -> None:
+        self.enabled = enabled
+        self.min_size = min_size
+        self.level = level
+        self.stream_size = stream_size
+
+    def __call__(self, response: flask.Response) -> flask.Response:
+        """An `after_request` function."""
+        if (
+            not self.enabled
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+        ):
+            return response
+
+        if response.status_code == 304:
+            # A 304 has no body, but should carry the same Vary as the 200 it stands for.
+            response.vary.add("Accept-Encoding")
+            return response
+
+        mimetype = response.mimetype or ""
+        if (
+            (mimetype not in COMPRESSIBLE_MIMETYPES and not mimetype.endswith("+json"))
+            or response.status_code < 200
+            or response.status_code == 204
+        ):
+            return response
+        response.vary.add("Accept-Encoding")
+
+        encoding = flask.request.accept_encodings.best_match(["gzip", "deflate"])
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = _compress_chunks(
+                response.response, encoding, self.level
+            )
+            response.headers.pop("Content-Length", None)
+        else:
+            body = response.get_data()
+            if len(body) < self.min_size:
+                return response
+            if len(body) >= self.stream_size:
+                response.response = _compress_chunks(_split(body), encoding, self.level)
+                response.headers.pop("Content-Length", None)
+            else:
+                compressor = _compressor(encoding, self.level)
+                response.set_data(compressor.compress(body) + compressor.flush())
+
+        response.headers["Content-Encoding"] = encoding
+        etag, is_weak = response.get_etag()
+        if etag is not None and not is_weak:
+            response.set_etag(etag, weak=True)
+
+        return response
+
+
+response_compression = ResponseCompression(
+    enabled=settings.BECKETT_COMPRESSION_ENABLED,
+    min_size=settings.BECKETT_COMPRESSION_MIN_SIZE,
+    level=settings.BECKETT_COMPRESSION_LEVEL,
+    stream_size=settings.BECKETT_COMPRESSION_STREAM_SIZE,
+)
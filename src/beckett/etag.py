@@ -0,0 +1,25 @@
+import hashlib
+
+import flask
+
+
+def body_etag(body: bytes) -> str:
+    """A strong ETag for a serialized response body."""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def version_etag(*parts: str) -> str:
+    """An ETag built from a view supplied version key and whatever else the body depends on."""
+    return hashlib.blake2b("\0".join(parts).encode(), digest_size=16).hexdigest()
+
+
+def is_not_modified(etag: str) -> bool:
+    """Whether the client already holds the representation identified by `etag`."""
+    return flask.request.if_none_match.contains_weak(etag)
+
+
+def not_modified_response(etag: str) -> flask.Response:
+    response = flask.Response(status=304)
+    response.set_etag(etag)
+
+    return response
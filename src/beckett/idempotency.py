@@ -0,0 +1,233 @@
+import hashlib
+import secrets
+import threading
+import time
+import typing
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import flask
+import structlog
+
+from src import settings
+from src.beckett.single_flight import SingleFlight
+
+log = structlog.get_logger(__name__)
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+CLIENT_ID_SESSION_KEY = "_beckett_client_id"
+
+StoreKey = typing.Tuple[str, str, str]
+"""The endpoint, the client and the `Idempotency-Key` a response is kept for."""
+
+
+@dataclass
+class StoredResponse:
+    fingerprint: bytes
+    """A hash of the request, to tell a retry from another request that reuses its key."""
+
+    body: bytes
+    status_code: int
+    headers: typing.List[typing.Tuple[str, str]]
+    expires_at: float
+
+    def as_flask_response(self, *, replayed: bool) -> flask.Response:
+        response = flask.Response(self.body, self.status_code, headers=self.headers)
+        if replayed:
+            response.headers[REPLAYED_HEADER] = "true"
+        return response
+
+
+def _request_fingerprint() -> bytes:
+    return hashlib.sha256(
+        flask.request.path.encode() + b"\0" + flask.request.get_data()
+    ).digest()
+
+
+def _client_identity() -> str:
+    """
+    Who sent the current request, as far as Beckett can tell: a hash of its credentials or, without any, of a random id
+    kept in its session. The session cookie itself can't tell clients apart, as it changes whenever the session is
+    written. When the app has no `SECRET_KEY`, and so no session, clients without credentials all share their keys.
+    """
+    credentials = flask.request.headers.get("Authorization")
+    if credentials is not None:
+        identity = f"authorization:{credentials}"
+    elif flask.current_app.secret_key:
+        client_id = flask.session.get(CLIENT_ID_SESSION_KEY)
+        if client_id is None:
+            client_id = flask.session[CLIENT_ID_SESSION_KEY] = secrets.token_urlsafe(16)
+        identity = f"session:{client_id}"
+    else:
+        identity = ""
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    The responses of `api_post(idempotent=True)` routes, by `Idempotency-Key`.
+
+    A client sends a new random key with every request and the same key when it retries it. The first successful
+    response for a key is kept for `ttl` seconds and sent again, without running the view, for the requests that
+    repeat the key. Requests that repeat a key while the first is still running wait for it and get its response,
+    whether it succeeds or not. Failed responses aren't kept, so a retry after a failure runs the view again.
+
+    Keys are scoped to the client that sent them, so one client can't replay another's response by reusing its key.
+    Clients are told apart by their credentials or a random id kept in their session, apps that know better can register
+    an `identity_loader`:
+
+        @idempotency_store.identity_loader
+        def current_user_id() -> str:
+            return str(flask.g.user.id)
+
+    Responses are kept in process, in a bounded LRU: like the response cache, every worker process has its own.
+    """
+
+    def __init__(self, *, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[StoreKey, StoredResponse] = OrderedDict()
+        self._flights: SingleFlight[typing.Tuple[StoredResponse, bool]] = SingleFlight()
+        self._identify: typing.Callable[[], str] = _client_identity
+
+        self.replays = 0
+
+    def identity_loader(
+        self, loader: typing.Callable[[], str]
+    ) -> typing.Callable[[], str]:
+        """Registers the function that tells which client sent the current request, to scope its keys to."""
+        self._identify = loader
+        return loader
+
+    def get(self, key: StoreKey) -> typing.Optional[StoredResponse]:
+        with self._lock:
+            stored = self._entries.get(key)
+            if stored is None:
+                return None
+            if stored.expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return stored
+
+    def _keep(
+        self, key: StoreKey, response: flask.Response, fingerprint: bytes
+    ) -> StoredResponse:
+        stored = StoredResponse(
+            fingerprint=fingerprint,
+            body=response.get_data(),
+            status_code=response.status_code,
+            headers=list(response.headers.items()),
+            expires_at=time.monotonic() + self.ttl,
+        )
+        if 200 <= response.status_code < 300:
+            with self._lock:
+                self._entries[key] = stored
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return stored
+
+    def _read_key(self, endpoint: str) -> typing.Union[None, flask.Response, StoreKey]:
+        """The store key of the current request, None if it has no `Idempotency-Key`, or the response to a bad one."""
+        idempotency_key = flask.request.headers.get(IDEMPOTENCY_KEY_HEADER)
+        if idempotency_key is None:
+            return None
+        if not 0 < len(idempotency_key) <= MAX_KEY_LENGTH:
+            return _bad_request(
+                f"The {IDEMPOTENCY_KEY_HEADER} header must be between 1 and {MAX_KEY_LENGTH} characters long"
+            )
+        return endpoint, self._identify(), idempotency_key
+
+    def _reply(
+        self, stored: StoredResponse, fingerprint: bytes, *, replayed: bool
+    ) -> flask.Response:
+        if stored.fingerprint != fingerprint:
+            return _unprocessable(
+                f"The {IDEMPOTENCY_KEY_HEADER} header was already used for another request"
+            )
+        if replayed:
+            self.replays += 1
+            log.debug("Replayed an idempotent response", path=flask.request.path)
+        return stored.as_flask_response(replayed=replayed)
+
+    def respond(
+        self, endpoint: str, run: typing.Callable[[], flask.Response]
+    ) -> flask.Response:
+        """The response to the current request, from `run()` or from the request whose `Idempotency-Key` it repeats."""
+        read = self._read_key(endpoint)
+        if read is None:
+            return run()
+        if isinstance(read, flask.Response):
+            return read
+        key = read
+        fingerprint = _request_fingerprint()
+
+        def run_once() -> typing.Tuple[StoredResponse, bool]:
+            # The request being retried may have finished between the lookup and the flight.
+            stored = self.get(key)
+            if stored is not None:
+                return stored, True
+            return self._keep(key, run(), fingerprint), False
+
+        stored = self.get(key)
+        replayed = True
+        if stored is None:
+            (stored, replayed), shared = self._flights.do(key, run_once)
+            replayed = replayed or shared
+        return self._reply(stored, fingerprint, replayed=replayed)
+
+    async def respond_async(
+        self, endpoint: str, run: typing.Callable[[], typing.Awaitable[flask.Response]]
+    ) -> flask.Response:
+        """The same as `respond`, for `async def` view functions."""
+        read = self._read_key(endpoint)
+        if read is None:
+            return await run()
+        if isinstance(read, flask.Response):
+            return read
+        key = read
+        fingerprint = _request_fingerprint()
+
+        async def run_once() -> typing.Tuple[StoredResponse, bool]:
+            stored = self.get(key)
+            if stored is not None:
+                return stored, True
+            return self._keep(key, await run(), fingerprint), False
+
+        stored = self.get(key)
+        replayed = True
+        if stored is None:
+            (stored, replayed), shared = await self._flights.do_async(key, run_once)
+            replayed = replayed or shared
+        return self._reply(stored, fingerprint, replayed=replayed)
+
+    def stats(self) -> typing.Dict[str, int]:
+        return {
+            "replays": self.replays,
+            "waits": self._flights.shared,
+            "entries": len(self._entries),
+        }
+
+
+def _bad_request(message: str) -> flask.Response:
+    from src.beckett.types.types import BadRequest
+    from src.beckett.types.types_manager import api_response_as_flask_response
+
+    return api_response_as_flask_response(BadRequest(message=message))
+
+
+def _unprocessable(message: str) -> flask.Response:
+    from src.beckett.types.types import UnprocessableEntity
+    from src.beckett.types.types_manager import api_response_as_flask_response
+
+    return api_response_as_flask_response(UnprocessableEntity(message=message))
+
+
+idempotency_store = IdempotencyStore(
+    ttl=settings.BECKETT_IDEMPOTENCY_TTL,
+    max_entries=settings.BECKETT_IDEMPOTENCY_MAX_ENTRIES,
+)
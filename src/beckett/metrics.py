@@ -0,0 +1,406 @@
+import bisect
+import hmac
+import threading
+import time
+import typing
+
+import flask
+
+from src import settings
+
+METRICS_URL = "/__beckett/metrics"
+METRICS_ENDPOINT = "beckett_metrics"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+"""Upper bounds, in seconds, of the phase latency buckets."""
+
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+"""Upper bounds, in bytes, of the response size buckets."""
+
+Phase = typing.Literal["validation", "view", "serialization", "ssr", "template"]
+
+
+class Histogram:
+    """A Prometheus style histogram: a count per bucket, plus the sum and count of every observation."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: typing.Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        """The number of observations in each bucket (not cumulative), the last one is `+Inf`."""
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> typing.Iterator[typing.Tuple[str, int]]:
+        """The `le` label and cumulative count of every bucket, in order."""
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield repr(float(bound)), total
+        yield "+Inf", total + self.counts[-1]
+
+
+class RouteMetrics:
+    """The latency of each phase, the responses by status code and the response sizes of one endpoint."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self._lock = threading.Lock()
+        self.phases: typing.Dict[str, Histogram] = {}
+        self.status_codes: typing.Dict[int, int] = {}
+        self.response_sizes = Histogram(SIZE_BUCKETS)
+
+    def timer(self) -> "RequestTimer":
+        """Starts timing a request, or does nothing if metrics are disabled."""
+        if not metrics.enabled:
+            return _NULL_TIMER
+        return RequestTimer(self)
+
+    def record(
+        self,
+        phases: typing.Sequence[typing.Tuple[str, float]],
+        status_code: int,
+        size: typing.Optional[int],
+    ) -> None:
+        with self._lock:
+            for phase, seconds in phases:
+                histogram = self.phases.get(phase)
+                if histogram is None:
+                    histogram = self.phases[phase] = Histogram(LATENCY_BUCKETS)
+                histogram.observe(seconds)
+            self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+            if size is not None:
+                self.response_sizes.observe(size)
+
+
+class RequestTimer:
+    """
+    Times the phases of one request. Each `mark()` ends a phase that started at the previous mark (or when the timer
+    was created), and `finish()` records every phase along with the response at once.
+    """
+
+    __slots__ = ("route", "last", "phases")
+
+    def __init__(self, route: RouteMetrics):
+        self.route = route
+        self.phases: typing.List[typing.Tuple[str, float]] = []
+        self.last = time.perf_counter()
+
+    def mark(self, phase: Phase) -> None:
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def finish(
+        self, response: flask.Response, phase: typing.Optional[Phase] = None
+    ) -> flask.Response:
+        """Marks the end of `phase`, if given, and records the response. Returns the response to make chaining easy."""
+        if phase is not None:
+            self.mark(phase)
+        # `set_data()` holds the body as a list of bytes. Anything else is streamed, its size isn't known until it has
+        # been sent (and asking werkzeug for it would buffer it).
+        body = response.response
+        size = sum(map(len, body)) if isinstance(body, list) else None
+        self.route.record(self.phases, response.status_code, size)
+        return response
+
+    def finish_streamed(self, status_code: int) -> None:
+        """
+        Records a response without its body: one whose status line was sent before it was done, once it has been sent,
+        or one flask has yet to make. `status_code` is the one it has (or would have had), e.g. a 500 for a page whose
+        view function raised.
+        """
+        self.route.record(self.phases, status_code, None)
+
+
+class _NullTimer(RequestTimer):
+    __slots__ = ()
+
+    def __init__(self):
+        pass
+
+    def mark(self, phase: Phase) -> None:
+        pass
+
+    def finish(
+        self, response: flask.Response, phase: typing.Optional[Phase] = None
+    ) -> flask.Response:
+        return response
+
+    def finish_streamed(self, status_code: int) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: typing.Any) -> str:
+    return ",".join(f'{name}="{_escape_label(str(v))}"' for name, v in labels.items())
+
+
+class Metrics:
+    """
+    Per-endpoint request metrics for `api_get`, `api_post` and `@beckett.page()` routes, served in the Prometheus text
+    format at `/__beckett/metrics`.
+
+    Recording a request costs a few `time.perf_counter()` calls and one lock, see "Metrics" in docs/api_options.md.
+    """
+
+    def __init__(self, *, enabled: bool):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._routes: typing.Dict[str, RouteMetrics] = {}
+
+    def route(self, endpoint: str) -> RouteMetrics:
+        route = self._routes.get(endpoint)
+        if route is None:
+            with self._lock:
+                route = self._routes.setdefault(endpoint, RouteMetrics(endpoint))
+        return route
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format."""
+        from src.beckett.cache import response_cache, response_flights
+        from src.beckett.idempotency import idempotency_store
+        from src.beckett.renderer.typescript_react.manifest import asset_manifest
+        from src.beckett.ssr import ssr_pool
+        from src.beckett.types.jobs import job_queue
+
+        lines: typing.List[str] = []
+
+        def histogram(
+            name: str,
+            help_text: str,
+            histograms: typing.Iterable[typing.Tuple[str, Histogram]],
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, hist in histograms:
+                for le, count in hist.cumulative_counts():
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+                lines.append(f"{name}_sum{{{labels}}} {hist.sum!r}")
+                lines.append(f"{name}_count{{{labels}}} {hist.count}")
+
+        def value(name: str, type_: str, help_text: str, number: float):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {type_}")
+            lines.append(f"{name} {number!r}")
+
+        with self._lock:
+            routes = sorted(self._routes.items())
+        # Copied under each route's lock, so every histogram is consistent with its own sum and count.
+        snapshots = []
+        for endpoint, route in routes:
+            with route._lock:
+                phases = {
+                    phase: _copy_histogram(hist) for phase, hist in route.phases.items()
+                }
+                status_codes = dict(route.status_codes)
+                sizes = _copy_histogram(route.response_sizes)
+            snapshots.append((endpoint, phases, status_codes, sizes))
+
+        histogram(
+            "beckett_request_phase_seconds",
+            "Time spent in each phase of handling a request.",
+            (
+                (_labels(endpoint=endpoint, phase=phase), hist)
+                for endpoint, phases, _, _ in snapshots
+                for phase, hist in sorted(phases.items())
+            ),
+        )
+
+        lines.append("# HELP beckett_responses_total Responses sent, by status code.")
+        lines.append("# TYPE beckett_responses_total counter")
+        for endpoint, _, status_codes, _ in snapshots:
+            for status_code, count in sorted(status_codes.items()):
+                labels = _labels(endpoint=endpoint, status_code=status_code)
+                lines.append(f"beckett_responses_total{{{labels}}} {count}")
+
+        histogram(
+            "beckett_response_size_bytes",
+            "Size of the response bodies, streamed responses excluded.",
+            (
+                (_labels(endpoint=endpoint), sizes)
+                for endpoint, _, _, sizes in snapshots
+                if sizes.count
+            ),
+        )
+
+        manifest = asset_manifest.stats()
+        value(
+            "beckett_asset_manifest_hits_total",
+            "counter",
+            "es_module() lookups that found their entrypoint.",
+            manifest["hits"],
+        )
+        value(
+            "beckett_asset_manifest_misses_total",
+            "counter",
+            "es_module() lookups for entrypoints missing from the manifest.",
+            manifest["misses"],
+        )
+        value(
+            "beckett_asset_manifest_reloads_total",
+            "counter",
+            "Times metafile.json was read.",
+            manifest["reloads"],
+        )
+        value(
+            "beckett_asset_manifest_load_seconds_total",
+            "counter",
+            "Time spent reading metafile.json.",
+            manifest["load_seconds"],
+        )
+
+        cache = response_cache.stats()
+        value(
+            "beckett_response_cache_hits_total",
+            "counter",
+            "API responses served from the response cache.",
+            cache["hits"],
+        )
+        value(
+            "beckett_response_cache_misses_total",
+            "counter",
+            "Cacheable API requests that missed the response cache.",
+            cache["misses"],
+        )
+        value(
+            "beckett_response_cache_entries",
+            "gauge",
+            "Responses currently held in the response cache.",
+            cache["entries"],
+        )
+
+        value(
+            "beckett_coalesced_requests_total",
+            "counter",
+            "api_get requests that shared the response of an identical request in progress.",
+            response_flights.shared,
+        )
+
+        idempotency = idempotency_store.stats()
+        value(
+            "beckett_idempotent_replays_total",
+            "counter",
+            "Idempotent API requests answered with the response to an earlier request with the same key.",
+            idempotency["replays"],
+        )
+        value(
+            "beckett_idempotent_waits_total",
+            "counter",
+            "Idempotent API requests that waited for a request with the same key to finish.",
+            idempotency["waits"],
+        )
+        value(
+            "beckett_idempotent_entries",
+            "gauge",
+            "Responses currently held for idempotent API requests.",
+            idempotency["entries"],
+        )
+
+        jobs = job_queue.stats()
+        value(
+            "beckett_jobs_pending",
+            "gauge",
+            "Background jobs waiting for a worker.",
+            jobs["pending"],
+        )
+        value(
+            "beckett_jobs_running",
+            "gauge",
+            "Background jobs running.",
+            jobs["running"],
+        )
+        value(
+            "beckett_jobs_finished",
+            "gauge",
+            "Finished background jobs whose results are kept.",
+            jobs["finished"],
+        )
+        value(
+            "beckett_jobs_failed_total",
+            "counter",
+            "Background jobs whose view function raised.",
+            jobs["failed"],
+        )
+        value(
+            "beckett_jobs_rejected_total",
+            "counter",
+            "Background jobs turned away because the queue was full.",
+            jobs["rejected"],
+        )
+
+        ssr = ssr_pool.stats()
+        value(
+            "beckett_ssr_renders_total",
+            "counter",
+            "Pages rendered by the SSR workers.",
+            ssr["renders"],
+        )
+        value(
+            "beckett_ssr_cache_hits_total",
+            "counter",
+            "Server side renders served from the render cache.",
+            ssr["hits"],
+        )
+        value(
+            "beckett_ssr_failures_total",
+            "counter",
+            "Server side renders that failed, and were left to the browser.",
+            ssr["failures"],
+        )
+
+        return "\n".join(lines) + "\n"
+
+
+def _copy_histogram(hist: Histogram) -> Histogram:
+    copy = Histogram(hist.buckets)
+    copy.counts = list(hist.counts)
+    copy.sum = hist.sum
+    copy.count = hist.count
+    return copy
+
+
+def handle_metrics() -> flask.Response:
+    """
+    Serves the metrics to requests with the `BECKETT_METRICS_TOKEN` as a bearer token. Without a token set the endpoint
+    is off, metrics are still recorded.
+    """
+    token = settings.BECKETT_METRICS_TOKEN
+    if not metrics.enabled or not token:
+        flask.abort(404)
+    authorization = flask.request.headers.get("Authorization", "")
+    if not hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode()):
+        flask.abort(401)
+    return flask.Response(metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+metrics = Metrics(enabled=settings.BECKETT_METRICS_ENABLED)
@@ -31,7 +31,7 @@ class TypescriptImports:
         for module, declarations in sorted(self):
             out += "// prettier-ignore\n"
             out += "import {"
-            out += ", ".join(declarations)
+            out += ", ".join(sorted(declarations))
             out += "} from "
             out += json.dumps(module)
             out += "\n"
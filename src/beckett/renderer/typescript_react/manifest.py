@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import typing
+
+import flask
+import structlog
+
+from src import settings
+
+log = structlog.getLogger(__name__)
+
+
+class AssetManifest:
+    """
+    An in-memory view of the esbuild `metafile.json`.
+
+    The manifest is read from disk once and every entrypoint is resolved to its static URL up front, so `es_module()`
+    lookups during a render are a single dict access.
+
+    `build.mjs` also records the chunks each entrypoint imports, see `module_preloads()`. Manifests written before it
+    did (a flat map of entrypoint to file) are still read, their entrypoints just have no chunks to preload.
+
+    In development the file is re-stat'ed on lookup and reloaded when its mtime or inode changes (esbuild rewrites it
+    on every rebuild). In production it is only ever read once.
+    """
+
+    def __init__(self, path: str, *, auto_reload: bool = False):
+        self.path = path
+        self.auto_reload = auto_reload
+
+        self._lock = threading.Lock()
+        self._stat_key: typing.Optional[typing.Tuple[int, int]] = None
+        self._urls: typing.Optional[typing.Dict[str, str]] = None
+        self._imports: typing.Dict[str, typing.Tuple[str, ...]] = {}
+        self._preloads: typing.Dict[typing.Tuple[str, ...], typing.Tuple[str, ...]] = {}
+
+        self.version = ""
+        """A hash of the manifest contents, changes whenever the built assets do."""
+
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.load_seconds = 0.0
+
+    def _read_stat_key(self) -> typing.Tuple[int, int]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError as e:
+            raise Exception(
+                "`metafile.json` is missing. Have you run 'make web'?"
+            ) from e
+
+        return stat.st_mtime_ns, stat.st_ino
+
+    def _load(self, stat_key: typing.Tuple[int, int]) -> typing.Dict[str, str]:
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock.
+            if self._urls is not None and self._stat_key == stat_key:
+                return self._urls
+
+            start = time.perf_counter()
+            try:
+                with open(self.path, "rb") as fh:
+                    raw_metafile = fh.read()
+            except FileNotFoundError as e:
+                raise Exception(
+                    "`metafile.json` is missing. Have you run 'make web'?"
+                ) from e
+
+            metafile = json.loads(raw_metafile)
+            if "version" not in metafile:
+                entrypoints = {
+                    name: {"file": filename, "imports": []}
+                    for name, filename in metafile.items()
+                }
+            else:
+                entrypoints = metafile["entryPoints"]
+
+            urls = {
+                name: flask.url_for("static", filename=entrypoint["file"])
+                for name, entrypoint in entrypoints.items()
+            }
+
+            self._imports = {
+                name: tuple(
+                    flask.url_for("static", filename=filename)
+                    for filename in entrypoint["imports"]
+                )
+                for name, entrypoint in entrypoints.items()
+            }
+            self._preloads = {}
+            self._urls = urls
+            self.version = hashlib.blake2b(raw_metafile, digest_size=8).hexdigest()
+            self._stat_key = stat_key
+            self.reloads += 1
+            self.load_seconds += time.perf_counter() - start
+
+            log.info("Loaded asset manifest", path=self.path, entrypoints=len(urls))
+
+            return urls
+
+    def _get_urls(self) -> typing.Dict[str, str]:
+        urls = self._urls
+        if urls is None:
+            return self._load(self._read_stat_key())
+        if self.auto_reload:
+            stat_key = self._read_stat_key()
+            if stat_key != self._stat_key:
+                return self._load(stat_key)
+        return urls
+
+    def es_module(self, name: str) -> str:
+        """
+        Returns the built static file path for a given original TS file
+
+        es_module("js/Example.tsx") -> "/static/Example-ABD123.js"
+        """
+        urls = self._get_urls()
+        try:
+            url = urls[name]
+        except KeyError:
+            self.misses += 1
+            raise KeyError(
+                f"'{name}' isn't defined in the metafile and hasn't been built. Do you need to run 'make web'?"
+            )
+
+        self.hits += 1
+        return url
+
+    def module_preloads(self, *names: str) -> typing.Tuple[str, ...]:
+        """
+        The URLs of the entrypoints `names` and of every chunk they import, without duplicates: everything the browser
+        will have to fetch before it can run them.
+
+        module_preloads("src/js/beckett_page.tsx") -> ("/static/js/beckett_page-ABD123.js", "/static/js/chunk-XYZ.js")
+        """
+        preloads = self._preloads.get(names)
+        if preloads is None or self.auto_reload:
+            urls = [self.es_module(name) for name in names]
+            for name in names:
+                urls.extend(self._imports[name])
+            preloads = tuple(dict.fromkeys(urls))
+            self._preloads[names] = preloads
+        return preloads
+
+    def get_version(self) -> str:
+        """The current manifest version, loading (or reloading) the manifest first if needed."""
+        self._get_urls()
+        return self.version
+
+    def stats(self) -> typing.Dict[str, float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "load_seconds": self.load_seconds,
+        }
+
+
+asset_manifest = AssetManifest(
+    settings.BECKETT_METAFILE_PATH, auto_reload=settings.in_dev_environment
+)
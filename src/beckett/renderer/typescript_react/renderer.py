@@ -1,18 +1,42 @@
 from __future__ import annotations
 
+import os
 import typing
 from os.path import exists
 from pathlib import Path
 
 import flask
 import structlog
+from markupsafe import Markup
 
 from src import settings
 from src.app import app
+from src.beckett.renderer.typescript_react.type_files import generated_type_files
 from src.utils import unwrap
 
 log = structlog.getLogger(__name__)
 
+_SCRIPT_UNSAFE_JSON_CHARACTERS = (
+    ("<", "\\u003c"),
+    (">", "\\u003e"),
+    ("&", "\\u0026"),
+    ("\u2028", "\\u2028"),
+    ("\u2029", "\\u2029"),
+)
+
+
+def script_safe_json(json_string: str) -> Markup:
+    """
+    Make an already serialized JSON document safe to inline in a <script> tag.
+
+    The characters that could close the tag or be misread by the HTML parser are replaced with their JSON unicode
+    escapes, so the result is still the same JSON document and can be handed to JSON.parse() as is.
+    """
+    for character, escaped in _SCRIPT_UNSAFE_JSON_CHARACTERS:
+        if character in json_string:
+            json_string = json_string.replace(character, escaped)
+    return Markup(json_string)
+
 
 def build_render_context_for_base_template() -> typing.Dict[str, typing.Any]:
     """
@@ -32,9 +56,9 @@ def build_render_context_for_base_template() -> typing.Dict[str, typing.Any]:
 def write_react_page_file(module: str, endpoint: str) -> None:
     """
     Create a simple template file for a React page component if one does not exist yet.
-    Will only run if ENVIRONMENT is set to development
+    Will only run if ENVIRONMENT is set to development (or types are being generated from the CLI)
     """
-    if not settings.in_dev_environment:
+    if not generated_type_files.enabled:
         return
     react_page_file_path = (
         Path(app.root_path) / "js" / "template" / module / f"{endpoint}.tsx"
@@ -42,6 +66,9 @@ def write_react_page_file(module: str, endpoint: str) -> None:
     template_path = Path(app.root_path) / "template" / "beckett_page.template"
 
     if not exists(react_page_file_path):
+        if generated_type_files.check_only:
+            generated_type_files.stale.append(str(react_page_file_path))
+            return
         log.info(
             "Creating new beckett page for this endpoint",
             module=module,
@@ -63,54 +90,39 @@ def write_typescript_file(
     *,
     module: str,
     endpoint: str,
-    type_data: typing.Optional[str],
+    fingerprint: str,
+    generate_type_data: typing.Callable[[], typing.Optional[str]],
 ) -> None:
     """Intelligently writes typing data to the named file.
 
-    Ensures the directory the file is meant to be in is created, if it doesn't exist already, and removes the directory
-    the file was meant to be in if the file has been removed because the type data is gone.
-
-    Only writes the file if the type data has changed to prevent excessive writes.
+    The type data is only generated when `fingerprint` (see `type_fingerprint`) differs from the one the file was last
+    written from, or the file changed on disk since. The file is only written if the type data has changed, to prevent
+    excessive writes, and is replaced atomically. If there's no type data any more the file is removed, along with its
+    directory if that is now empty.
 
-    Doesn't attempt to write the files unless the server is running in development mode.
+    Doesn't attempt to write the files unless the server is running in development mode (or types are being generated
+    from the CLI).
     """
-    if settings.ENVIRONMENT != "development":
+    if not generated_type_files.enabled:
         return
 
-    typescript_file_path = (
-        Path(app.root_path) / "js" / "template" / module / f"{endpoint}.type.ts"
-    ).resolve()
-    try:
-        with typescript_file_path.open() as fh:
-            existing_type_data = fh.read()
-    except IOError:
-        existing_type_data = None
-
-    if type_data != existing_type_data:
-        if type_data:
-            log.info(
-                "writing new type data",
-                module=module,
-                endpoint=endpoint,
-                filename=str(typescript_file_path),
-            )
-
-            # Create the directory if it's not already there.
-            typescript_file_path.parent.mkdir(exist_ok=True)
-
-            with typescript_file_path.open("w") as fh:
-                fh.write(type_data)
-        else:
-            log.info(
-                "removing type data",
-                module=module,
-                endpoint=endpoint,
-                filename=str(typescript_file_path),
-            )
-
-            typescript_file_path.unlink()
+    typescript_file_path = str(
+        (
+            Path(app.root_path) / "js" / "template" / module / f"{endpoint}.type.ts"
+        ).resolve()
+    )
+    if generated_type_files.is_fresh(typescript_file_path, fingerprint):
+        return
 
-            # Remove the directory if empty. The pythonic way might be to try it and catch the exception, but in this
-            # case we'd rather not even try if we have even an inkling that there might still be a file in there.
-            if any(typescript_file_path.parent.iterdir()):
-                typescript_file_path.parent.rmdir()
+    type_data = generate_type_data()
+    generated_type_files.write(typescript_file_path, type_data, fingerprint)
+
+    # Remove the directory if the type data is gone and nothing else is left in it.
+    directory = os.path.dirname(typescript_file_path)
+    if (
+        type_data is None
+        and not generated_type_files.check_only
+        and os.path.isdir(directory)
+        and not any(os.scandir(directory))
+    ):
+        os.rmdir(directory)
@@ -0,0 +1,139 @@
+import re
+import secrets
+import typing
+from dataclasses import dataclass
+
+import flask
+from markupsafe import Markup, escape
+
+from src import settings
+
+REQUEST_SLOTS = ("script_nonce",)
+"""Template variables that the app's context processors set per request, which every shell has a slot for."""
+
+
+def request_slots(template: str) -> typing.Dict[str, str]:
+    """The values of `REQUEST_SLOTS` for the current request, escaped like Jinja would in `template`."""
+    app = flask.current_app
+    context: typing.Dict[str, typing.Any] = {}
+    app.update_template_context(context)
+    autoescape = app.jinja_env.autoescape
+    if callable(autoescape):
+        autoescape = autoescape(template)
+    values = {}
+    for name in REQUEST_SLOTS:
+        value = context.get(name, "")
+        values[name] = str(escape(value) if autoescape else value)
+    return values
+
+
+@dataclass
+class PageShell:
+    version: typing.Hashable
+    segments: typing.List[bytes]
+    """The static parts of the page, one more than there are slots."""
+
+    slots: typing.List[str]
+    """The name of the slot after each segment but the last."""
+
+    def join(
+        self, slots: typing.Mapping[str, typing.Optional[str]], *, head: bool = True
+    ) -> bytes:
+        """
+        The page with the values of `slots` between its segments. With `head=False` the first segment is left out,
+        for a page whose head has already been sent.
+        """
+        segments = self.segments
+        body = [segments[0]] if head else []
+        for name, segment in zip(self.slots, segments[1:]):
+            body.append(typing.cast(str, slots[name]).encode())
+            body.append(segment)
+        return b"".join(body)
+
+
+class PageShells:
+    """
+    The HTML around a page's props, rendered once per endpoint and kept as byte segments.
+
+    Everything in `beckett_page.jinja2` other than the props (and the server rendered HTML) only depends on the
+    endpoint and the built assets. So instead of running the template for every request, it's rendered once with
+    placeholders in the slots, split around them, and a request only joins the segments with its own slot values.
+
+    The template is rendered again when `version` changes (e.g. a new asset manifest). The `REQUEST_SLOTS`, such as
+    the CSP nonce, are filled in for every request. Requests with pending flash messages are rendered with Jinja as
+    usual, as is everything when disabled. Shells are opt-in with `BECKETT_PAGE_SHELL_ENABLED=1`, for apps whose
+    templates don't depend on the request in any other way (e.g. the current user).
+    """
+
+    def __init__(self, *, enabled: bool):
+        self.enabled = enabled
+        self._shells: typing.Dict[typing.Tuple[typing.Any, ...], PageShell] = {}
+
+    def applies(self) -> bool:
+        """Whether the current request can be rendered from a shell."""
+        # The flashes are shown by base.jinja2, and only read (and removed) from the session when they are shown.
+        return self.enabled and "_flashes" not in flask.session
+
+    def _build(
+        self,
+        template: str,
+        version: typing.Hashable,
+        context: typing.Dict[str, typing.Any],
+        slots: typing.Mapping[str, typing.Optional[str]],
+    ) -> PageShell:
+        token = secrets.token_hex(8)
+        placeholders = {
+            name: None if value is None else Markup(f"<!--{token}:{name}-->")
+            for name, value in {**dict.fromkeys(REQUEST_SLOTS, ""), **slots}.items()
+        }
+        html = flask.render_template(template, **context, **placeholders)
+        parts = re.split(f"<!--{token}:(\\w+)-->", html)
+        return PageShell(
+            version=version,
+            segments=[part.encode() for part in parts[0::2]],
+            slots=parts[1::2],
+        )
+
+    def get(
+        self,
+        template: str,
+        *,
+        version: typing.Hashable,
+        context: typing.Dict[str, typing.Any],
+        slots: typing.Mapping[str, typing.Optional[str]],
+    ) -> PageShell:
+        """
+        The shell of `template` rendered with `context`, with a slot for every one of `slots` that isn't None and for
+        the `REQUEST_SLOTS`.
+
+        It's reused for every request to the same endpoint with the same `version` and the same empty slots, so
+        `context` must only depend on those. When the shell doesn't apply to the request it's rendered for it alone.
+        """
+        if not self.applies():
+            return self._build(template, version, context, slots)
+
+        key = (
+            flask.request.endpoint,
+            template,
+            tuple(name for name, value in slots.items() if value is None),
+        )
+        shell = self._shells.get(key)
+        if shell is None or shell.version != version:
+            shell = self._shells[key] = self._build(template, version, context, slots)
+        return shell
+
+    def render(
+        self,
+        template: str,
+        *,
+        version: typing.Hashable,
+        context: typing.Dict[str, typing.Any],
+        slots: typing.Mapping[str, typing.Optional[str]],
+    ) -> bytes:
+        """Renders `template` with `context` and `slots`, see `get()`."""
+        return self.get(template, version=version, context=context, slots=slots).join(
+            {**slots, **request_slots(template)}
+        )
+
+
+page_shells = PageShells(enabled=settings.BECKETT_PAGE_SHELL_ENABLED)
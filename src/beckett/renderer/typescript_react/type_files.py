@@ -0,0 +1,218 @@
+import enum
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import typing
+
+import structlog
+from pydantic import BaseModel
+
+from src import settings
+
+log = structlog.getLogger(__name__)
+
+CACHE_VERSION = 6
+"""Bump whenever the generated TypeScript changes for the same Python types, so old cache entries are discarded."""
+
+
+def type_fingerprint(*types: typing.Any) -> str:
+    """
+    A hash of everything about `types` that ends up in a generated TypeScript interface: model names, field names and
+    annotations, enum values, recursively through nested models.
+
+    This is much cheaper than `model_json_schema()` and is stable between runs, so it can be stored on disk.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    seen: typing.Set[type] = set()
+
+    def visit(type_: typing.Any) -> None:
+        if isinstance(type_, type) and issubclass(type_, BaseModel):
+            name = f"{type_.__module__}.{type_.__qualname__}"
+            if type_ in seen:
+                digest.update(f"ref:{name}\0".encode())
+                return
+            seen.add(type_)
+            digest.update(f"model:{name}\0".encode())
+            if getattr(type_, "columnar", False):
+                # Columnar responses get a decoder, see `APIResponse.columnar`.
+                digest.update(b"columnar\0")
+            for field_name, field_info in type_.model_fields.items():
+                digest.update(f"{field_name}:{field_info.annotation!r}\0".encode())
+                visit(field_info.annotation)
+        elif isinstance(type_, enum.EnumMeta):
+            digest.update(repr([member.value for member in type_]).encode())  # type: ignore
+        else:
+            digest.update(f"{type_!r}\0".encode())
+            for arg in typing.get_args(type_):
+                visit(arg)
+
+    for type_ in types:
+        visit(type_)
+
+    return digest.hexdigest()
+
+
+def combine_fingerprints(*parts: str) -> str:
+    """A fingerprint of several fingerprints (or any other strings), in order."""
+    return hashlib.blake2b("\0".join(parts).encode(), digest_size=16).hexdigest()
+
+
+def write_file_atomically(path: str, content: str) -> bool:
+    """
+    Writes `content` to `path` unless the file already holds exactly that. Returns whether the file was written.
+
+    The content is written to a temporary file next to `path` and renamed over it, so file watchers (esbuild, tsc)
+    never see a half written file.
+    """
+    data = content.encode()
+    mode = 0o644
+    try:
+        with open(path, "rb") as fh:
+            if fh.read() == data:
+                return False
+            mode = os.stat(fh.fileno()).st_mode & 0o777
+    except FileNotFoundError:
+        pass
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        # mkstemp creates the file readable by its owner only.
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    return True
+
+
+class GeneratedTypeFiles:
+    """
+    Writes the generated TypeScript files, remembering on disk which type fingerprint each one was generated from.
+
+    When the fingerprint of a file is unchanged, and the file hasn't been touched since it was written, there's no
+    need to generate its contents again. The cache also holds generated fragments (e.g. one route's interfaces) so
+    `types.ts` only regenerates the routes whose types changed.
+
+    Files are only generated when `enabled`, which is the case in development. In `check_only` mode nothing is
+    written: files that would have changed are collected in `stale` instead.
+    """
+
+    def __init__(self, cache_path: str, *, enabled: bool = False):
+        self.cache_path = cache_path
+        self.enabled = enabled
+        self.check_only = False
+        self.stale: typing.List[str] = []
+
+        self._lock = threading.RLock()
+        self._cache: typing.Optional[typing.Dict[str, typing.Any]] = None
+
+    def _get_cache(self) -> typing.Dict[str, typing.Any]:
+        with self._lock:
+            if self._cache is None:
+                try:
+                    with open(self.cache_path) as fh:
+                        cache = json.load(fh)
+                except (FileNotFoundError, ValueError):
+                    cache = {}
+                if cache.get("version") != CACHE_VERSION:
+                    cache = {"version": CACHE_VERSION, "files": {}, "fragments": {}}
+                self._cache = cache
+            return self._cache
+
+    def _save(self) -> None:
+        if self.check_only:
+            return
+        with self._lock:
+            write_file_atomically(
+                self.cache_path, json.dumps(self._get_cache(), sort_keys=True)
+            )
+
+    @staticmethod
+    def _stat_key(path: str) -> typing.Optional[typing.List[int]]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def is_fresh(self, path: str, fingerprint: str) -> bool:
+        """Whether `path` was generated from `fingerprint` and hasn't changed on disk since."""
+        entry = self._get_cache()["files"].get(path)
+        return (
+            entry is not None
+            and entry["fingerprint"] == fingerprint
+            and entry["stat"] == self._stat_key(path)
+        )
+
+    def write(self, path: str, content: typing.Optional[str], fingerprint: str) -> bool:
+        """
+        Brings `path` up to date with `content` (None removes the file), and remembers `fingerprint` for it.
+
+        Returns whether the file was (or, in `check_only` mode, would have been) changed.
+        """
+        if content is None:
+            changed = os.path.exists(path)
+            if changed and not self.check_only:
+                os.unlink(path)
+        elif self.check_only:
+            try:
+                with open(path) as fh:
+                    changed = fh.read() != content
+            except FileNotFoundError:
+                changed = True
+        else:
+            changed = write_file_atomically(path, content)
+
+        if self.check_only:
+            if changed:
+                self.stale.append(path)
+            return changed
+
+        with self._lock:
+            files = self._get_cache()["files"]
+            stat_key = self._stat_key(path)
+            if stat_key is None:
+                files.pop(path, None)
+            else:
+                files[path] = {"fingerprint": fingerprint, "stat": stat_key}
+            self._save()
+
+        if changed:
+            log.info("Wrote generated types", filename=path)
+        return changed
+
+    def prune_fragments(self, prefix: str, keep: typing.Collection[str]) -> None:
+        """Forgets the fragments under `prefix` that aren't in `keep` (e.g. the routes that have been removed)."""
+        with self._lock:
+            fragments = self._get_cache()["fragments"]
+            for key in [k for k in fragments if k.startswith(prefix) and k not in keep]:
+                del fragments[key]
+
+    def get_fragment(self, key: str, fingerprint: str) -> typing.Optional[typing.Any]:
+        """A previously generated piece of output, if it was generated from `fingerprint`."""
+        entry = self._get_cache()["fragments"].get(key)
+        if entry is None or entry["fingerprint"] != fingerprint:
+            return None
+        return entry["value"]
+
+    def set_fragment(self, key: str, fingerprint: str, value: typing.Any) -> None:
+        """Remembers a generated piece of output (anything JSON serializable). It's saved with the next file write."""
+        with self._lock:
+            self._get_cache()["fragments"][key] = {
+                "fingerprint": fingerprint,
+                "value": value,
+            }
+
+
+generated_type_files = GeneratedTypeFiles(
+    settings.BECKETT_TYPES_CACHE_PATH, enabled=settings.in_dev_environment
+)
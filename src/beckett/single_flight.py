@@ -0,0 +1,123 @@
+import asyncio
+import threading
+import typing
+
+T = typing.TypeVar("T")
+
+
+class _Flight(typing.Generic[T]):
+    """One call in progress, that the calls with the same key wait for."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._result: typing.Optional[T] = None
+        self._error: typing.Optional[BaseException] = None
+        self._futures: typing.List[asyncio.Future] = []
+
+    def land(self, result: typing.Optional[T], error: typing.Optional[BaseException]):
+        with self._lock:
+            self._result, self._error = result, error
+            self._done.set()
+            futures, self._futures = self._futures, []
+        # The waiters may be on other threads' event loops.
+        for future in futures:
+            future.get_loop().call_soon_threadsafe(_wake, future)
+
+    def _outcome(self) -> T:
+        if self._error is not None:
+            raise self._error
+        return typing.cast(T, self._result)
+
+    def wait(self) -> T:
+        self._done.wait()
+        return self._outcome()
+
+    async def wait_async(self) -> T:
+        with self._lock:
+            if self._done.is_set():
+                return self._outcome()
+            future = asyncio.get_running_loop().create_future()
+            self._futures.append(future)
+        await future
+        return self._outcome()
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class SingleFlight(typing.Generic[T]):
+    """
+    Runs a function once for concurrent calls with the same key.
+
+    The first call for a key runs the function, and the calls made with that key while it runs wait for it and get
+    its result, or its exception, instead of running it again. Nothing is kept once it returns: the next call runs it
+    again. Callers can wait from threads (`do`) and from event loops (`do_async`), whichever runs the function:
+
+        flights: SingleFlight[bytes] = SingleFlight()
+        body, shared = flights.do(("books", author), lambda: render_books(author))
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: typing.Dict[typing.Hashable, _Flight[T]] = {}
+        self.shared = 0
+
+    def _join(self, key: typing.Hashable) -> typing.Tuple[_Flight[T], bool]:
+        """The flight in progress for `key`, or a new one, and whether the caller has to run it."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.shared += 1
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            return flight, True
+
+    def _land(
+        self,
+        key: typing.Hashable,
+        flight: _Flight[T],
+        result: typing.Optional[T],
+        error: typing.Optional[BaseException],
+    ) -> None:
+        with self._lock:
+            del self._flights[key]
+        flight.land(result, error)
+
+    def do(
+        self, key: typing.Hashable, fn: typing.Callable[[], T]
+    ) -> typing.Tuple[T, bool]:
+        """
+        The result of `fn()`, run by this call or by a concurrent one with the same key, and whether it was shared
+        from another call.
+        """
+        flight, leader = self._join(key)
+        if not leader:
+            return flight.wait(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self._land(key, flight, None, e)
+            raise
+        self._land(key, flight, result, None)
+        return result, False
+
+    async def do_async(
+        self, key: typing.Hashable, fn: typing.Callable[[], typing.Awaitable[T]]
+    ) -> typing.Tuple[T, bool]:
+        """The same as `do`, awaiting `fn()` and the calls in progress without blocking the event loop."""
+        flight, leader = self._join(key)
+        if not leader:
+            return await flight.wait_async(), True
+        try:
+            result = await fn()
+        except BaseException as e:
+            self._land(key, flight, None, e)
+            raise
+        self._land(key, flight, result, None)
+        return result, False
+
+    def in_flight(self) -> int:
+        return len(self._flights)
@@ -0,0 +1,158 @@
+import json
+import typing
+from dataclasses import asdict, dataclass
+
+import structlog
+
+from src import settings
+from src.beckett.renderer.typescript_react.type_files import (
+    combine_fingerprints,
+    type_fingerprint,
+    write_file_atomically,
+)
+
+log = structlog.get_logger(__name__)
+
+SNAPSHOT_VERSION = 2
+
+
+@dataclass(frozen=True)
+class RouteSnapshotEntry:
+    method: str
+    url: str
+    streaming: bool
+    """Whether the route returns a `StreamingAPIResponse`."""
+
+    fingerprint: str
+    """The `type_fingerprint` of the route's request model and response types when the snapshot was built."""
+
+    declaration: str
+    """The `declaration_fingerprint` of the route's view function when the snapshot was built."""
+
+
+def declaration_fingerprint(func: typing.Callable) -> str:
+    """
+    A fingerprint of a view function's annotations as they are written, cheap enough to compare for every route as it's
+    declared: string annotations aren't evaluated and no request model is built. Models that are annotated by name
+    (as a string) are only checked against the snapshot's `fingerprint`, once the route is resolved.
+    """
+    annotations = func.__annotations__
+    return combine_fingerprints(*annotations, type_fingerprint(*annotations.values()))
+
+
+class RouteSnapshot:
+    """
+    The resolved API routes and pages, as recorded by `python server.py snapshot` at build time.
+
+    Resolving a route's types (`typing.get_type_hints`, building the request model with `create_model`) and checking
+    a page's props is what makes importing the views slow. When a route is in the snapshot, those checks have already
+    passed at build time, so in production its types are only resolved on its first request and pages skip them
+    entirely.
+
+    Routes that aren't in the snapshot (or when there is no snapshot) are resolved at import time, as in development.
+    So are routes whose annotations changed since the snapshot was built, see `declaration_fingerprint`.
+    """
+
+    def __init__(self, path: str, *, enabled: bool):
+        self.path = path
+        self.enabled = enabled
+
+        self._routes: typing.Optional[typing.Dict[str, RouteSnapshotEntry]] = None
+        self._pages: typing.FrozenSet[str] = frozenset()
+
+    def _load(self) -> typing.Dict[str, RouteSnapshotEntry]:
+        if self._routes is not None:
+            return self._routes
+
+        self._routes = {}
+        if not self.enabled:
+            return self._routes
+
+        try:
+            with open(self.path) as fh:
+                snapshot = json.load(fh)
+        except FileNotFoundError:
+            log.info(
+                "No route snapshot, route types are resolved at import time",
+                path=self.path,
+            )
+            return self._routes
+
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            log.warning(
+                "Ignoring route snapshot from another version, run `python server.py snapshot`",
+                path=self.path,
+            )
+            return self._routes
+
+        self._routes = {
+            endpoint: RouteSnapshotEntry(**entry)
+            for endpoint, entry in snapshot["routes"].items()
+        }
+        self._pages = frozenset(snapshot["pages"])
+        log.info(
+            "Loaded route snapshot",
+            path=self.path,
+            routes=len(self._routes),
+            pages=len(self._pages),
+        )
+        return self._routes
+
+    def get_route(
+        self, endpoint: str, method: str
+    ) -> typing.Optional[RouteSnapshotEntry]:
+        entry = self._load().get(endpoint)
+        if entry is None or entry.method != method:
+            return None
+        return entry
+
+    def has_page(self, endpoint: str) -> bool:
+        self._load()
+        return endpoint in self._pages
+
+
+def build_route_snapshot() -> typing.Dict[str, typing.Any]:
+    """Snapshots every route and page registered so far, resolving the types of every route."""
+    from src.beckett.types.types_manager import api_route_type_manager
+
+    routes = {}
+    for endpoint, definition in sorted(api_route_type_manager.get_routes().items()):
+        resolved = definition.types.resolve()
+        routes[endpoint] = asdict(
+            RouteSnapshotEntry(
+                method=definition.method,
+                url=definition.url,
+                streaming=definition.is_streaming,
+                fingerprint=resolved.fingerprint,
+                declaration=definition.types.declaration,
+            )
+        )
+
+    return {
+        "version": SNAPSHOT_VERSION,
+        "routes": routes,
+        "pages": sorted(api_route_type_manager.get_page_endpoints()),
+    }
+
+
+def _route_snapshot_json() -> str:
+    return json.dumps(build_route_snapshot(), indent=2, sort_keys=True) + "\n"
+
+
+def write_route_snapshot(path: str) -> bool:
+    """Writes the snapshot of the routes registered so far to `path`, returning whether it changed."""
+    return write_file_atomically(path, _route_snapshot_json())
+
+
+def is_route_snapshot_fresh(path: str) -> bool:
+    """Whether the snapshot at `path` is the one `write_route_snapshot` would write, without writing it."""
+    try:
+        with open(path) as fh:
+            return fh.read() == _route_snapshot_json()
+    except FileNotFoundError:
+        return False
+
+
+route_snapshot = RouteSnapshot(
+    settings.BECKETT_ROUTE_SNAPSHOT_PATH, enabled=not settings.in_dev_environment
+)
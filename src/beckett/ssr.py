@@ -0,0 +1,295 @@
+import hashlib
+import json
+import os
+import queue
+import subprocess
+import threading
+import time
+import typing
+from collections import OrderedDict
+
+import structlog
+
+from src import settings
+
+log = structlog.get_logger(__name__)
+
+
+class SSRError(Exception):
+    pass
+
+
+class SSRWorker:
+    """
+    One long-lived Node process running `ssr_worker.mjs`, which renders a page for every JSON line written to its
+    stdin and answers with a JSON line on its stdout.
+
+    A worker handles one request at a time, the pool hands it to a single thread at once.
+    """
+
+    def __init__(self, command: typing.Sequence[str]):
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        self._next_id = 0
+        self.answered_at = time.monotonic()
+        # Lines are read by a thread, so waiting for a response can time out.
+        self._lines: "queue.Queue[typing.Optional[bytes]]" = queue.Queue()
+        threading.Thread(
+            target=self._read_lines, name="beckett-ssr-reader", daemon=True
+        ).start()
+
+    def _read_lines(self) -> None:
+        for line in typing.cast(typing.IO[bytes], self.process.stdout):
+            self._lines.put(line)
+        self._lines.put(None)
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def request(self, message: bytes, timeout: float) -> typing.Dict[str, typing.Any]:
+        """
+        Sends `message`, a JSON object without its opening brace (the id is added in front of it), and waits up to
+        `timeout` seconds for the answer.
+        """
+        self._next_id += 1
+        request_id = self._next_id
+        stdin = typing.cast(typing.IO[bytes], self.process.stdin)
+        try:
+            stdin.write(b'{"id":%d,%s\n' % (request_id, message))
+            stdin.flush()
+        except OSError as e:
+            raise SSRError("The SSR worker isn't running") from e
+
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                line = self._lines.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                raise SSRError(f"The SSR worker didn't answer within {timeout}s")
+            if line is None:
+                raise SSRError("The SSR worker exited")
+            response = json.loads(line)
+            if response.get("id") == request_id:
+                self.answered_at = time.monotonic()
+                return response
+
+    def stop(self) -> None:
+        self.process.kill()
+        self.process.wait()
+
+
+class SSRPool:
+    """
+    Renders `@beckett.page(ssr=True)` pages to HTML with a pool of Node processes, see `ssr_worker.tsx`.
+
+    * The processes are started on the first render, and replaced when they die, time out or (when `auto_reload`) the
+      server build changes.
+    * A process that hasn't answered for `health_check_interval` seconds is pinged when it's taken out of the pool,
+      and replaced if it doesn't answer. The others stay in the pool meanwhile.
+    * Renders are cached in an LRU of `cache_size` entries, keyed on a hash of the entrypoint, props, base data and
+      server build, so a rebuild doesn't serve HTML that the new bundle can't hydrate.
+    * Every failure (Node missing, the page throwing, a timeout, no idle process) is logged and `render` returns None:
+      the page is then rendered in the browser, as without SSR.
+    """
+
+    def __init__(
+        self,
+        *,
+        node: str,
+        worker_path: str,
+        build_stamp_path: str,
+        size: int,
+        timeout: float,
+        cache_size: int,
+        health_check_interval: float,
+        auto_reload: bool = False,
+    ):
+        self.command = [node, worker_path]
+        self.worker_path = worker_path
+        self.build_stamp_path = build_stamp_path
+        self.size = size
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.health_check_interval = health_check_interval
+        self.auto_reload = auto_reload
+
+        self._lock = threading.Lock()
+        self._started = False
+        self._available = True
+        # None is a free slot, its process is started when it's checked out.
+        self._idle: "queue.LifoQueue[typing.Optional[SSRWorker]]" = queue.LifoQueue()
+        self._build_stamps: typing.Dict[SSRWorker, typing.Optional[int]] = {}
+
+        self._cache_lock = threading.Lock()
+        self._cache: OrderedDict[str, str] = OrderedDict()
+
+        self.hits = 0
+        self.renders = 0
+        self.failures = 0
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            for _ in range(self.size):
+                self._idle.put(None)
+            self._started = True
+
+    def _read_build_stamp(self) -> typing.Optional[int]:
+        try:
+            return os.stat(self.build_stamp_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _spawn(self) -> typing.Optional[SSRWorker]:
+        if not os.path.exists(self.worker_path):
+            log.warning(
+                "The SSR worker hasn't been built. Have you run 'make web'?",
+                path=self.worker_path,
+            )
+            return None
+        build_stamp = self._read_build_stamp()
+        try:
+            worker = SSRWorker(self.command)
+        except OSError as e:
+            # Most likely Node isn't installed. There's no point trying again for every request.
+            log.error("Couldn't start the SSR worker", command=self.command, error=e)
+            self._available = False
+            return None
+        self._build_stamps[worker] = build_stamp
+        log.info("Started SSR worker", pid=worker.process.pid)
+        return worker
+
+    def _retire(self, worker: typing.Optional[SSRWorker]) -> None:
+        if worker is not None:
+            worker.stop()
+            self._build_stamps.pop(worker, None)
+
+    def _checkout(self) -> typing.Optional[SSRWorker]:
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            log.warning("Every SSR worker is busy", workers=self.size)
+            return None
+
+        if worker is not None and (
+            not worker.is_alive()
+            or (
+                self.auto_reload
+                and self._build_stamps.get(worker) != self._read_build_stamp()
+            )
+        ):
+            self._retire(worker)
+            worker = None
+        if (
+            worker is not None
+            and time.monotonic() - worker.answered_at > self.health_check_interval
+            and not self._ping(worker)
+        ):
+            self._retire(worker)
+            worker = None
+        if worker is None:
+            worker = self._spawn()
+            if worker is None:
+                self._idle.put(None)
+        return worker
+
+    def _ping(self, worker: SSRWorker) -> bool:
+        try:
+            worker.request(b'"type":"ping"}', self.timeout)
+        except SSRError as e:
+            log.warning(
+                "SSR worker failed its health check",
+                pid=worker.process.pid,
+                error=e,
+            )
+            return False
+        return True
+
+    def _cache_key(self, entrypoint: str, props: bytes, base_data: bytes) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        build_stamp = str(self._read_build_stamp()).encode()
+        for part in (entrypoint.encode(), props, base_data, build_stamp):
+            digest.update(part)
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def render(
+        self, entrypoint: str, props: bytes, base_data: bytes
+    ) -> typing.Optional[str]:
+        """
+        The HTML of the page component `entrypoint` rendered with the JSON `props` and `base_data`, or None if it
+        couldn't be rendered.
+        """
+        if not self._available:
+            return None
+
+        key = self._cache_key(entrypoint, props, base_data)
+        with self._cache_lock:
+            html = self._cache.get(key)
+            if html is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return html
+
+        self._start()
+        worker = self._checkout()
+        if worker is None:
+            self.failures += 1
+            return None
+
+        try:
+            response = worker.request(
+                b'"type":"render","entrypoint":%s,"props":%s,"baseData":%s}'
+                % (json.dumps(entrypoint).encode(), props, base_data),
+                self.timeout,
+            )
+        except SSRError as e:
+            log.warning("Server side rendering failed", entrypoint=entrypoint, error=e)
+            self.failures += 1
+            self._retire(worker)
+            self._idle.put(None)
+            return None
+
+        self._idle.put(worker)
+        self.renders += 1
+
+        if "error" in response:
+            log.warning(
+                "Server side rendering failed",
+                entrypoint=entrypoint,
+                error=response["error"],
+            )
+            self.failures += 1
+            return None
+
+        html = response["html"]
+        if self.cache_size:
+            with self._cache_lock:
+                self._cache[key] = html
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return html
+
+    def stats(self) -> typing.Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "renders": self.renders,
+            "failures": self.failures,
+            "entries": len(self._cache),
+        }
+
+
+ssr_pool = SSRPool(
+    node=settings.BECKETT_SSR_NODE,
+    worker_path=settings.BECKETT_SSR_WORKER_PATH,
+    build_stamp_path=settings.BECKETT_SSR_BUILD_STAMP_PATH,
+    size=settings.BECKETT_SSR_WORKERS,
+    timeout=settings.BECKETT_SSR_TIMEOUT,
+    cache_size=settings.BECKETT_SSR_CACHE_SIZE,
+    health_check_interval=settings.BECKETT_SSR_HEALTH_CHECK_INTERVAL,
+    auto_reload=settings.in_dev_environment,
+)
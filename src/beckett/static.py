@@ -0,0 +1,50 @@
+import mimetypes
+import os
+import re
+import typing
+
+import flask
+from werkzeug.security import safe_join
+
+HASHED_FILENAME = re.compile(r"-[A-Z0-9]{8}\.[^/]+$")
+"""The files esbuild names `[name]-[hash]`, e.g. `js/beckett_page-5XHZL3QK.js` or its `.js.map`."""
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def send_static_file(app: flask.Flask, filename: str) -> flask.Response:
+    """
+    Serves a file from the app's static folder.
+
+    Files with a content hash in their name never change, so browsers and CDNs are told to keep them for a year
+    without revalidating. When `build.mjs` wrote a `.gz` sibling of the file it's sent to clients that accept gzip,
+    instead of compressing the file for every request.
+    """
+    static_folder = typing.cast(str, app.static_folder)
+
+    if HASHED_FILENAME.search(filename):
+        max_age: typing.Optional[int] = IMMUTABLE_MAX_AGE
+    else:
+        max_age = app.get_send_file_max_age(filename)
+
+    compressed_path = safe_join(static_folder, f"{filename}.gz")
+    has_compressed = compressed_path is not None and os.path.isfile(compressed_path)
+
+    if has_compressed and flask.request.accept_encodings["gzip"]:
+        response = flask.send_from_directory(
+            static_folder,
+            f"{filename}.gz",
+            mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            max_age=max_age,
+        )
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = flask.send_from_directory(static_folder, filename, max_age=max_age)
+
+    if has_compressed:
+        response.vary.add("Accept-Encoding")
+    if max_age == IMMUTABLE_MAX_AGE:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+
+    return response
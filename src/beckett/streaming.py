@@ -0,0 +1,68 @@
+import typing
+
+import flask
+import structlog
+import werkzeug
+from pydantic import BaseModel
+
+log = structlog.get_logger(__name__)
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+STREAM_BUFFER_SIZE = 64 * 1024
+"""Serialized items are collected into chunks of about this many bytes before being handed to the server."""
+
+STREAM_ERROR_KEY = "$error"
+"""
+The key of the last line of a stream that failed part way through, e.g. `{"$error": 500}`.
+
+The status line has already been sent by then, so this is the only way to tell the client the stream is incomplete.
+"""
+
+
+def iter_ndjson(
+    items: typing.Iterable[BaseModel],
+    item_type: typing.Type[BaseModel],
+    buffer_size: int = STREAM_BUFFER_SIZE,
+) -> typing.Iterator[bytes]:
+    """
+    Serializes `items` as newline-delimited JSON, one line per item.
+
+    At most about `buffer_size` bytes are held at once, however many items there are. If the items can't be produced
+    or serialized, the error is logged and a final `{"$error": <status_code>}` line is sent in place of the rest.
+    """
+    serializer = item_type.__pydantic_serializer__
+    buffer = bytearray()
+
+    try:
+        for item in items:
+            if not isinstance(item, item_type):
+                raise TypeError(
+                    f"Invalid item streamed by server: expected {item_type.__name__}, got {type(item).__name__}"
+                )
+            buffer += serializer.to_json(item)
+            buffer += b"\n"
+            if len(buffer) >= buffer_size:
+                yield bytes(buffer)
+                buffer.clear()
+    except Exception as e:
+        log.exception("Streamed response failed", error=e)
+        status_code = (
+            e.code
+            if isinstance(e, werkzeug.exceptions.HTTPException) and e.code
+            else 500
+        )
+        buffer += b'{"%s":%d}\n' % (STREAM_ERROR_KEY.encode(), status_code)
+
+    if buffer:
+        yield bytes(buffer)
+
+
+def ndjson_response(
+    items: typing.Iterable[BaseModel], item_type: typing.Type[BaseModel]
+) -> flask.Response:
+    """A flask Response that streams `items` while keeping the request context available to the generator."""
+    return flask.Response(
+        flask.stream_with_context(iter_ndjson(items, item_type)),
+        mimetype=NDJSON_MIMETYPE,
+    )
@@ -1,2 +1,5 @@
 from .types_manager import *  # noqa
 from .types import *  # noqa
+from .pagination import *  # noqa
+from .fields import *  # noqa
+from .jobs import *  # noqa
@@ -0,0 +1,157 @@
+import contextlib
+import contextvars
+import functools
+import re
+import typing
+from dataclasses import dataclass
+
+from pydantic import BaseModel
+
+from .types import NoneType, strip_list_type_wrapper, strip_optional_type_wrapper
+
+FIELDS_PARAMETER = "fields"
+"""The request argument that selects the fields of a sparse route's response: `?fields=name,author.name`."""
+
+MAX_SELECTED_FIELDS = 100
+
+_FIELD_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+@dataclass(frozen=True)
+class FieldSelection:
+    """
+    The fields a client asked for, as sorted dotted paths: `("author.name", "title")`.
+
+    `in` tells whether a field is needed: `"author" in selection` is true if any field of the author was selected.
+    """
+
+    paths: typing.Tuple[str, ...]
+
+    def __contains__(self, path: str) -> bool:
+        return any(
+            selected == path
+            or selected.startswith(path + ".")
+            or path.startswith(selected + ".")
+            for selected in self.paths
+        )
+
+    @property
+    def key(self) -> str:
+        return ",".join(self.paths)
+
+
+def _field_model(
+    model: typing.Type[BaseModel], name: str
+) -> typing.Tuple[typing.Optional[typing.Type[BaseModel]], bool]:
+    """The model a field of `model` holds, if any (possibly in a list or an Optional), and whether it's in a list."""
+    inner_type, _ = strip_optional_type_wrapper(model.model_fields[name])
+    item_type, was_list = strip_list_type_wrapper(inner_type)
+    if isinstance(item_type, type) and issubclass(item_type, BaseModel):
+        return item_type, was_list
+    return None, was_list
+
+
+def _has_path(model: typing.Type[BaseModel], segments: typing.Sequence[str]) -> bool:
+    name, rest = segments[0], segments[1:]
+    if name not in model.model_fields:
+        return False
+    if not rest:
+        return True
+    field_model, _ = _field_model(model, name)
+    return field_model is not None and _has_path(field_model, rest)
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_fields(
+    selector: str, responses: typing.Tuple[typing.Any, ...]
+) -> FieldSelection:
+    """
+    Parses and validates a `fields` selector against the models a route responds with: each path has to lead to a
+    field of at least one of them. Raises a ValueError when it doesn't.
+
+    Selectors are cached, so a client asking for the same fields over and over only pays for them once.
+    """
+    paths = sorted({path.strip() for path in selector.split(",") if path.strip()})
+    if not paths:
+        raise ValueError("No fields were selected")
+    if len(paths) > MAX_SELECTED_FIELDS:
+        raise ValueError(f"At most {MAX_SELECTED_FIELDS} fields can be selected")
+
+    models = [response for response in responses if response is not NoneType]
+    for path in paths:
+        segments = path.split(".")
+        if not all(_FIELD_NAME.fullmatch(segment) for segment in segments) or not any(
+            _has_path(model, segments) for model in models
+        ):
+            raise ValueError(f"Unknown field: {path}")
+
+    return FieldSelection(tuple(paths))
+
+
+def _tree(selection: FieldSelection) -> typing.Dict[str, typing.Any]:
+    """The selected paths as a tree, an empty subtree stands for the whole field."""
+    tree: typing.Dict[str, typing.Any] = {}
+    for path in selection.paths:
+        node = tree
+        segments = path.split(".")
+        for segment in segments[:-1]:
+            node = node.setdefault(segment, {})
+            if node is None:
+                break
+        else:
+            node[segments[-1]] = None
+    return tree
+
+
+def _mask(
+    model: typing.Type[BaseModel], tree: typing.Dict[str, typing.Any]
+) -> typing.Dict[typing.Any, typing.Any]:
+    mask: typing.Dict[typing.Any, typing.Any] = {}
+    for name, subtree in tree.items():
+        if name not in model.model_fields:
+            # The field belongs to another of the route's responses.
+            continue
+        if subtree is None:
+            mask[name] = True
+            continue
+        field_model, was_list = _field_model(model, name)
+        submask = _mask(typing.cast(typing.Type[BaseModel], field_model), subtree)
+        mask[name] = {"__all__": submask} if was_list else submask
+    return mask
+
+
+@functools.lru_cache(maxsize=1024)
+def include_mask(
+    model: typing.Type[BaseModel], selection: FieldSelection
+) -> typing.Dict[typing.Any, typing.Any]:
+    """The `include` argument that serializes `selection` of a `model` response, along with its status code."""
+    return {"status_code": True, **_mask(model, _tree(selection))}
+
+
+_selected_fields: contextvars.ContextVar[
+    typing.Optional[FieldSelection]
+] = contextvars.ContextVar("beckett_selected_fields", default=None)
+
+
+def selected_fields() -> typing.Optional[FieldSelection]:
+    """
+    The fields the client asked for, when the view function of a sparse route is running and it asked for some:
+
+        @beckett.api_get("/books/<int:id>", sparse=True)
+        def book(id: int) -> BookResponse:
+            fields = selected_fields()
+            reviews = load_reviews(id) if fields is None or "reviews" in fields else []
+            ...
+    """
+    return _selected_fields.get()
+
+
+@contextlib.contextmanager
+def selecting_fields(
+    selection: typing.Optional[FieldSelection],
+) -> typing.Iterator[None]:
+    token = _selected_fields.set(selection)
+    try:
+        yield
+    finally:
+        _selected_fields.reset(token)
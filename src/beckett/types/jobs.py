@@ -0,0 +1,239 @@
+import asyncio
+import inspect
+import secrets
+import threading
+import time
+import typing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import flask
+import structlog
+
+from src import settings
+from src.beckett.cache import response_cache
+
+from .types import APIResponse, NoneType, NotFound, ServiceUnavailable
+
+log = structlog.get_logger(__name__)
+
+JOB_ENDPOINT_SUFFIX = "_job"
+"""Appended to the endpoint of an `api_post(background=True)` route to name the route that reports its jobs."""
+
+JOB_RULE_SUFFIX = "/job"
+
+JobState = typing.Literal["pending", "running", "done", "failed"]
+
+ResultT = typing.TypeVar("ResultT")
+
+
+class JobHandle(APIResponse):
+    """What an `api_post(background=True)` route responds with: the job it started, to ask how it's going."""
+
+    status_code: int = 202
+    job_id: str
+
+
+class JobStatusResponse(APIResponse, typing.Generic[ResultT]):
+    """
+    How a background job is going, with the response of its view function once it's done. A job that failed (its
+    view function raised) has no result, the error is in the server's logs.
+    """
+
+    status: JobState
+    result: typing.Optional[ResultT] = None
+
+
+@dataclass
+class Job:
+    id: str
+    endpoint: str
+    status: JobState = "pending"
+    result: typing.Optional[APIResponse] = None
+    expires_at: float = float("inf")
+
+
+class JobQueue:
+    """
+    Runs the view functions of `api_post(background=True)` routes on a pool of worker threads, and keeps their results.
+
+    At most `workers` jobs run at once and `max_pending` more wait for a worker. Past that, new jobs are turned away,
+    and their route responds with a 503, rather than queued without bound. Finished jobs are kept for `result_ttl`
+    seconds, and the oldest are dropped first once there are more than `max_results`.
+
+    Jobs live in the server process that started them: with several workers, their status has to be asked from the
+    same process, e.g. with sticky sessions.
+    """
+
+    def __init__(
+        self, *, workers: int, max_pending: int, result_ttl: float, max_results: int
+    ):
+        self.result_ttl = result_ttl
+        self.max_results = max_results
+        # Threads are only started as jobs are submitted.
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="beckett-job"
+        )
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._lock = threading.Lock()
+        self._jobs: typing.Dict[str, Job] = {}
+        self._finished: OrderedDict[str, Job] = OrderedDict()
+
+        self.rejected = 0
+        self.failed = 0
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._finished:
+            job_id, job = next(iter(self._finished.items()))
+            if job.expires_at > now and len(self._finished) <= self.max_results:
+                break
+            del self._finished[job_id]
+            del self._jobs[job_id]
+
+    def submit(
+        self, endpoint: str, run: typing.Callable[[], APIResponse]
+    ) -> typing.Optional[Job]:
+        """Starts a job of `endpoint` that runs `run()`, or returns None if too many are running or waiting already."""
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            log.warning("Turned a background job away", endpoint=endpoint)
+            return None
+
+        job = Job(id=secrets.token_urlsafe(16), endpoint=endpoint)
+        with self._lock:
+            self._evict()
+            self._jobs[job.id] = job
+        self._executor.submit(self._work, job, run)
+        return job
+
+    def _work(self, job: Job, run: typing.Callable[[], APIResponse]) -> None:
+        status: JobState = "failed"
+        try:
+            job.status = "running"
+            job.result = run()
+            status = "done"
+        except Exception as e:
+            self.failed += 1
+            log.exception(
+                "Background job failed",
+                endpoint=job.endpoint,
+                job_id=job.id,
+                exc_info=e,
+            )
+        finally:
+            with self._lock:
+                job.status = status
+                job.expires_at = time.monotonic() + self.result_ttl
+                self._finished[job.id] = job
+                self._evict()
+            self._slots.release()
+
+    def get(self, endpoint: str, job_id: str) -> typing.Optional[Job]:
+        """The job of `endpoint` with the id `job_id`, None if there's none or it was dropped."""
+        with self._lock:
+            self._evict()
+            job = self._jobs.get(job_id)
+        if job is None or job.endpoint != endpoint:
+            return None
+        return job
+
+    def stats(self) -> typing.Dict[str, int]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            "pending": sum(job.status == "pending" for job in jobs),
+            "running": sum(job.status == "running" for job in jobs),
+            "finished": len(self._finished),
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+job_queue = JobQueue(
+    workers=settings.BECKETT_JOB_WORKERS,
+    max_pending=settings.BECKETT_JOB_QUEUE_SIZE,
+    result_ttl=settings.BECKETT_JOB_RESULT_TTL,
+    max_results=settings.BECKETT_JOB_MAX_RESULTS,
+)
+
+
+def _result_types(func: typing.Callable) -> typing.Tuple[typing.Any, ...]:
+    return_type = typing.get_type_hints(func).get("return")
+    if typing.get_origin(return_type) is typing.Union:
+        return typing.get_args(return_type)
+    return (return_type,)
+
+
+def background_view(
+    func: typing.Callable,
+    *,
+    endpoint: str,
+    invalidates: typing.Optional[typing.Sequence[str]] = None,
+) -> typing.Callable:
+    """
+    The view function of an `api_post(background=True)` route: it takes the same arguments as `func`, starts a job
+    that calls `func` with them and responds with a `JobHandle`, or a `ServiceUnavailable` when the queue is full.
+
+    The job runs in a copy of the request's context, so `func` can still use `flask.request` and the session. The
+    `invalidates` tags are evicted from the response cache when the job succeeds, not when it's started.
+    """
+    hints = typing.get_type_hints(func)
+    result_classes = tuple(
+        result_type
+        for result_type in _result_types(func)
+        if result_type is not NoneType
+    )
+    assert all(
+        isinstance(result_type, type) and issubclass(result_type, APIResponse)
+        for result_type in result_classes
+    ), "Background routes must return APIResponse (and can't stream)"
+
+    def run(kwargs: typing.Dict[str, typing.Any]) -> APIResponse:
+        result = func(**kwargs)
+        if inspect.iscoroutine(result):
+            result = asyncio.run(result)
+        if not isinstance(result, result_classes):
+            raise Exception("Invalid response generated by server")
+        if invalidates and 200 <= result.status_code < 300:
+            response_cache.invalidate(invalidates)
+        return result
+
+    def submit(**kwargs) -> typing.Union[JobHandle, ServiceUnavailable]:
+        job = job_queue.submit(
+            endpoint, flask.copy_current_request_context(lambda: run(kwargs))
+        )
+        if job is None:
+            return ServiceUnavailable()
+        return JobHandle(job_id=job.id)
+
+    submit.__name__ = func.__name__
+    submit.__module__ = func.__module__
+    submit.__annotations__ = {
+        **{name: hint for name, hint in hints.items() if name != "return"},
+        "return": typing.Union[JobHandle, ServiceUnavailable],
+    }
+    return submit
+
+
+def job_status_view(func: typing.Callable, *, endpoint: str) -> typing.Callable:
+    """The view function of the `api_get` route that reports the jobs `background_view(func, endpoint)` started."""
+    status_response = typing.cast(
+        typing.Type[JobStatusResponse],
+        JobStatusResponse[typing.Union[tuple(_result_types(func))]],  # type: ignore
+    )
+
+    def job_status(job_id: str) -> typing.Union[JobStatusResponse, NotFound]:
+        job = job_queue.get(endpoint, job_id)
+        if job is None:
+            return NotFound()
+        return status_response(status=job.status, result=job.result)
+
+    job_status.__name__ = func.__name__ + JOB_ENDPOINT_SUFFIX
+    job_status.__module__ = func.__module__
+    job_status.__annotations__ = {
+        "job_id": str,
+        "return": typing.Union[status_response, NotFound],
+    }
+    return job_status
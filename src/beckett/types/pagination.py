@@ -0,0 +1,101 @@
+import base64
+import binascii
+import json
+import typing
+
+import werkzeug
+from pydantic import TypeAdapter, ValidationError
+from pydantic_core import to_jsonable_python
+
+from .types import APIResponse, ItemT
+
+DEFAULT_MAX_PAGE_SIZE = 100
+"""The largest `limit` a paginated route accepts, unless it sets its own with `api_get(max_page_size=...)`."""
+
+
+def encode_cursor(*key: typing.Any) -> str:
+    """
+    An opaque cursor for the page that starts after the item with the sort `key`, e.g. `encode_cursor(name, id)`.
+
+    The cursor is the key's values as URL safe base64 JSON. It isn't signed: a client that forges one can only ask for
+    rows it could have paged through anyway.
+    """
+    data = json.dumps(to_jsonable_python(key), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def decode_cursor(
+    cursor: typing.Optional[str], *types: typing.Any
+) -> typing.Optional[typing.Tuple[typing.Any, ...]]:
+    """
+    The sort key `cursor` was made from, validated as `types`, or None for the first page:
+
+        after = decode_cursor(cursor, str, int)
+        if after is not None:
+            query = query.where(tuple_(Book.name, Book.id) > after)
+
+    A cursor that can't be decoded is a `BadRequest`.
+    """
+    if cursor is None:
+        return None
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return _key_adapter(types).validate_json(data)
+    except (binascii.Error, ValueError, ValidationError) as e:
+        raise werkzeug.exceptions.BadRequest("The page cursor is invalid") from e
+
+
+_key_adapters: typing.Dict[typing.Tuple[typing.Any, ...], TypeAdapter] = {}
+
+
+def _key_adapter(types: typing.Tuple[typing.Any, ...]) -> TypeAdapter:
+    adapter = _key_adapters.get(types)
+    if adapter is None:
+        adapter = _key_adapters[types] = TypeAdapter(typing.Tuple[types])  # type: ignore
+    return adapter
+
+
+class PaginatedResponse(APIResponse, typing.Generic[ItemT]):
+    """
+    One page of an `api_get` route that pages through a collection with keyset pagination.
+
+    The route takes a `cursor` (None for the first page) and a `limit`, and returns the items after the cursor in a
+    stable order along with the cursor of the next page, if there is one:
+
+        @beckett.api_get("/books", max_page_size=50)
+        def books(author: str, cursor: typing.Optional[str], limit: int) -> PaginatedResponse[Book]:
+            after = decode_cursor(cursor, str, int)
+            rows = query_books(author, after=after, order_by=("name", "id"), limit=limit + 1)
+            return PaginatedResponse[Book].from_rows(rows, limit, key=lambda book: (book.name, book.id))
+
+    View functions' defaults aren't used, so the `limit` is required: clients always send it.
+
+    Unlike an offset, the cursor keeps pointing at the same place when rows are added or removed before it. Requests
+    with a `limit` over the route's `max_page_size` are rejected. `useInfiniteGet` in `query.ts` fetches the pages
+    one after the other.
+    """
+
+    items: typing.List[ItemT]
+    next_cursor: typing.Optional[str] = None
+
+    @classmethod
+    def from_rows(
+        cls,
+        rows: typing.Sequence[typing.Any],
+        limit: int,
+        *,
+        key: typing.Callable[[typing.Any], typing.Tuple[typing.Any, ...]],
+    ) -> typing.Self:
+        """
+        A page of `rows`, which were queried with a limit of `limit + 1`: the extra row is only there to tell whether
+        there is a next page. The cursor of the next page is `key` of the last item.
+        """
+        items = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit and items:
+            next_cursor = encode_cursor(*key(items[-1]))
+        return cls(items=list(items), next_cursor=next_cursor)
+
+
+def is_paginated(type_: typing.Any) -> bool:
+    return isinstance(type_, type) and issubclass(type_, PaginatedResponse)
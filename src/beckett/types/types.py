@@ -1,15 +1,20 @@
 import enum
+import re
 import typing
+from dataclasses import dataclass
 from decimal import Decimal
-from typing import Any, Literal, Tuple, Union, get_args, get_origin
+from typing import Any, Dict, Literal, Set, Tuple, Union, get_args, get_origin
 from uuid import UUID
 
-from pydantic import BaseModel
+import structlog
+from pydantic import BaseModel, PrivateAttr
 from pydantic.fields import FieldInfo
 
 from src.beckett.renderer.typescript_react.imports import TypescriptImports
 from src.beckett.renderer.typescript_react.interfaces import TypescriptInterfaces
 
+log = structlog.get_logger(__name__)
+
 NoneType = type(None)
 
 
@@ -50,21 +55,51 @@ def generate_type(
     if origin is list:
         return "".join(generate_type(a, imports) for a in args) + "[]"
     if origin is Literal:
-        return f'"{args[0]}"'
+        return " | ".join(f'"{a}"' for a in args)
 
     raise TypeError(f"Can't generate interface for {type_} (type={type(type_)})")
 
 
-def generate_interfaces(
-    cls: Any,
-    name: typing.Optional[str] = None,
-    default_export: typing.Optional[bool] = False,
-) -> Tuple[TypescriptImports, TypescriptInterfaces]:
-    if name is None:
-        name = cls.__name__
+def interface_name(cls: Any) -> str:
+    """
+    The name of a model's TypeScript interface: its class name, followed by the names of its parameters for a
+    parametrized generic model (`PaginatedResponse[Book]` is `PaginatedResponseBook`).
+    """
+    metadata = getattr(cls, "__pydantic_generic_metadata__", None)
+    if metadata and metadata["origin"] is not None:
+        return interface_name(metadata["origin"]) + "".join(
+            _parameter_name(arg) for arg in metadata["args"]
+        )
+    return cls.__name__
+
+
+def _parameter_name(type_: Any) -> str:
+    if isinstance(type_, type) and issubclass(type_, BaseModel):
+        return interface_name(type_)
+    if get_origin(type_) is Union:
+        return "Or".join(_parameter_name(arg) for arg in get_args(type_))
+    name = getattr(type_, "__name__", None) or repr(type_)
+    return re.sub(r"\W+", "", name[:1].upper() + name[1:])
+
+
+SHARED_TYPES_MODULE = "~/api/models"
+"""The generated module holding the interfaces of the models referenced from `types.ts` and the pages' `.type.ts`."""
+
+
+@dataclass
+class _Declaration:
+    declaration: str
+    imports: TypescriptImports
+    dependencies: typing.List[type]
+    """The models the declaration refers to by name, in field order."""
 
+
+def _build_declaration(
+    cls: Any, name: str, default_export: typing.Optional[bool]
+) -> _Declaration:
+    """Builds the interface for a single model, recording (rather than generating) the models it references."""
     imports = TypescriptImports()
-    interfaces = TypescriptInterfaces()
+    dependencies: typing.List[type] = []
 
     # Generate interface for the class we've been passed.
     if default_export:
@@ -81,27 +116,18 @@ def generate_interfaces(
 
         if (union_types := strip_union_type_wrapper(inner_type)) is not None:
             # make sure all the unioned types have declarations of their own
-            type_names = []
-            for union_type in union_types:
-                child_imports, child_interfaces = generate_interfaces(union_type)
-
-                imports.merge(child_imports)
-                interfaces.merge(child_interfaces)
-
-                type_names.append(union_type.__name__)
+            dependencies.extend(union_types)
+            type_names = [interface_name(union_type) for union_type in union_types]
             # The class we've been passed can declare its use of the union now
             declaration += f'    "{field_name}": ({("| ".join(type_names))})'
 
         # check to see if it is a custom defined type
         elif hasattr(inner_type, "__pydantic_complete__"):
             # We've found an object that needs interface(s) of its own.
-            child_imports, child_interfaces = generate_interfaces(inner_type)
-
-            imports.merge(child_imports)
-            interfaces.merge(child_interfaces)
+            dependencies.append(inner_type)  # type: ignore
 
             # The class we've been passed can declare its use of the object.
-            declaration += f"    {field_name}: {inner_type.__name__}"
+            declaration += f"    {field_name}: {interface_name(inner_type)}"
         else:
             # Simple type (not an object), just declare we use it.
             declaration += f'    "{field_name}": {generate_type(inner_type, imports)}'
@@ -112,9 +138,139 @@ def generate_interfaces(
 
     declaration += "}"
 
-    interfaces.add(name, declaration)
+    return _Declaration(
+        declaration=declaration, imports=imports, dependencies=dependencies
+    )
+
+
+class TypeRegistry:
+    """
+    Builds the TypeScript interface of each pydantic model once, however many models, routes and pages reference it.
+
+    While a model's interface is built, the models it references are only recorded, so recursive and mutually
+    recursive models are fine: the interfaces are then collected by walking that graph, visiting each model once.
+    """
+
+    def __init__(self):
+        self._declarations: Dict[
+            Tuple[type, str, typing.Optional[bool]], _Declaration
+        ] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_declaration(
+        self, cls: Any, name: str, default_export: typing.Optional[bool] = False
+    ) -> _Declaration:
+        key = (cls, name, default_export)
+        declaration = self._declarations.get(key)
+        if declaration is not None:
+            self.hits += 1
+            return declaration
+
+        self.misses += 1
+        declaration = _build_declaration(cls, name, default_export)
+        self._declarations[key] = declaration
+        return declaration
+
+    def generate(
+        self,
+        cls: Any,
+        name: typing.Optional[str] = None,
+        default_export: typing.Optional[bool] = False,
+        *,
+        shared_module: typing.Optional[str] = None,
+    ) -> Tuple[TypescriptImports, TypescriptInterfaces]:
+        """
+        The interface for `cls` and the interfaces of every model it references, referenced models first.
+
+        With `shared_module` only the interface for `cls` is returned, the models it references are imported from that
+        module instead (see `generate_shared`).
+        """
+        if name is None:
+            name = interface_name(cls)
+
+        imports = TypescriptImports()
+        interfaces = TypescriptInterfaces()
+
+        root = self.get_declaration(cls, name, default_export)
+        if shared_module is not None:
+            imports.merge(root.imports)
+            for dependency in root.dependencies:
+                imports.add(shared_module, interface_name(dependency))
+            interfaces.add(name, root.declaration)
+            return imports, interfaces
+
+        visited: Set[type] = set()
+
+        def visit(dependency: type) -> None:
+            if dependency in visited:
+                return
+            visited.add(dependency)
+            declaration = self.get_declaration(dependency, interface_name(dependency))
+            for child in declaration.dependencies:
+                visit(child)
+            imports.merge(declaration.imports)
+            interfaces.add(interface_name(dependency), declaration.declaration)
+
+        # A root model that refers to itself is also declared under its class name.
+        for dependency in root.dependencies:
+            visit(dependency)
+        imports.merge(root.imports)
+        interfaces.add(name, root.declaration)
+
+        return imports, interfaces
+
+    def generate_shared(
+        self, roots: typing.Iterable[type]
+    ) -> Tuple[TypescriptImports, TypescriptInterfaces]:
+        """
+        The interfaces of every model referenced by `roots` (but not of the roots themselves, which each file declares
+        under its own name), for the shared module.
+        """
+        imports = TypescriptImports()
+        interfaces = TypescriptInterfaces()
+        visited: Set[type] = set()
+        declared_names: Dict[str, type] = {}
+
+        def visit(model: type) -> None:
+            if model in visited:
+                return
+            visited.add(model)
+            name = interface_name(model)
+            declaration = self.get_declaration(model, name)
+            for child in declaration.dependencies:
+                visit(child)
+
+            other = declared_names.setdefault(name, model)
+            if other is not model:
+                log.warning(
+                    "Two models share the same TypeScript interface name",
+                    name=name,
+                    models=[other.__module__, model.__module__],
+                )
+            imports.merge(declaration.imports)
+            interfaces.add(name, declaration.declaration)
+
+        for root in roots:
+            for dependency in self.get_declaration(
+                root, interface_name(root)
+            ).dependencies:
+                visit(dependency)
+
+        return imports, interfaces
+
+
+type_registry = TypeRegistry()
 
-    return imports, interfaces
+
+def generate_interfaces(
+    cls: Any,
+    name: typing.Optional[str] = None,
+    default_export: typing.Optional[bool] = False,
+) -> Tuple[TypescriptImports, TypescriptInterfaces]:
+    """The interface for `cls` and for every model it references, see `TypeRegistry.generate`."""
+    return type_registry.generate(cls, name, default_export)
 
 
 def strip_optional_type_wrapper(
@@ -124,9 +280,12 @@ def strip_optional_type_wrapper(
     origin = typing.get_origin(field_info.annotation)
     args = typing.get_args(field_info.annotation)
 
-    if origin is Union and len(args) == 2 and NoneType in args:
-        inner_type = next(a for a in args if a is not NoneType)
-        return inner_type, True
+    if origin is Union and NoneType in args:
+        # `Optional[Union[A, B]]` is `Union[A, B, None]`.
+        inner_types = tuple(a for a in args if a is not NoneType)
+        if len(inner_types) == 1:
+            return inner_types[0], True
+        return Union[inner_types], True  # type: ignore
     else:
         return field_info.annotation, False
 
@@ -152,16 +311,69 @@ def strip_union_type_wrapper(type_hint: Any) -> typing.Optional[typing.List[type
     return None
 
 
-class PageProps(BaseModel):
+class _VersionedModel(BaseModel):
+    _version: typing.Optional[str] = PrivateAttr(default=None)
+
+    def with_version(self, version: str) -> typing.Self:
+        """
+        Attach a cheap version key (a row's `updated_at`, a revision counter...) to this response.
+
+        When the endpoint has `etag=True`, the ETag is derived from this key instead of hashing the serialized body, so
+        a matching `If-None-Match` is answered with a 304 without serializing anything.
+        """
+        self._version = version
+        return self
+
+
+class PageProps(_VersionedModel):
     """The return class for any React Page"""
 
 
-class APIResponse(BaseModel):
+class APIResponse(_VersionedModel):
     """The base class for any value returned from a @beckett.api_get- or a @beckett.api_post endpoints."""  # noqa
 
     status_code: int = 200
     """The HTTP status code that this response will send."""
 
+    columnar: typing.ClassVar[bool] = False
+    """
+    Whether the response's lists of models are sent to clients that accept it column by column, see
+    `src.beckett.types.columnar`. Worth it for responses with long lists of small models:
+
+        class BooksResponse(APIResponse):
+            columnar = True
+            books: typing.List[Book]
+    """
+
+
+ItemT = typing.TypeVar("ItemT", bound=BaseModel)
+
+
+class StreamingAPIResponse(typing.Generic[ItemT]):
+    """
+    The return type of an @beckett.api_get endpoint that streams its items as newline-delimited JSON.
+
+    The items are serialized one at a time as they are produced, so a view can send hundreds of thousands of rows
+    without holding them all in memory:
+
+        @beckett.api_get("/export")
+        def export(year: int) -> StreamingAPIResponse[Row]:
+            return StreamingAPIResponse(Row(...) for row in query_rows(year))
+    """
+
+    status_code: int = 200
+
+    def __init__(self, items: typing.Iterable[ItemT]):
+        self.items = items
+
+
+def get_stream_item_type(type_: Any) -> typing.Optional[typing.Type[BaseModel]]:
+    """Returns `Item` for `StreamingAPIResponse[Item]`, None for any other type."""
+    if get_origin(type_) is not StreamingAPIResponse:
+        return None
+    (item_type,) = get_args(type_)
+    return item_type
+
 
 class BadRequest(APIResponse):
     status_code: int = 400
@@ -176,10 +388,19 @@ class NotFound(APIResponse):
     status_code: int = 404
 
 
+class UnprocessableEntity(APIResponse):
+    status_code: int = 422
+    message: str
+
+
 class InternalServerError(APIResponse):
     status_code: int = 500
 
 
+class ServiceUnavailable(APIResponse):
+    status_code: int = 503
+
+
 class PydanticValidationResponse(APIResponse):
     status_code: int = 500
     message: typing.List[str]
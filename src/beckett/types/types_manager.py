@@ -1,28 +1,73 @@
+import inspect
 import json
 import os
 import re
+import threading
 import typing
-from dataclasses import dataclass
+from dataclasses import dataclass, is_dataclass
 from types import CodeType
 from typing import Any, Callable, Dict, List, Literal, Set, Tuple, Type, Union
 
 import flask
 import structlog
 import werkzeug
+from markupsafe import Markup
 from pydantic import BaseModel, ValidationError, create_model
 
+from src.beckett.batch import BATCH_URL
+from src.beckett.cache import (
+    CachePolicy,
+    SharedResponse,
+    response_cache,
+    response_flights,
+)
+from src.beckett.etag import (
+    body_etag,
+    is_not_modified,
+    not_modified_response,
+    version_etag,
+)
+from src.beckett.idempotency import idempotency_store
+from src.beckett.metrics import metrics
 from src.beckett.renderer.typescript_react.imports import TypescriptImports
 from src.beckett.renderer.typescript_react.interfaces import TypescriptInterfaces
+from src.beckett.renderer.typescript_react.renderer import script_safe_json
+from src.beckett.renderer.typescript_react.type_files import (
+    combine_fingerprints,
+    generated_type_files,
+    type_fingerprint,
+)
+from src.beckett.snapshot import declaration_fingerprint, route_snapshot
+from src.beckett.streaming import ndjson_response
 from src.utils import unwrap
 
+from .columnar import (
+    COLUMNAR_MIMETYPE,
+    accepts_columnar,
+    columnar_fields,
+    encode_columnar,
+)
+from .fields import (
+    FIELDS_PARAMETER,
+    FieldSelection,
+    include_mask,
+    parse_fields,
+    selecting_fields,
+)
+from .jobs import JOB_ENDPOINT_SUFFIX, JobHandle
+from .pagination import DEFAULT_MAX_PAGE_SIZE, is_paginated
 from .types import (
+    SHARED_TYPES_MODULE,
     APIResponse,
     BadRequest,
     Forbidden,
     InternalServerError,
+    NoneType,
     NotFound,
     PydanticValidationResponse,
-    generate_interfaces,
+    StreamingAPIResponse,
+    get_stream_item_type,
+    type_registry,
 )
 
 log = structlog.get_logger(__name__)
@@ -43,11 +88,26 @@ def _stringify_code_location(code: CodeType) -> str:
 @dataclass
 class RouteDefinition:
     method: str
-    request: BaseModel
-    responses: typing.List[Union[Type[APIResponse], Type[None]]]
+    types: "RouteTypes"
     endpoint: str
     code: CodeType
     url: str
+    is_streaming: bool
+    """Whether the route returns a `StreamingAPIResponse` (and so is listed in STREAM_MAP rather than GET_MAP)."""
+
+    dispatch: typing.Optional[Callable[..., flask.Response]] = None
+    """Runs the route for a given set of URL arguments and a payload loader, see `generate_api_decorator`."""
+
+    idempotent: bool = False
+    """Whether the route replays its responses to retries with the same `Idempotency-Key`."""
+
+    @property
+    def request(self) -> Type[BaseModel]:
+        return self.types.resolve().request
+
+    @property
+    def responses(self) -> typing.List[Union[Type[APIResponse], Type[None]]]:
+        return self.types.resolve().responses
 
 
 class APIRouteTypeManager:
@@ -58,10 +118,14 @@ class APIRouteTypeManager:
 
     _names: Set[str]
     _routes: Dict[str, RouteDefinition]
+    _page_props: Dict[str, typing.Optional[Type[BaseModel]]]
+    _base_data_json: typing.Optional[Markup]
 
     def __init__(self):
         self._names = set()
         self._routes = dict()
+        self._page_props = dict()
+        self._base_data_json = None
 
     @classmethod
     def get_types_path(cls) -> str:
@@ -69,6 +133,12 @@ class APIRouteTypeManager:
 
         return os.path.abspath(os.path.join(app.root_path, "js", "api", "types.ts"))
 
+    @classmethod
+    def get_models_path(cls) -> str:
+        from src.app import app
+
+        return os.path.abspath(os.path.join(app.root_path, "js", "api", "models.ts"))
+
     def _get_unique_name(self, name: str) -> str:
         name = name[0].upper() + name[1:]
         name = re.sub(r"[^A-Za-z]+(\w)", lambda match: match[1].upper(), name)
@@ -84,38 +154,121 @@ class APIRouteTypeManager:
         self,
         *,
         method: Literal["GET", "POST"],
-        request: Any,
-        responses: List[Union[Type[APIResponse], Type[None]]],
+        types: "RouteTypes",
+        is_streaming: bool,
         endpoint: str,
         url: str,
         code: CodeType,
+        dispatch: typing.Optional[Callable[..., flask.Response]] = None,
+        idempotent: bool = False,
     ) -> None:
         if endpoint in self._routes:
             raise ValueError(f"API endpoint already exists: {endpoint}")
 
         self._routes[endpoint] = RouteDefinition(
             method=method,
-            request=request,
-            responses=responses,
+            types=types,
+            is_streaming=is_streaming,
             endpoint=endpoint,
             code=code,
             url=url,
+            dispatch=dispatch,
+            idempotent=idempotent,
         )
+        self._base_data_json = None
+
+    def add_page_props(
+        self, endpoint: str, props: typing.Optional[Type[BaseModel]]
+    ) -> None:
+        """Registers the props of a `@beckett.page()`, so the models they reference are declared in `models.ts`."""
+        self._page_props[endpoint] = props
+
+    def get_route(self, endpoint: str) -> typing.Optional[RouteDefinition]:
+        return self._routes.get(endpoint)
+
+    def get_routes(self) -> Dict[str, RouteDefinition]:
+        return dict(self._routes)
+
+    def get_page_endpoints(self) -> List[str]:
+        return list(self._page_props)
 
     def get_url_map(self) -> Dict[str, str]:
         return {
             endpoint: definition.url for endpoint, definition in self._routes.items()
         }
 
-    def write_types(self) -> None:
+    def get_base_data_json(self) -> Markup:
+        """The `base_data` handed to every React page, serialized once and reused until a new route is added."""
+        if self._base_data_json is None:
+            self._base_data_json = script_safe_json(
+                json.dumps(
+                    {"urlMap": self.get_url_map(), "batchUrl": BATCH_URL},
+                    separators=(",", ":"),
+                )
+            )
+        return self._base_data_json
+
+    def get_types_fingerprint(self) -> str:
+        """A fingerprint of everything `generate_types()` outputs, see `type_fingerprint`."""
+        return combine_fingerprints(
+            *(
+                combine_fingerprints(
+                    endpoint,
+                    definition.method,
+                    _stringify_code_location(definition.code),
+                    definition.types.resolve().fingerprint,
+                    str(definition.idempotent),
+                )
+                for endpoint, definition in sorted(self._routes.items())
+            )
+        )
+
+    def _get_root_types(self) -> List[Any]:
+        """The types each generated file declares under its own name: route requests and responses, page props."""
+        root_types: List[Any] = []
+        for _, definition in sorted(self._routes.items()):
+            root_types.append(definition.request)
+            for response in definition.responses:
+                if response is NoneType:
+                    continue
+                root_types.append(get_stream_item_type(response) or response)
+        for _, props in sorted(self._page_props.items()):
+            if props is not None and props is not NoneType:
+                root_types.append(props)
+        return root_types
+
+    def write_types(self) -> bool:
+        """
+        Brings `js/api/types.ts` and `js/api/models.ts` up to date, returning whether either changed.
+
+        Nothing is generated when no route's types changed since the file was last written, and otherwise only the
+        routes whose types changed are.
+        """
+        models_changed = False
+        models_path = self.get_models_path()
+        models_fingerprint = type_fingerprint(*self._get_root_types())
+        if not generated_type_files.is_fresh(models_path, models_fingerprint):
+            models_changed = generated_type_files.write(
+                models_path, self.generate_models(), models_fingerprint
+            )
+
+        path = self.get_types_path()
+        fingerprint = self.get_types_fingerprint()
+        if generated_type_files.is_fresh(path, fingerprint):
+            log.info("Types are up to date")
+            return models_changed
+
         log.info("Generating types...")
-        with open(self.get_types_path(), "w") as fh:
-            fh.write(self.generate_types())
+        types = self.generate_types()
+        generated_type_files.prune_fragments(
+            "api:", {f"api:{endpoint}" for endpoint in self._routes}
+        )
+        return generated_type_files.write(path, types, fingerprint) or models_changed
 
-    def generate_types(self) -> str:
+    def _generated_file_header(self) -> str:
         import inspect
 
-        out = (
+        return (
             f"""
 /*
 THIS FILE IS AUTO-GENERATED, DO NOT ALTER MANUALLY.
@@ -126,35 +279,93 @@ Please see {_stringify_code_location(unwrap(inspect.currentframe()).f_code)}
             + "\n"
         )
 
+    def generate_models(self) -> str:
+        """
+        The shared module of the models referenced by routes and pages, see `TypeRegistry.generate_shared`.
+
+        Declaring each of them once here keeps `types.ts` and the `.type.ts` files from repeating the same interfaces.
+        """
+        typescript_imports, typescript_interfaces = type_registry.generate_shared(
+            self._get_root_types()
+        )
+
+        out = self._generated_file_header()
+        out += typescript_imports.render()
+        out += "\n"
+        out += typescript_interfaces.render()
+        return out.rstrip("\n") + "\n"
+
+    def generate_types(self) -> str:
+        out = self._generated_file_header()
+
         typescript_imports = TypescriptImports()
         typescript_interfaces = TypescriptInterfaces()
 
         endpoint_names: Dict[str, Tuple[str, List[str]]] = {}
 
+        # Names are handed out afresh for every generation, so generating twice gives the same output.
+        self._names = set()
+
         for endpoint, definition in sorted(self._routes.items()):
             endpoint_name = self._get_unique_name(endpoint)
             endpoint_names[endpoint] = (endpoint_name, [])
+
+            # (name, type) for every interface this route declares.
+            named_types: List[Tuple[str, Any]] = []
             if len(definition.request.model_fields.items()) > 0:
                 # Only output types if function has args
-                request_imports, request_interfaces = generate_interfaces(
-                    definition.request, name=endpoint_name + "Request"
-                )
-                typescript_imports.merge(request_imports)
-                typescript_interfaces.merge(request_interfaces)
+                named_types.append((endpoint_name + "Request", definition.request))
 
             for response in definition.responses:
-                if isinstance(None, response):
+                if response is NoneType:
                     continue
 
-                response_type_name = self._get_unique_name(endpoint_name + "Response")
-                endpoint_names[endpoint][1].append(response_type_name)
-
-                response_imports, response_interfaces = generate_interfaces(
-                    response, name=response_type_name
+                stream_item_type = get_stream_item_type(response)
+                if stream_item_type is not None:
+                    item_type_name = self._get_unique_name(endpoint_name + "Item")
+                    named_types.append((item_type_name, stream_item_type))
+                else:
+                    response_type_name = self._get_unique_name(
+                        endpoint_name + "Response"
+                    )
+                    named_types.append((response_type_name, response))
+                endpoint_names[endpoint][1].append(named_types[-1][0])
+
+            # Reuse the interfaces generated on a previous run if the route's types haven't changed since.
+            fragment_key = f"api:{endpoint}"
+            fragment_fingerprint = combine_fingerprints(
+                *(name for name, _ in named_types),
+                type_fingerprint(*(type_ for _, type_ in named_types)),
+            )
+            fragment = generated_type_files.get_fragment(
+                fragment_key, fragment_fingerprint
+            )
+            if fragment is None:
+                route_imports = TypescriptImports()
+                route_interfaces = TypescriptInterfaces()
+                for name, type_ in named_types:
+                    type_imports, type_interfaces = type_registry.generate(
+                        type_, name=name, shared_module=SHARED_TYPES_MODULE
+                    )
+                    route_imports.merge(type_imports)
+                    route_interfaces.merge(type_interfaces)
+
+                fragment = {
+                    "imports": {
+                        module: sorted(declarations)
+                        for module, declarations in route_imports
+                    },
+                    "interfaces": list(route_interfaces),
+                }
+                generated_type_files.set_fragment(
+                    fragment_key, fragment_fingerprint, fragment
                 )
 
-                typescript_imports.merge(response_imports)
-                typescript_interfaces.merge(response_interfaces)
+            for module, declarations in fragment["imports"].items():
+                for declaration in declarations:
+                    typescript_imports.add(module, declaration)
+            for name, declaration in fragment["interfaces"]:
+                typescript_interfaces.add(name, declaration)
 
         out += typescript_imports.render()
         out += "\n"
@@ -171,8 +382,7 @@ Please see {_stringify_code_location(unwrap(inspect.currentframe()).f_code)}
             # Mark as optional if there's a non-optional type and an optional type
             response_optionality = (
                 "?"
-                if response_names
-                and any(isinstance(None, resp) for resp in d.responses)
+                if response_names and any(resp is NoneType for resp in d.responses)
                 else ""
             )
 
@@ -197,7 +407,16 @@ Please see {_stringify_code_location(unwrap(inspect.currentframe()).f_code)}
         out += "// prettier-ignore\n"
         out += "export interface GET_MAP {\n"
         for endpoint, definition in sorted(self._routes.items()):
-            if definition.method != "GET":
+            if definition.method != "GET" or definition.is_streaming:
+                continue
+            out += write_endpoint(definition)
+
+        out += "}\n\n"
+
+        out += "// prettier-ignore\n"
+        out += "export interface STREAM_MAP {\n"
+        for endpoint, definition in sorted(self._routes.items()):
+            if not definition.is_streaming:
                 continue
             out += write_endpoint(definition)
 
@@ -210,9 +429,54 @@ Please see {_stringify_code_location(unwrap(inspect.currentframe()).f_code)}
                 continue
             out += write_endpoint(definition, undefined="{}")
 
-        out += "}\n"
+        out += "}\n\n"
+
+        # What `decodeColumnar` in query.ts needs to turn columnar responses back into objects.
+        out += "// prettier-ignore\n"
+        out += "export const COLUMNAR_FIELDS: {[endpoint: string]: {[field: string]: string[]}} = {\n"
+        for endpoint, definition in sorted(self._routes.items()):
+            fields = self._get_columnar_fields(definition)
+            if fields:
+                out += f"    {json.dumps(endpoint)}: {json.dumps(fields)},\n"
+
+        out += "}\n\n"
+
+        # The routes `post()` in query.ts sends an `Idempotency-Key` to, and retries.
+        out += "// prettier-ignore\n"
+        out += "export const IDEMPOTENT_ENDPOINTS: ReadonlySet<string> = new Set([\n"
+        for endpoint, definition in sorted(self._routes.items()):
+            if definition.idempotent:
+                out += f"    {json.dumps(endpoint)},\n"
+
+        out += "])\n\n"
+
+        # The route that reports the jobs of each `api_post(background=True)` route, for `useJob` in query.ts.
+        out += "// prettier-ignore\n"
+        out += "export const JOB_ENDPOINTS = {\n"
+        for endpoint, definition in sorted(self._routes.items()):
+            if definition.method == "POST" and JobHandle in definition.responses:
+                out += f"    {json.dumps(endpoint)}: {json.dumps(endpoint + JOB_ENDPOINT_SUFFIX)},\n"
+
+        out += "} as const\n"
         return out
 
+    def _get_columnar_fields(self, definition: RouteDefinition) -> Dict[str, List[str]]:
+        """The columnar fields of every response of the route, with the fields of their items."""
+        fields: Dict[str, List[str]] = {}
+        for response in definition.responses:
+            if not (
+                isinstance(response, type)
+                and issubclass(response, APIResponse)
+                and response.columnar
+            ):
+                continue
+            for name, keys in columnar_fields(response).items():
+                if fields.setdefault(name, list(keys)) != list(keys):
+                    raise TypeError(
+                        f"The columnar responses of {definition.endpoint} have `{name}` fields with different items"
+                    )
+        return fields
+
 
 api_route_type_manager = APIRouteTypeManager()
 
@@ -253,9 +517,14 @@ def generate_request_response_classes(
         response_types = [return_type]
 
     for single_type in response_types:
+        if get_stream_item_type(single_type) is not None:
+            assert (
+                len(response_types) == 1
+            ), "StreamingAPIResponse can't be combined with other response types"
+            continue
         assert isinstance(None, single_type) or issubclass(
             single_type, APIResponse
-        ), "Function must return APIResponse or None"
+        ), "Function must return APIResponse, StreamingAPIResponse or None"
 
     # Build request class based on parameter names
     Request = create_model(
@@ -265,92 +534,651 @@ def generate_request_response_classes(
     return Request, response_types
 
 
-def api_response_as_flask_response(response: APIResponse) -> flask.Response:
-    """Converts an APIResponse into a flask Response."""
-    flask_response = flask.Response(
-        response.model_dump_json(), mimetype="application/json"
+RequestPayload = Union[bytes, typing.Mapping[str, Any]]
+"""A request payload: the raw JSON body of a POST, or the query string of a GET (or any other mapping)."""
+
+
+def _is_list_annotation(annotation: Any) -> bool:
+    inner_type, _ = _strip_optional_type_wrapper(annotation)
+    return typing.get_origin(inner_type) in (list, tuple, set, frozenset)
+
+
+def compile_request_validator(
+    Request: type[BaseModel],
+) -> Callable[[Dict[str, Any], RequestPayload], BaseModel]:
+    """
+    Builds the function that validates a route's URL arguments and payload into its Request model.
+
+    JSON bodies are validated by pydantic straight from the raw bytes, without being parsed into Python objects
+    first. Query strings are validated as they are, unless the model has list fields, which need all of their values
+    (`?id=1&id=2`) rather than the first one.
+    """
+    list_fields = frozenset(
+        name
+        for name, field in Request.model_fields.items()
+        if _is_list_annotation(field.annotation)
     )
-    flask_response.status_code = response.status_code
+    validate_json = Request.model_validate_json
+    validate_python = Request.model_validate
+
+    def validate_request(kwargs: Dict[str, Any], payload: RequestPayload) -> BaseModel:
+        data: typing.Mapping[str, Any]
+        if isinstance(payload, bytes):
+            if not kwargs:
+                return validate_json(payload)
+            data = json.loads(payload)
+        elif list_fields and isinstance(payload, werkzeug.datastructures.MultiDict):
+            data = {
+                key: payload.getlist(key) if key in list_fields else value
+                for key, value in payload.items()
+            }
+        else:
+            data = payload
+
+        if kwargs:
+            data = {**data, **kwargs}
+        return validate_python(data)
+
+    return validate_request
+
+
+def _holds_models(annotation: Any) -> bool:
+    """Whether a value of the annotated type can hold models (or dataclasses), which `model_dump()` turns into dicts."""
+    if isinstance(annotation, type) and (
+        issubclass(annotation, BaseModel) or is_dataclass(annotation)
+    ):
+        return True
+    return any(_holds_models(arg) for arg in typing.get_args(annotation))
+
+
+def compile_view_arguments(
+    Request: type[BaseModel],
+) -> Callable[[BaseModel], Dict[str, Any]]:
+    """
+    Builds the function that turns a validated request into the view function's keyword arguments.
+
+    They are what `request.model_dump()` makes of it, nested models as dicts. Only the fields that can hold models are
+    dumped, the others are passed as they were validated.
+    """
+    model_fields = {
+        name
+        for name, field in Request.model_fields.items()
+        if _holds_models(field.annotation)
+    }
+    if not model_fields:
+        return lambda request: request.__dict__
+
+    def view_arguments(request: BaseModel) -> Dict[str, Any]:
+        return {**request.__dict__, **request.model_dump(include=model_fields)}
+
+    return view_arguments
+
+
+@dataclass(frozen=True)
+class ResolvedRouteTypes:
+    request: Type[BaseModel]
+    responses: typing.List[Union[Type[APIResponse], Type[None]]]
+    stream_item_type: typing.Optional[Type[BaseModel]]
+    response_classes: Tuple[type, ...]
+    """What a view may return, as a tuple for `isinstance`."""
+
+    validate_request: Callable[[Dict[str, Any], RequestPayload], BaseModel]
+    view_arguments: Callable[[BaseModel], Dict[str, Any]]
+    fingerprint: str
+    columnar: bool
+    """Whether any of the responses can be sent column by column, see `APIResponse.columnar`."""
+
+    paginated: bool
+    """Whether the route returns a `PaginatedResponse`, and so takes a `cursor` and a `limit`."""
+
+
+class RouteTypes:
+    """
+    The request model and response types of an API route, resolved from the view function's annotations.
+
+    Routes are normally resolved as they are declared. Routes in the route snapshot (see `src.beckett.snapshot`) were
+    already resolved when it was built, so they are resolved on their first request instead, keeping that work out of
+    the server's startup.
+    """
+
+    def __init__(
+        self,
+        func: Callable,
+        *,
+        endpoint: str,
+        snapshot_fingerprint: typing.Optional[str] = None,
+    ):
+        self._func = func
+        self._endpoint = endpoint
+        self._snapshot_fingerprint = snapshot_fingerprint
+        self._lock = threading.Lock()
+        self._resolved: typing.Optional[ResolvedRouteTypes] = None
+
+    @property
+    def declaration(self) -> str:
+        """See `declaration_fingerprint`."""
+        return declaration_fingerprint(self._func)
+
+    def resolve(self) -> ResolvedRouteTypes:
+        resolved = self._resolved
+        if resolved is not None:
+            return resolved
+
+        with self._lock:
+            if self._resolved is None:
+                self._resolved = self._build()
+            return self._resolved
+
+    def _build(self) -> ResolvedRouteTypes:
+        Request, responses = generate_request_response_classes(self._func)
+        stream_item_type = get_stream_item_type(responses[0])
+        fingerprint = type_fingerprint(Request, *responses)
+
+        paginated = any(is_paginated(response) for response in responses)
+        if paginated and not {"cursor", "limit"} <= Request.model_fields.keys():
+            raise TypeError(
+                f"{self._endpoint} returns a PaginatedResponse, so it must take a `cursor` and a `limit`"
+            )
+
+        if (
+            self._snapshot_fingerprint is not None
+            and self._snapshot_fingerprint != fingerprint
+        ):
+            log.warning(
+                "The route snapshot is out of date, run `python server.py snapshot`",
+                endpoint=self._endpoint,
+            )
+
+        return ResolvedRouteTypes(
+            request=Request,
+            responses=responses,
+            stream_item_type=stream_item_type,
+            response_classes=(
+                (StreamingAPIResponse,)
+                if stream_item_type is not None
+                else tuple(responses)
+            ),
+            validate_request=compile_request_validator(Request),
+            view_arguments=compile_view_arguments(Request),
+            fingerprint=fingerprint,
+            columnar=stream_item_type is None
+            and any(getattr(response, "columnar", False) for response in responses),
+            paginated=paginated,
+        )
+
+
+def json_body_as_flask_response(
+    body: bytes,
+    status_code: int,
+    etag: typing.Optional[str] = None,
+    content_type: str = "application/json",
+) -> flask.Response:
+    """Wraps an already serialized APIResponse in a flask Response."""
+    # A content type instead of a mimetype skips working out a charset, and the status is only parsed once.
+    flask_response = flask.Response(body, status_code, content_type=content_type)
+    if etag is not None:
+        flask_response.set_etag(etag)
 
     return flask_response
 
 
-def generate_api_decorator(
-    func: Callable, *, method: Literal["GET", "POST"], endpoint: str, url: str
-) -> Callable:
-    Request, responses = generate_request_response_classes(func)
+def api_response_json(response: BaseModel) -> bytes:
+    """The same as `response.model_dump_json().encode()`, without decoding pydantic's bytes to encode them again."""
+    return response.__pydantic_serializer__.to_json(response)
 
-    api_route_type_manager.add_route(
-        method=method,
-        request=Request,
-        responses=responses,
-        endpoint=endpoint,
-        code=func.__code__,
-        url=url,
+
+def api_response_as_flask_response(response: APIResponse) -> flask.Response:
+    """Converts an APIResponse into a flask Response."""
+    return json_body_as_flask_response(
+        api_response_json(response), response.status_code
     )
 
-    def handle_api_route(**kwargs):
+
+_CANNED_ERROR_BODIES: Dict[int, bytes] = {
+    response.status_code: api_response_json(response)
+    for response in (Forbidden(), NotFound(), InternalServerError())
+}
+"""
+The errors that never carry a message, serialized once. They are what a flood of bad or unauthorized requests gets, so
+they should cost as little as possible.
+"""
+
+
+def canned_error_response(status_code: Literal[403, 404, 500]) -> flask.Response:
+    """A `Forbidden`, `NotFound` or `InternalServerError` response."""
+    return json_body_as_flask_response(_CANNED_ERROR_BODIES[status_code], status_code)
+
+
+def view_exception_as_flask_response(e: Exception) -> flask.Response:
+    """Converts an exception raised by an API view function into a flask Response."""
+    if isinstance(e, ValidationError):
+        log.exception(e, exc_info=e)
+        return api_response_as_flask_response(
+            PydanticValidationResponse(message=[str(e.errors())])
+        )
+    # For these HTTP exceptions, we send a custom response. As these are expected, there's no need to log the
+    # exceptions themselves (i.e. it's pretty standard to have a handler throw a 404).
+    if isinstance(e, werkzeug.exceptions.Forbidden):
+        return canned_error_response(403)
+    if isinstance(e, werkzeug.exceptions.NotFound):
+        return canned_error_response(404)
+    if isinstance(e, werkzeug.exceptions.BadRequest):
+        # `abort(400, "...")` tells the client what was wrong with its request.
+        return api_response_as_flask_response(BadRequest(message=e.description or ""))
+    if isinstance(e, werkzeug.exceptions.HTTPException):
+        log.exception(e, exc_info=e)
+
+        response = flask.Response(e.get_description())
+        response.status_code = unwrap(e.code)
+
+        return response
+
+    # Everything other exception is unexpected.
+
+    # For our logs.
+    log.exception(e, exc_info=e)
+
+    return canned_error_response(500)
+
+
+def _is_success(status_code: int) -> bool:
+    return 200 <= status_code < 300
+
+
+def generate_api_decorator(
+    func: Callable,
+    *,
+    method: Literal["GET", "POST"],
+    endpoint: str,
+    url: str,
+    cache_policy: typing.Optional[CachePolicy] = None,
+    invalidates: typing.Optional[typing.Sequence[str]] = None,
+    etag: bool = False,
+    max_page_size: typing.Optional[int] = None,
+    sparse: bool = False,
+    idempotent: bool = False,
+    coalesce: bool = False,
+    code: typing.Optional[CodeType] = None,
+) -> Callable:
+    """
+    The Flask view function of an API route that calls `func`. `code` is where the route is declared, for the
+    generated types, when `func` wraps the user's view function.
+    """
+    snapshot_entry = route_snapshot.get_route(endpoint, method)
+    if (
+        snapshot_entry is not None
+        and snapshot_entry.declaration != declaration_fingerprint(func)
+    ):
+        # Nothing the snapshot holds about the route can be trusted, so it's checked as it would be without one.
+        log.warning(
+            "The route snapshot is out of date, resolving the route at startup. Run `python server.py snapshot`",
+            endpoint=endpoint,
+        )
+        snapshot_entry = None
+    if snapshot_entry is not None:
+        route_types = RouteTypes(
+            func, endpoint=endpoint, snapshot_fingerprint=snapshot_entry.fingerprint
+        )
+        is_streaming = snapshot_entry.streaming
+    else:
+        route_types = RouteTypes(func, endpoint=endpoint)
+        is_streaming = route_types.resolve().stream_item_type is not None
+
+    if is_streaming:
+        assert method == "GET", "Only api_get routes can stream their responses"
+        assert (
+            cache_policy is None and not etag
+        ), "Streamed responses can't be cached or sent with an ETag"
+    if cache_policy is not None:
+        assert method == "GET", "Only api_get routes can be cached"
+        response_cache.register(endpoint, cache_policy)
+    if etag:
+        assert method == "GET", "Only api_get routes can send ETags"
+    if max_page_size is None:
+        max_page_size = DEFAULT_MAX_PAGE_SIZE
+    if sparse:
+        assert (
+            method == "GET" and not is_streaming
+        ), "Only api_get routes that don't stream can be sparse"
+        if snapshot_entry is None:
+            assert (
+                FIELDS_PARAMETER not in route_types.resolve().request.model_fields
+            ), f"Sparse routes can't take a `{FIELDS_PARAMETER}` argument, it selects the fields of the response"
+
+    if idempotent:
+        assert method == "POST", "Only api_post routes can be idempotent"
+    if coalesce:
+        assert (
+            method == "GET" and not is_streaming
+        ), "Only api_get routes that don't stream can coalesce requests"
+
+    route_metrics = metrics.route(endpoint)
+
+    def read_flask_payload() -> RequestPayload:
+        if method == "GET":
+            return flask.request.args
+        elif method == "POST":
+            if not flask.request.is_json:
+                raise werkzeug.exceptions.UnsupportedMediaType(
+                    "The request Content-Type was not 'application/json'."
+                )
+            return flask.request.get_data()
+        else:
+            raise TypeError(f"Invalid method: {method}")
+
+    def read_field_selection(
+        payload: RequestPayload,
+    ) -> typing.Optional[FieldSelection]:
+        selector = typing.cast(typing.Mapping[str, Any], payload).get(FIELDS_PARAMETER)
+        if selector is None:
+            return None
+        if not isinstance(selector, str):
+            raise ValueError(
+                f"`{FIELDS_PARAMETER}` must be a comma separated list of fields"
+            )
+        return parse_fields(selector, tuple(route_types.resolve().responses))
+
+    def prepare_request(
+        kwargs: Dict[str, Any],
+        read_payload: Callable[[], RequestPayload],
+        columnar: bool,
+    ) -> Union[
+        flask.Response,
+        Tuple[BaseModel, typing.Optional[str], typing.Optional[FieldSelection]],
+    ]:
+        """
+        Validates the URL arguments and payload.
+
+        Returns the response to send straight away (a validation error, or a cached response) or the validated request,
+        its canonical key and the fields the client selected (for sparse routes) to hand to the view function. The key
+        of a request for a columnar response, or for some fields only, is different, so that each is cached (and
+        versioned) apart.
+        """
         try:
+            payload = read_payload()
             # Hand the request data to the class. This will validate and convert the data to the correct types.
-            if method == "GET":
-                request = Request(**kwargs, **flask.request.args)
-            elif method == "POST":
-                request = Request(**kwargs, **flask.request.json or {})
-            else:
-                raise TypeError(f"Invalid method: {method}")
+            request = route_types.resolve().validate_request(kwargs, payload)
+            selection = read_field_selection(payload) if sparse else None
         except Exception as e:
-            error_msg = "Request payload failed validation"
-            log.exception(error_msg, module=func.__module__, endpoint=endpoint, error=e)
+            # Without the traceback, which only ever points at the validator and is slow to format when a client
+            # sends a lot of bad requests.
+            log.warning(
+                "Request payload failed validation",
+                module=func.__module__,
+                endpoint=endpoint,
+                error=repr(e),
+            )
 
             return api_response_as_flask_response(BadRequest(message=repr(e)))
 
-        # Call the view function, and deal with any errors that result.
-        try:
-            response = func(**request.model_dump())
-            if not any(isinstance(response, resp) for resp in responses):
-                raise Exception("Invalid response generated by server")
-        except ValidationError as e:
-            log.exception(e, exc_info=e)
+        if route_types.resolve().paginated and not (
+            1 <= getattr(request, "limit") <= max_page_size
+        ):
             return api_response_as_flask_response(
-                PydanticValidationResponse(message=[str(e.errors())])
+                BadRequest(message=f"The limit must be between 1 and {max_page_size}")
             )
-        except (
-            werkzeug.exceptions.Forbidden,
-            werkzeug.exceptions.NotFound,
-            werkzeug.exceptions.BadRequest,
-        ) as e:
-            # For these HTTP exceptions, we send a custom response. As these are expected, there's no need to
-            # log the exceptions themselves (i.e. it's pretty standard to have a handler throw a 404).
-            http_exception_to_response_lookup = {
-                400: BadRequest,
-                403: Forbidden,
-                404: NotFound,
-            }
 
-            if e.code in http_exception_to_response_lookup:
-                return api_response_as_flask_response(
-                    http_exception_to_response_lookup[e.code]()
+        request_key = None
+        if cache_policy is not None or etag or coalesce:
+            # The validated request is canonical: defaults are filled in and values are coerced to their types.
+            request_key = request.model_dump_json()
+            if columnar:
+                request_key += COLUMNAR_MIMETYPE
+            if selection is not None:
+                request_key += f"&{FIELDS_PARAMETER}={selection.key}"
+
+        if cache_policy is not None:
+            cached = response_cache.get(endpoint, unwrap(request_key))
+            if cached is not None:
+                if cached.etag is not None and is_not_modified(cached.etag):
+                    return not_modified_response(cached.etag)
+                return json_body_as_flask_response(
+                    cached.body,
+                    cached.status_code,
+                    etag=cached.etag,
+                    content_type=COLUMNAR_MIMETYPE if columnar else "application/json",
+                )
+
+        return request, request_key, selection
+
+    def check_response(response: Any) -> None:
+        if not isinstance(response, route_types.resolve().response_classes):
+            raise Exception("Invalid response generated by server")
+
+    def finish_response(
+        response: Union[APIResponse, StreamingAPIResponse],
+        request_key: typing.Optional[str],
+        columnar: bool,
+        selection: typing.Optional[FieldSelection],
+        cache_generation: typing.Optional[int],
+        conditional: bool = True,
+    ) -> flask.Response:
+        """
+        Serializes the view's response. With `conditional=False` the body is sent even if the client already holds
+        it, for a response shared by several requests that each check their own `If-None-Match`. `cache_generation`
+        is the route's cache generation from before the view ran, see `ResponseCache`.
+        """
+        if isinstance(response, StreamingAPIResponse):
+            return ndjson_response(
+                response.items, unwrap(route_types.resolve().stream_item_type)
+            )
+
+        response_etag = None
+        if etag and _is_success(response.status_code) and response._version is not None:
+            # The view told us which version of the data it returned, so there's no need to serialize it to find out
+            # whether the client already has it.
+            response_etag = version_etag(
+                endpoint, unwrap(request_key), response._version
+            )
+            if conditional and is_not_modified(response_etag):
+                return not_modified_response(response_etag)
+
+        # A columnar request gets the columnar content type whichever response the view returned: a response that
+        # isn't columnar is sent as plain JSON, which the client decodes all the same.
+        if selection is not None:
+            # Some fields only are sent as plain JSON, the columnar decoder expects every field of the items.
+            body = response.__pydantic_serializer__.to_json(
+                response, include=include_mask(type(response), selection)
+            )
+        elif columnar and type(response).columnar:
+            body = encode_columnar(response)
+        else:
+            body = api_response_json(response)
+
+        if _is_success(response.status_code):
+            if etag and response_etag is None:
+                response_etag = body_etag(body)
+            if cache_policy is not None:
+                response_cache.set(
+                    endpoint,
+                    unwrap(request_key),
+                    body,
+                    response.status_code,
+                    unwrap(cache_generation),
+                    etag=response_etag,
+                )
+            if invalidates:
+                response_cache.invalidate(invalidates)
+            if (
+                conditional
+                and response_etag is not None
+                and is_not_modified(response_etag)
+            ):
+                return not_modified_response(response_etag)
+
+        return json_body_as_flask_response(
+            body,
+            response.status_code,
+            etag=response_etag,
+            content_type=COLUMNAR_MIMETYPE if columnar else "application/json",
+        )
+
+    if inspect.iscoroutinefunction(func):
+
+        async def dispatch_api_route_async(
+            kwargs: Dict[str, Any],
+            read_payload: Callable[[], RequestPayload],
+            columnar: bool = False,
+        ) -> flask.Response:
+            """The same as `dispatch_api_route`, for `async def` view functions."""
+            timer = route_metrics.timer()
+            prepared = prepare_request(kwargs, read_payload, columnar)
+            if isinstance(prepared, flask.Response):
+                return timer.finish(prepared, "validation")
+            request, request_key, selection = prepared
+            timer.mark("validation")
+
+            async def respond(conditional: bool = True) -> flask.Response:
+                cache_generation = (
+                    response_cache.generation(endpoint)
+                    if cache_policy is not None
+                    else None
                 )
+                try:
+                    arguments = route_types.resolve().view_arguments(request)
+                    if sparse:
+                        with selecting_fields(selection):
+                            response = await func(**arguments)
+                    else:
+                        response = await func(**arguments)
+                    check_response(response)
+                except Exception as e:
+                    timer.mark("view")
+                    return view_exception_as_flask_response(e)
+                timer.mark("view")
+
+                return finish_response(
+                    response,
+                    request_key,
+                    columnar,
+                    selection,
+                    cache_generation,
+                    conditional,
+                )
+
+            if not coalesce:
+                return timer.finish(await respond(), "serialization")
+
+            async def respond_shared() -> SharedResponse:
+                return SharedResponse.of(await respond(conditional=False))
+
+            shared, waited = await response_flights.do_async(
+                (endpoint, request_key), respond_shared
+            )
+            if waited:
+                timer.mark("view")
+            return timer.finish(shared.as_flask_response(), "serialization")
+
+        async def handle_api_route_async(**kwargs):
+            if not route_types.resolve().columnar:
+                return await dispatch_api_route_async(kwargs, read_flask_payload)
+            response = await dispatch_api_route_async(
+                kwargs, read_flask_payload, accepts_columnar()
+            )
+            response.vary.add("Accept")
+            return response
 
-            raise NotImplementedError(
-                f"_http_exception_to_response doesn't know how to convert exception {e.code}: "
-                f"{e.name} to a response"
+        async def handle_api_route_idempotent_async(**kwargs):
+            return await idempotency_store.respond_async(
+                endpoint, lambda: handle_api_route_async(**kwargs)
             )
-        except werkzeug.exceptions.HTTPException as e:
-            log.exception(e, exc_info=e)
 
-            response = flask.Response(e.get_description())
-            response.status_code = e.code
+        handle_api_route: Callable = (
+            handle_api_route_idempotent_async if idempotent else handle_api_route_async
+        )
+        dispatch: Callable = dispatch_api_route_async
+    else:
+
+        def dispatch_api_route(
+            kwargs: Dict[str, Any],
+            read_payload: Callable[[], RequestPayload],
+            columnar: bool = False,
+        ) -> flask.Response:
+            """
+            Validates the URL arguments and payload, runs the view function and converts the result to a flask
+            Response.
+
+            The payload is read through a callable so that reading it (e.g. parsing the JSON body) fails the same way
+            as validating it. The batch endpoint uses this to run routes with payloads that didn't come from the
+            request. With `columnar` the response is encoded column by column, if it's columnar.
+            """
+            timer = route_metrics.timer()
+            prepared = prepare_request(kwargs, read_payload, columnar)
+            if isinstance(prepared, flask.Response):
+                return timer.finish(prepared, "validation")
+            request, request_key, selection = prepared
+            timer.mark("validation")
+
+            def respond(conditional: bool = True) -> flask.Response:
+                cache_generation = (
+                    response_cache.generation(endpoint)
+                    if cache_policy is not None
+                    else None
+                )
+                try:
+                    arguments = route_types.resolve().view_arguments(request)
+                    if sparse:
+                        with selecting_fields(selection):
+                            response = func(**arguments)
+                    else:
+                        response = func(**arguments)
+                    check_response(response)
+                except Exception as e:
+                    timer.mark("view")
+                    return view_exception_as_flask_response(e)
+                timer.mark("view")
+
+                # Streamed items are serialized as they are sent, after this.
+                return finish_response(
+                    response,
+                    request_key,
+                    columnar,
+                    selection,
+                    cache_generation,
+                    conditional,
+                )
 
+            if not coalesce:
+                return timer.finish(respond(), "serialization")
+
+            # Identical requests that arrive while the view runs wait for it, and share its serialized response.
+            shared, waited = response_flights.do(
+                (endpoint, request_key),
+                lambda: SharedResponse.of(respond(conditional=False)),
+            )
+            if waited:
+                timer.mark("view")
+            return timer.finish(shared.as_flask_response(), "serialization")
+
+        def handle_api_route_sync(**kwargs):
+            if not route_types.resolve().columnar:
+                return dispatch_api_route(kwargs, read_flask_payload)
+            # Only requests made to the route itself are negotiated, batched ones are always sent as JSON.
+            response = dispatch_api_route(
+                kwargs, read_flask_payload, accepts_columnar()
+            )
+            response.vary.add("Accept")
             return response
-        except Exception as e:
-            # Everything other exception is unexpected.
 
-            # For our logs.
-            log.exception(e, exc_info=e)
+        def handle_api_route_idempotent(**kwargs):
+            return idempotency_store.respond(
+                endpoint, lambda: handle_api_route_sync(**kwargs)
+            )
 
-            return api_response_as_flask_response(InternalServerError())
+        handle_api_route = (
+            handle_api_route_idempotent if idempotent else handle_api_route_sync
+        )
+        dispatch = dispatch_api_route
 
-        return api_response_as_flask_response(response)
+    api_route_type_manager.add_route(
+        method=method,
+        types=route_types,
+        is_streaming=is_streaming,
+        endpoint=endpoint,
+        code=code or func.__code__,
+        url=url,
+        dispatch=dispatch,
+        idempotent=idempotent,
+    )
 
     return handle_api_route
@@ -16,3 +16,80 @@ def run():
         port=9000,
         host="0.0.0.0",
     )
+
+
+@app.command(name="types")
+@click.option(
+    "--check",
+    is_flag=True,
+    help="Only report the generated files that are out of date, exit with 1 if there are any.",
+)
+def types(check):
+    """Generate the TypeScript types for the API and the React pages"""
+    from src.beckett.renderer.typescript_react.type_files import generated_type_files
+
+    # Pages write their types as they are declared, so this must be set before the views are imported.
+    generated_type_files.enabled = True
+    generated_type_files.check_only = check
+
+    import src.app  # noqa: F401, registers every route and page
+    from src.beckett.types.types_manager import api_route_type_manager
+
+    api_route_type_manager.write_types()
+
+    if check:
+        for path in generated_type_files.stale:
+            click.echo(f"Out of date: {path}")
+        if generated_type_files.stale:
+            raise SystemExit(1)
+        click.echo("Generated types are up to date")
+
+
+@app.command(name="snapshot")
+@click.option(
+    "--check",
+    is_flag=True,
+    help="Only report whether the snapshot is out of date, exit with 1 if it is.",
+)
+def snapshot(check):
+    """Snapshot the resolved routes, so production servers can start without resolving them"""
+    import time
+
+    from src import settings
+    from src.beckett.snapshot import (
+        is_route_snapshot_fresh,
+        route_snapshot,
+        write_route_snapshot,
+    )
+
+    # The snapshot is built from the views themselves, not from an older snapshot.
+    route_snapshot.enabled = False
+
+    start = time.perf_counter()
+    from src.app import app
+
+    boot_seconds = time.perf_counter() - start
+
+    if check:
+        if not is_route_snapshot_fresh(settings.BECKETT_ROUTE_SNAPSHOT_PATH):
+            click.echo(f"Out of date: {settings.BECKETT_ROUTE_SNAPSHOT_PATH}")
+            raise SystemExit(1)
+        click.echo("The route snapshot is up to date")
+        return
+
+    changed = write_route_snapshot(settings.BECKETT_ROUTE_SNAPSHOT_PATH)
+    click.echo(
+        f"{'Wrote' if changed else 'Unchanged'}: {settings.BECKETT_ROUTE_SNAPSHOT_PATH}"
+    )
+
+    click.echo(f"\n{'blueprint':<30} {'import ms':>10} {'register ms':>12}")
+    for name, timing in app.boot_timings.items():
+        import_ms = (
+            "-"
+            if timing.import_seconds is None
+            else f"{timing.import_seconds * 1000:.1f}"
+        )
+        click.echo(
+            f"{name:<30} {import_ms:>10} {timing.register_seconds * 1000:>12.1f}"
+        )
+    click.echo(f"{'total (app import)':<30} {boot_seconds * 1000:>10.1f}")
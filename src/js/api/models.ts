@@ -0,0 +1,5 @@
+/*
+THIS FILE IS AUTO-GENERATED, DO NOT ALTER MANUALLY.
+
+Please see beckett_framework/src/beckett/types/types_manager.py
+*/
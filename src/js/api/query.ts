@@ -1,6 +1,7 @@
-import {GET_MAP, POST_MAP} from './types'
+import {COLUMNAR_FIELDS, GET_MAP, IDEMPOTENT_ENDPOINTS, JOB_ENDPOINTS, POST_MAP, STREAM_MAP} from './types'
 import {BaseDataContext, jsonReviver, jsonReplacer} from '~/beckett_page'
-import {useMutation, useQuery, useQueryClient} from 'react-query'
+import {csrfToken} from '~/components/csrf'
+import {useInfiniteQuery, useMutation, useQuery, useQueryClient} from 'react-query'
 import {useContext} from 'react'
 
 export class APIError extends Error {
@@ -13,34 +14,97 @@ export class APIError extends Error {
     }
 }
 
-const processRequest = async (request: Request, options?: Partial<RequestInit>) => {
+/*
+Responses that came with an ETag, keyed by URL. The next GET for the same URL sends `If-None-Match` and, if the
+server answers 304, the stored data is reused instead of downloading and parsing the same payload again.
+*/
+const MAX_ETAG_ENTRIES = 200
+const etagCache = new Map<string, {etag: string; data: unknown}>()
+
+const rememberETag = (url: string, etag: string, data: unknown) => {
+    etagCache.delete(url)
+    etagCache.set(url, {etag, data})
+    if (etagCache.size > MAX_ETAG_ENTRIES) {
+        // Maps iterate in insertion order, so the first key is the least recently stored.
+        etagCache.delete(etagCache.keys().next().value!)
+    }
+}
+
+/*
+Responses of routes with `columnar = True` models send their lists of models as one array per field instead of one
+object per item, see `src/beckett/types/columnar.py`. `COLUMNAR_FIELDS` in types.ts lists the fields of those items.
+*/
+const COLUMNAR_MIMETYPE = 'application/vnd.beckett.columnar+json'
+const COLUMNS_KEY = '$columns'
+
+const decodeColumnar = (endpoint: string, data: any) => {
+    const fields = COLUMNAR_FIELDS[endpoint]
+    if (!fields || data === null || typeof data !== 'object') {
+        return data
+    }
+    for (const field in fields) {
+        const value = data[field]
+        if (value === null || typeof value !== 'object' || !(COLUMNS_KEY in value)) {
+            continue
+        }
+        const keys = fields[field]
+        const columns: unknown[][] = value[COLUMNS_KEY]
+        const length = columns.length ? columns[0].length : 0
+        const items = new Array(length)
+        for (let i = 0; i < length; i++) {
+            const item: {[key: string]: unknown} = {}
+            for (let j = 0; j < keys.length; j++) {
+                item[keys[j]] = columns[j][i]
+            }
+            items[i] = item
+        }
+        data[field] = items
+    }
+    return data
+}
+
+const processRequest = async (request: Request, endpoint?: string, options?: Partial<RequestInit>) => {
     const headers = new Headers()
     for (const [key, value] of request.headers.entries()) {
         headers.append(key, value)
     }
+    if (endpoint && endpoint in COLUMNAR_FIELDS) {
+        headers.set('Accept', `${COLUMNAR_MIMETYPE}, application/json;q=0.9`)
+    }
+
+    const cached = request.method === 'GET' ? etagCache.get(request.url) : undefined
+    if (cached) {
+        headers.set('If-None-Match', cached.etag)
+    }
 
     const response = await fetch(request, {
         credentials: 'same-origin',
         headers,
         ...options,
     })
+    if (cached && response.status === 304) {
+        return cached.data
+    }
     if (!response.ok) {
         throw new APIError(response)
     }
     const text = await response.text()
-    const json = JSON.parse(text, jsonReviver)
+    let json = JSON.parse(text, jsonReviver)
+    if (endpoint && response.headers.get('Content-Type') === COLUMNAR_MIMETYPE) {
+        json = decodeColumnar(endpoint, json)
+    }
+
+    const etag = response.headers.get('ETag')
+    if (request.method === 'GET' && etag) {
+        rememberETag(request.url, etag, json)
+    }
 
     return json
 }
 
-export async function get<T extends keyof GET_MAP>(
-    _endpoint: T,
-    path: string,
-    ...args: GET_MAP[T]['request'] extends undefined ? [] : [GET_MAP[T]['request']]
-): Promise<GET_MAP[T]['response']> {
+const buildGetUrl = (path: string, params: {[k: string]: any} | undefined) => {
     const url = new URL(path, window.location.href)
 
-    const params = args[0] as {[k: string]: any} | undefined
     if (params) {
         Object.keys(params).forEach(k => {
             if (typeof params[k] === 'boolean') {
@@ -51,32 +115,199 @@ export async function get<T extends keyof GET_MAP>(
         })
     }
 
+    return url
+}
+
+export async function get<T extends keyof GET_MAP>(
+    endpoint: T,
+    path: string,
+    ...args: GET_MAP[T]['request'] extends undefined ? [] : [GET_MAP[T]['request']]
+): Promise<GET_MAP[T]['response']> {
     return processRequest(
-        new Request(String(url), {
+        new Request(String(buildGetUrl(path, args[0])), {
             method: 'GET',
         }),
+        endpoint,
     )
 }
 
-const csrfToken = document.querySelector('html')?.dataset.csrfToken!
+/*
+Marks the last line of a stream that failed part way through, see `src/beckett/streaming.py`.
+*/
+const STREAM_ERROR_KEY = '$error'
 
-export async function post<T extends keyof POST_MAP>(
+const parseStreamLine = (line: string) => {
+    const item = JSON.parse(line, jsonReviver)
+    if (item !== null && typeof item === 'object' && STREAM_ERROR_KEY in item) {
+        throw new APIError(new Response(null, {status: item[STREAM_ERROR_KEY]}))
+    }
+    return item
+}
+
+/*
+Iterates over the items of a `StreamingAPIResponse` as they arrive, without waiting for (or holding) the whole
+response:
+
+    for await (const row of stream('reports.export', url, {year: 2024})) {
+        ...
+    }
+
+Breaking out of the loop cancels the download.
+*/
+export async function* stream<T extends keyof STREAM_MAP>(
     _endpoint: T,
     path: string,
+    ...args: STREAM_MAP[T]['request'] extends undefined ? [] : [STREAM_MAP[T]['request']]
+): AsyncGenerator<STREAM_MAP[T]['response']> {
+    const response = await fetch(String(buildGetUrl(path, args[0])), {credentials: 'same-origin'})
+    if (!response.ok || !response.body) {
+        throw new APIError(response)
+    }
+
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+    let buffered = ''
+    try {
+        while (true) {
+            const {done, value} = await reader.read()
+            if (done) {
+                break
+            }
+            buffered += value
+            const lines = buffered.split('\n')
+            // The last piece is either empty or a line that hasn't fully arrived yet.
+            buffered = lines.pop()!
+            for (const line of lines) {
+                if (line) {
+                    yield parseStreamLine(line)
+                }
+            }
+        }
+        if (buffered) {
+            yield parseStreamLine(buffered)
+        }
+    } finally {
+        await reader.cancel()
+    }
+}
+
+type PendingGet = {
+    endpoint: keyof GET_MAP
+    path: string
+    args: [] | [unknown]
+    resolve: (data: any) => void
+    reject: (error: unknown) => void
+}
+
+type BatchResponse = {
+    responses: {status_code: number; body: unknown}[]
+}
+
+const MAX_BATCH_SIZE = 50
+let pendingGets: PendingGet[] = []
+
+const flushPendingGets = async (batchUrl: string) => {
+    const pending = pendingGets
+    pendingGets = []
+
+    // A lone request isn't worth the batch envelope, and keeps its ETag / HTTP caching.
+    if (pending.length === 1) {
+        const [{endpoint, path, args, resolve, reject}] = pending
+        get(endpoint, path, ...(args as any)).then(resolve, reject)
+        return
+    }
+
+    for (let start = 0; start < pending.length; start += MAX_BATCH_SIZE) {
+        const chunk = pending.slice(start, start + MAX_BATCH_SIZE)
+        try {
+            const {responses}: BatchResponse = await processRequest(
+                new Request(String(new URL(batchUrl, window.location.href)), {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                        'X-CSRF-Token': csrfToken,
+                    },
+                    body: JSON.stringify(
+                        {entries: chunk.map(({endpoint, args}) => ({endpoint, request: args[0] ?? {}}))},
+                        jsonReplacer,
+                    ),
+                }),
+            )
+            chunk.forEach(({resolve, reject}, i) => {
+                const {status_code, body} = responses[i]
+                if (status_code >= 200 && status_code < 300) {
+                    resolve(body)
+                } else {
+                    reject(new APIError(new Response(null, {status: status_code})))
+                }
+            })
+        } catch (error) {
+            chunk.forEach(({reject}) => reject(error))
+        }
+    }
+}
+
+/*
+Like `get`, but calls made in the same tick are sent to the server as a single batch request.
+*/
+export function batchedGet<T extends keyof GET_MAP>(
+    batchUrl: string,
+    endpoint: T,
+    path: string,
+    ...args: GET_MAP[T]['request'] extends undefined ? [] : [GET_MAP[T]['request']]
+): Promise<GET_MAP[T]['response']> {
+    return new Promise((resolve, reject) => {
+        if (pendingGets.length === 0) {
+            setTimeout(() => flushPendingGets(batchUrl), 0)
+        }
+        pendingGets.push({endpoint, path, args, resolve, reject})
+    })
+}
+
+/*
+Idempotent routes are retried this many times, after a network error or a gateway error, with the same
+`Idempotency-Key`: the server sends the response of the first attempt that went through instead of running it again.
+*/
+const POST_RETRIES = 2
+const POST_RETRY_DELAY_MS = 250
+
+const isRetryable = (e: unknown) =>
+    e instanceof TypeError || (e instanceof APIError && [502, 503, 504].includes(e.status))
+
+export async function post<T extends keyof POST_MAP>(
+    endpoint: T,
+    path: string,
     body: POST_MAP[T]['request'],
 ): Promise<POST_MAP[T]['response']> {
     const url = new URL(path, window.location.href)
+    const headers: {[name: string]: string} = {
+        'Content-Type': 'application/json',
+        'X-CSRF-Token': csrfToken,
+    }
+    const idempotent = IDEMPOTENT_ENDPOINTS.has(endpoint)
+    if (idempotent) {
+        headers['Idempotency-Key'] = crypto.randomUUID()
+    }
 
-    return processRequest(
-        new Request(String(url), {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-                'X-CSRF-Token': csrfToken,
-            },
-            body: JSON.stringify(body, jsonReplacer),
-        }),
-    )
+    const send = () =>
+        processRequest(
+            new Request(String(url), {
+                method: 'POST',
+                headers,
+                body: JSON.stringify(body, jsonReplacer),
+            }),
+            endpoint,
+        )
+
+    for (let attempt = 0; ; attempt++) {
+        try {
+            return await send()
+        } catch (e) {
+            if (!idempotent || attempt >= POST_RETRIES || !isRetryable(e)) {
+                throw e
+            }
+            await new Promise(resolve => setTimeout(resolve, POST_RETRY_DELAY_MS * 2 ** attempt))
+        }
+    }
 }
 
 function generateQueryKey<T extends keyof GET_MAP>(endpoint: T, params: GET_MAP[T]['request']) {
@@ -91,14 +322,14 @@ export function useGet<T extends keyof GET_MAP>(
     endpoint: T,
     ...args: GET_MAP[T]['request'] extends undefined ? [] : [GET_MAP[T]['request']]
 ) {
-    const {urlMap} = useContext(BaseDataContext)
+    const {urlMap, batchUrl} = useContext(BaseDataContext)
     const url = urlMap[endpoint]
 
     const queryKey = generateQueryKey(endpoint, args[0])
 
     const result = useQuery({
         queryKey,
-        queryFn: () => get(endpoint, url, ...args),
+        queryFn: () => batchedGet(batchUrl, endpoint, url, ...args),
         suspense: true,
     })
 
@@ -111,6 +342,93 @@ export function useGet<T extends keyof GET_MAP>(
     }
 }
 
+/*
+The `api_get` routes that return a `PaginatedResponse`, see `src/beckett/types/pagination.py`.
+*/
+type PaginatedEndpoint = {
+    [K in keyof GET_MAP]: GET_MAP[K]['response'] extends {items: unknown[]; next_cursor?: string} ? K : never
+}[keyof GET_MAP]
+
+type PageItem<T extends PaginatedEndpoint> = GET_MAP[T]['response'] extends {items: (infer Item)[]} ? Item : never
+
+/*
+Pages through a paginated route: the first page is fetched straight away, `fetchNextPage()` fetches the one after the
+last, and `items` holds the items of every page fetched so far.
+
+    const {items, hasNextPage, fetchNextPage} = useInfiniteGet('books.books', {author: 'Tamsyn Muir', limit: 20})
+*/
+export function useInfiniteGet<T extends PaginatedEndpoint>(
+    endpoint: T,
+    request: Omit<GET_MAP[T]['request'], 'cursor'>,
+) {
+    const {urlMap} = useContext(BaseDataContext)
+    const url = urlMap[endpoint]
+
+    const result = useInfiniteQuery({
+        queryKey: [...generateQueryKey(endpoint, request as GET_MAP[T]['request']), '$pages'],
+        queryFn: ({pageParam}) =>
+            get(endpoint, url, ...([{...request, cursor: pageParam}] as unknown as [GET_MAP[T]['request']])),
+        getNextPageParam: (page: GET_MAP[T]['response']) =>
+            (page as {next_cursor?: string}).next_cursor ?? undefined,
+        suspense: true,
+    })
+
+    const items: PageItem<T>[] = []
+    for (const page of result.data?.pages ?? []) {
+        items.push(...(page as {items: PageItem<T>[]}).items)
+    }
+
+    return {...result, items}
+}
+
+/*
+A field of a response that can be selected from a sparse route: a top level field, or a nested one as a dotted path.
+*/
+type FieldPath<R> = {[K in keyof R & string]: K | `${K}.${string}`}[keyof R & string]
+
+type FieldHead<F extends string> = F extends `${infer Head}.${string}` ? Head : F
+
+/*
+The response of a sparse route narrowed to the selected fields. Only the top level is narrowed: a nested object keeps
+its type, even though only its selected fields are sent.
+*/
+type SelectedFields<R, F extends string> = R extends unknown ? Pick<R, (FieldHead<F> | 'status_code') & keyof R> : never
+
+/*
+Like `useGet`, but asks a sparse route for some fields of its response only, see `src/beckett/types/fields.py`.
+
+    const {data} = useGetFields('books.book', ['title', 'author.name'], {id})
+*/
+export function useGetFields<T extends keyof GET_MAP, F extends FieldPath<GET_MAP[T]['response']>>(
+    endpoint: T,
+    fields: readonly F[],
+    ...args: GET_MAP[T]['request'] extends undefined ? [] : [GET_MAP[T]['request']]
+) {
+    const {urlMap, batchUrl} = useContext(BaseDataContext)
+    const url = urlMap[endpoint]
+
+    const request = {...args[0], fields: [...fields].sort().join(',')}
+
+    const result = useQuery({
+        queryKey: [...generateQueryKey(endpoint, args[0] as GET_MAP[T]['request']), '$fields', request.fields],
+        queryFn: () => batchedGet(batchUrl, endpoint, url, ...([request] as unknown as [GET_MAP[T]['request']])),
+        suspense: true,
+    })
+
+    return {
+        ...result,
+        data: result.data! as SelectedFields<GET_MAP[T]['response'], F>,
+    }
+}
+
+export function useStream<T extends keyof STREAM_MAP>(endpoint: T) {
+    const {urlMap} = useContext(BaseDataContext)
+    const url = urlMap[endpoint]
+
+    return (...args: STREAM_MAP[T]['request'] extends undefined ? [] : [STREAM_MAP[T]['request']]) =>
+        stream(endpoint, url, ...args)
+}
+
 export function useInvalidate() {
     const queryClient = useQueryClient()
 
@@ -132,3 +450,41 @@ export function usePost<T extends keyof POST_MAP>(endpoint: T) {
 
     return result
 }
+
+/*
+The `api_post(background=True)` routes, and the routes that report their jobs, see `src/beckett/types/jobs.py`.
+*/
+type JobEndpoint = keyof typeof JOB_ENDPOINTS
+type JobStatusEndpoint<T extends JobEndpoint> = (typeof JOB_ENDPOINTS)[T] & keyof GET_MAP
+
+const JOB_POLL_INTERVAL_MS = 1000
+
+/*
+Polls the job a background route started until it's done or failed. Nothing is fetched until there's a job.
+
+    const submit = usePost('reports.export')
+    const {data: job} = useJob('reports.export', submit.data)
+    if (job?.status === 'done') {
+        ...job.result
+    }
+*/
+export function useJob<T extends JobEndpoint>(
+    endpoint: T,
+    handle: {job_id: string} | {status_code: number} | undefined,
+    interval: number = JOB_POLL_INTERVAL_MS,
+) {
+    const {urlMap} = useContext(BaseDataContext)
+    const statusEndpoint = JOB_ENDPOINTS[endpoint] as JobStatusEndpoint<T>
+    const url = urlMap[statusEndpoint]
+    const jobId = handle && 'job_id' in handle ? handle.job_id : undefined
+
+    return useQuery({
+        queryKey: [statusEndpoint, jobId],
+        queryFn: () =>
+            get(statusEndpoint, url, ...([{job_id: jobId}] as unknown as [GET_MAP[JobStatusEndpoint<T>]['request']])),
+        enabled: jobId !== undefined,
+        refetchInterval: (data: {status?: string} | undefined) =>
+            data?.status === 'done' || data?.status === 'failed' ? false : interval,
+        suspense: false,
+    })
+}
@@ -27,8 +27,24 @@ export interface GET_MAP {
     "people.get_people": {request: undefined, response: PeopleGetPeopleResponse}
 }
 
+// prettier-ignore
+export interface STREAM_MAP {
+}
+
 // prettier-ignore
 export interface POST_MAP {
     // beckett_framework/src/views/people.py
     "people.post_example": {request: PeoplePostExampleRequest, response: PeoplePostExampleResponse}
 }
+
+// prettier-ignore
+export const COLUMNAR_FIELDS: {[endpoint: string]: {[field: string]: string[]}} = {
+}
+
+// prettier-ignore
+export const IDEMPOTENT_ENDPOINTS: ReadonlySet<string> = new Set([
+])
+
+// prettier-ignore
+export const JOB_ENDPOINTS = {
+} as const
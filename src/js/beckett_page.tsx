@@ -1,5 +1,5 @@
 import React from 'react'
-import {createRoot} from 'react-dom/client'
+import {createRoot, hydrateRoot} from 'react-dom/client'
 import {QueryClient, QueryClientProvider} from 'react-query'
 import {Loading} from './components/loading'
 
@@ -30,12 +30,14 @@ const queryClient = new QueryClient({
     },
 })
 
-interface BaseData {
+export interface BaseData {
     urlMap: {[endpoint: string]: string}
+    batchUrl: string
 }
 
 export const BaseDataContext = React.createContext<BaseData>({
     urlMap: {},
+    batchUrl: '/__beckett/batch',
 })
 
 class ErrorBoundary extends React.Component<{}, {error?: Error; componentStack?: string}> {
@@ -73,18 +75,59 @@ class ErrorBoundary extends React.Component<{}, {error?: Error; componentStack?:
     }
 }
 
-export function renderReactPage<P>(Component: React.FunctionComponent<P>, jsonProps: string, baseData: BaseData) {
-    const props = JSON.parse(jsonProps, jsonReviver)
+/*
+Replaces the props of a streamed page whose view function failed after the page's head was sent, along with the status
+code it would have had, see `@beckett.page(stream=True)`.
+*/
+const PAGE_ERROR_KEY = '$error'
 
-    return createRoot(document.getElementById('render-react-root')!).render(
+const PageError = ({status}: {status: number}) => (
+    <>
+        <h1>Something went wrong.</h1>
+        <pre>{`The server failed to render this page (${status}).`}</pre>
+    </>
+)
+
+const readJsonScript = (id: string) => JSON.parse(document.getElementById(id)!.textContent!, jsonReviver)
+
+interface PageRootProps<P> {
+    Component: React.FunctionComponent<P>
+    props: P
+    baseData: BaseData
+    queryClient: QueryClient
+}
+
+// Everything a page is rendered in, in the browser and by the server side rendering worker (ssr_worker.tsx) alike:
+// hydration only works if both render the same tree.
+export function PageRoot<P>({Component, props, baseData, queryClient}: PageRootProps<P>) {
+    return (
         <BaseDataContext.Provider value={baseData}>
             <QueryClientProvider client={queryClient}>
                 <ErrorBoundary>
                     <React.Suspense fallback={<Loading />}>
-                        <Component {...props} />
+                        <Component {...(props as P & JSX.IntrinsicAttributes)} />
                     </React.Suspense>
                 </ErrorBoundary>
             </QueryClientProvider>
-        </BaseDataContext.Provider>,
+        </BaseDataContext.Provider>
     )
 }
+
+export function renderReactPage<P>(Component: React.FunctionComponent<P>) {
+    // Props and base data are inlined by beckett_page.jinja2 as JSON documents, so they are only parsed once here.
+    const props = readJsonScript('beckett-page-props')
+    const baseData: BaseData = readJsonScript('beckett-base-data')
+
+    const root = document.getElementById('render-react-root')!
+    if (props !== null && typeof props === 'object' && PAGE_ERROR_KEY in props) {
+        return createRoot(root).render(<PageError status={props[PAGE_ERROR_KEY]} />)
+    }
+
+    const page = <PageRoot Component={Component} props={props} baseData={baseData} queryClient={queryClient} />
+
+    // Pages rendered with `@beckett.page(ssr=True)` already hold the server rendered HTML, unless rendering it failed.
+    if (root.dataset.ssr !== undefined) {
+        return hydrateRoot(root, page)
+    }
+    return createRoot(root).render(page)
+}
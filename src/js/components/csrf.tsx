@@ -1 +1,2 @@
-export const csrfToken = document.querySelector('html')?.dataset.csrfToken!
+// There's no document when a page is rendered on the server, and no request is sent there either.
+export const csrfToken = typeof document === 'undefined' ? '' : document.querySelector('html')?.dataset.csrfToken!
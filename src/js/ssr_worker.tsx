@@ -0,0 +1,53 @@
+// Renders pages to HTML for `@beckett.page(ssr=True)`. It's started by src/beckett/ssr.py as a long-lived process:
+// every line on stdin is a JSON request, answered with one JSON line on stdout.
+//
+//   {"id": 1, "type": "render", "entrypoint": "src/js/template/people/page.tsx", "props": {...}, "baseData": {...}}
+//   -> {"id": 1, "html": "<div>...</div>"} or {"id": 1, "error": "..."}
+//
+//   {"id": 2, "type": "ping"} -> {"id": 2, "ok": true}
+import path from 'path'
+import React from 'react'
+import {renderToString} from 'react-dom/server'
+import {QueryClient} from 'react-query'
+import {createInterface} from 'readline'
+import {pathToFileURL} from 'url'
+import {jsonReviver, PageRoot} from './beckett_page'
+
+// stdout is the response channel, anything the pages log goes to stderr instead.
+console.log = console.info = console.debug = (...args: unknown[]) => console.error(...args)
+
+// The pages are built next to this worker, keeping their path under src/js.
+const buildDir = path.dirname(process.argv[1])
+
+const loadPage = async (entrypoint: string): Promise<React.FunctionComponent<unknown>> => {
+    const builtFile = path.join(buildDir, path.relative('src/js', entrypoint).replace(/\.tsx?$/, '.mjs'))
+    const module = await import(pathToFileURL(builtFile).href)
+    return module.default
+}
+
+const respond = (response: object) => process.stdout.write(JSON.stringify(response) + '\n')
+
+const handle = async (request: any) => {
+    if (request.type === 'ping') {
+        return {id: request.id, ok: true}
+    }
+    try {
+        const Page = await loadPage(request.entrypoint)
+        const html = renderToString(
+            <PageRoot
+                Component={Page}
+                props={request.props}
+                baseData={request.baseData}
+                // A client per render, so no query data leaks from one request into another.
+                queryClient={new QueryClient()}
+            />,
+        )
+        return {id: request.id, html}
+    } catch (e) {
+        return {id: request.id, error: e instanceof Error ? e.stack || e.message : String(e)}
+    }
+}
+
+const lines = createInterface({input: process.stdin})
+lines.on('line', async line => respond(await handle(JSON.parse(line, jsonReviver))))
+lines.on('close', () => process.exit(0))
@@ -6,3 +6,55 @@ ENVIRONMENT = environ.get("ENVIRONMENT", "development")
 in_dev_environment = ENVIRONMENT == "development"
 
 BECKETT_METAFILE_PATH = abspath(join(dirname(__file__), "metafile.json"))
+
+BECKETT_TYPES_CACHE_PATH = abspath(
+    join(dirname(__file__), "..", ".beckett-cache", "types.json")
+)
+
+BECKETT_ROUTE_SNAPSHOT_PATH = abspath(join(dirname(__file__), "route_snapshot.json"))
+
+BECKETT_METRICS_ENABLED = environ.get("BECKETT_METRICS_ENABLED", "1") == "1"
+
+BECKETT_METRICS_TOKEN = environ.get("BECKETT_METRICS_TOKEN")
+
+BECKETT_COMPRESSION_ENABLED = environ.get("BECKETT_COMPRESSION_ENABLED", "1") == "1"
+
+BECKETT_COMPRESSION_MIN_SIZE = int(environ.get("BECKETT_COMPRESSION_MIN_SIZE", 1024))
+
+BECKETT_COMPRESSION_LEVEL = int(environ.get("BECKETT_COMPRESSION_LEVEL", 6))
+
+BECKETT_COMPRESSION_STREAM_SIZE = int(
+    environ.get("BECKETT_COMPRESSION_STREAM_SIZE", 1024 * 1024)
+)
+
+BECKETT_IDEMPOTENCY_TTL = float(environ.get("BECKETT_IDEMPOTENCY_TTL", 24 * 60 * 60))
+
+BECKETT_IDEMPOTENCY_MAX_ENTRIES = int(
+    environ.get("BECKETT_IDEMPOTENCY_MAX_ENTRIES", 10000)
+)
+
+BECKETT_JOB_WORKERS = int(environ.get("BECKETT_JOB_WORKERS", 4))
+
+BECKETT_JOB_QUEUE_SIZE = int(environ.get("BECKETT_JOB_QUEUE_SIZE", 32))
+
+BECKETT_JOB_RESULT_TTL = float(environ.get("BECKETT_JOB_RESULT_TTL", 60 * 60))
+
+BECKETT_JOB_MAX_RESULTS = int(environ.get("BECKETT_JOB_MAX_RESULTS", 1000))
+
+BECKETT_SSR_NODE = environ.get("BECKETT_SSR_NODE", "node")
+
+BECKETT_SSR_WORKER_PATH = abspath(join(dirname(__file__), "ssr", "ssr_worker.mjs"))
+
+BECKETT_SSR_BUILD_STAMP_PATH = abspath(join(dirname(__file__), "ssr", "build-stamp"))
+
+BECKETT_SSR_WORKERS = int(environ.get("BECKETT_SSR_WORKERS", 2))
+
+BECKETT_SSR_TIMEOUT = float(environ.get("BECKETT_SSR_TIMEOUT", 0.5))
+
+BECKETT_SSR_CACHE_SIZE = int(environ.get("BECKETT_SSR_CACHE_SIZE", 256))
+
+BECKETT_SSR_HEALTH_CHECK_INTERVAL = float(
+    environ.get("BECKETT_SSR_HEALTH_CHECK_INTERVAL", 30)
+)
+
+BECKETT_PAGE_SHELL_ENABLED = environ.get("BECKETT_PAGE_SHELL_ENABLED", "0") == "1"